@@ -0,0 +1,882 @@
+'''
+Acceso a los archivos de datos de la cartera.
+
+Los CSV (basedatosCY.csv, movimientosCY.csv, accionesCY.csv) y efectivoCY.txt son la foto canonica de
+los datos.
+Cada cambio se añade a un diario (diarioCY.jsonl) en lugar de reescribir la foto, asi que guardar
+cuesta lo mismo con 100 registros que con un millon. Cuando el diario crece lo suficiente se
+vuelca sobre la foto de forma atomica (archivo temporal + rename). Al arrancar se lee la foto y
+se reaplica el diario encima.
+
+Los datos se sirven desde memoria y solo se vuelven a leer si la foto cambia en disco.
+
+Las acciones salen del libro de lotes (lotes.py): movimientosCY.csv guarda cada compra y venta, y
+accionesCY.csv queda como foto del agregado por simbolo (cantidad, coste medio de lo que queda y notas).
+Si falta movimientosCY.csv (datos de antes del libro), cada fila de accionesCY.csv pasa a ser una compra.
+
+Como alternativa, RepositorioSQLite guarda lo mismo en una base de datos SQLite con indices,
+para historicos muy grandes. Ambos repositorios tienen la misma interfaz.
+'''
+
+import csv
+import json
+import os
+import sqlite3
+import stat
+import tempfile
+from contextlib import contextmanager
+from datetime import date
+from operator import itemgetter
+
+from lotes import MOVIMIENTO_FIELDS, Libro, convertir_movimiento, lotes_iniciales, movimiento_de_accion
+
+FIELDNAMES = ["id", "d", "m", "a", "cantidad", "trans"]
+ACCIONES_FIELDS = ["simbolo", "cantidad", "precio_compra", "notas"]
+
+# El diario se compacta cuando supera este tamaño o la mitad de la foto, lo que sea mayor.
+# Asi el coste de compactar se reparte entre muchas operaciones.
+UMBRAL_DIARIO = 1024 * 1024
+FRACCION_DIARIO = 0.5
+
+RECARGO_SIN_TRANSACCION = 1.01  # Las aportaciones con trans == 'n' cuentan un 1% mas
+
+
+def convertir_registro(fila):
+    return {
+        'id': int(fila['id']),
+        'd': fila['d'],
+        'm': fila['m'],
+        'a': fila['a'],
+        'cantidad': float(fila['cantidad']),
+        'trans': fila['trans'],
+    }
+
+
+def convertir_accion(fila):
+    return {
+        'simbolo': fila['simbolo'],
+        'cantidad': float(fila['cantidad']),
+        'precio_compra': float(fila['precio_compra']),
+        'notas': fila.get('notas') or '',
+    }
+
+
+def fecha_registro(registro):
+    # Tupla comparable (a, m, d); los dias y meses se guardan con dos cifras
+    return (registro['a'], registro['m'], registro['d'])
+
+
+def firma_archivo(ruta):
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return (estado.st_mtime_ns, estado.st_size)
+
+
+def fecha_archivo(ruta):
+    try:
+        return date.fromtimestamp(os.path.getmtime(ruta))
+    except OSError:
+        return date.today()
+
+
+def escribir_atomico(ruta, escribir, newline=None):
+    # Escribe en un temporal del mismo directorio y lo renombra: o queda el archivo viejo o el nuevo
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    fd, temporal = tempfile.mkstemp(prefix='.tmp_', dir=directorio)
+    try:
+        with os.fdopen(fd, 'w', newline=newline, encoding='utf-8') as f:
+            escribir(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if not os.path.exists(ruta):
+            open(ruta, 'a').close()  # Para que el archivo nuevo tenga los permisos normales
+        os.chmod(temporal, stat.S_IMODE(os.stat(ruta).st_mode))
+        os.replace(temporal, ruta)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+
+def leer_csv(ruta, convertir):
+    try:
+        with open(ruta, mode='r', newline='', encoding='utf-8') as file:
+            filas = list(csv.DictReader(file))
+    except FileNotFoundError:
+        return []
+    if filas and convertir is convertir_registro and 'id' not in filas[0]:
+        for i, fila in enumerate(filas, 1):
+            fila['id'] = str(i)
+    return [convertir(f) for f in filas]
+
+
+def escribir_csv(ruta, campos, filas):
+    # csv.writer con itemgetter en vez de DictWriter: con un millon de filas es varias veces mas rapido
+    def escribir(file):
+        writer = csv.writer(file)
+        writer.writerow(campos)
+        writer.writerows(map(itemgetter(*campos), filas))
+    escribir_atomico(ruta, escribir, newline='')
+
+
+def termina_en_linea(ruta):
+    # False si el archivo acaba a media linea (el programa se cerro escribiendo); un archivo vacio o
+    # que no existe cuenta como terminado
+    try:
+        with open(ruta, 'rb') as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return True
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+    except FileNotFoundError:
+        return True
+
+
+class Diario:
+    # Cambios pendientes de volcar a la foto, una entrada JSON por linea. Mientras se escribe una foto
+    # desde otro hilo, lo anotado antes de empezar queda en 'anterior' y lo nuevo sigue en el diario.
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.anterior = ruta + '.anterior'
+        self._pendientes = []
+        self._profundidad = 0
+        self.tamano = os.path.getsize(ruta) if os.path.exists(ruta) else 0
+        self.volcados = 0
+        # Si el programa se cerro a media linea, lo siguiente se escribe en una linea nueva para no perderlo
+        self._cortado = not termina_en_linea(ruta)
+
+    def en_lote(self):
+        return self._profundidad > 0
+
+    def entradas(self):
+        # Primero lo apartado por una compactacion que no llego a terminar
+        for ruta in (self.anterior, self.ruta):
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    for linea in f:
+                        try:
+                            yield json.loads(linea)
+                        except ValueError:
+                            # Linea a medio escribir si el programa se cerro de golpe
+                            print(f"Entrada de diario ilegible descartada: {linea[:60]!r}")
+            except FileNotFoundError:
+                continue
+
+    def anotar(self, entrada):
+        self._pendientes.append(json.dumps(entrada, ensure_ascii=False) + '\n')
+        if not self.en_lote():
+            self.volcar()
+
+    @contextmanager
+    def lote(self):
+        # Las entradas de un lote se escriben juntas con un solo fsync
+        self._profundidad += 1
+        try:
+            yield
+        finally:
+            self._profundidad -= 1
+            if not self.en_lote():
+                self.volcar()
+
+    def volcar(self):
+        if not self._pendientes:
+            return
+        texto = ''.join(self._pendientes)
+        self._pendientes = []
+        if self._cortado:
+            texto = '\n' + texto
+            self._cortado = False
+        with open(self.ruta, 'a', encoding='utf-8') as f:
+            f.write(texto)
+            f.flush()
+            os.fsync(f.fileno())
+        self.tamano += len(texto.encode('utf-8'))
+        self.volcados += 1
+
+    def apartar(self):
+        # Lo anotado hasta ahora pasa a 'anterior' (que se borra cuando la foto nueva ya esta escrita)
+        # y el diario vuelve a empezar
+        self.volcar()
+        if os.path.exists(self.ruta):
+            if os.path.exists(self.anterior):
+                cortado = not termina_en_linea(self.anterior)
+                with open(self.ruta, 'r', encoding='utf-8') as origen, open(self.anterior, 'a', encoding='utf-8') as destino:
+                    destino.write(('\n' if cortado else '') + origen.read())
+                    destino.flush()
+                    os.fsync(destino.fileno())
+                os.remove(self.ruta)
+            else:
+                os.replace(self.ruta, self.anterior)
+        self.tamano = 0
+        self._cortado = False
+
+    def descartar_anterior(self):
+        if os.path.exists(self.anterior):
+            os.remove(self.anterior)
+
+
+class RepositorioCartera:
+    def __init__(self, db_file, acciones_file, efectivo_file, diario_file=None, movimientos_file=None, metodo='fifo'):
+        self.db_file = db_file
+        self.acciones_file = acciones_file
+        self.efectivo_file = efectivo_file
+        self.movimientos_file = movimientos_file or os.path.join(os.path.dirname(db_file), "movimientosCY.csv")
+        self.diario = Diario(diario_file or os.path.join(os.path.dirname(db_file), "diarioCY.jsonl"))
+        self.metodo = metodo
+        self._por_id = {}  # id -> registro, en el orden del archivo
+        self._lista = None  # Lista de registros ya construida para lecturas repetidas
+        self._por_dia = (None, {})  # (lista de registros, {(a, m, d): aportado ese dia}) para total_invertido
+        self._max_id = 0
+        self._libro = Libro(metodo=metodo)
+        self._notas = {}  # simbolo -> notas
+        self._acciones = None  # Agregado del libro ya construido; se descarta cuando cambian los lotes o las notas
+        self._efectivo = None
+        self._firmas = False  # Firmas de la foto la ultima vez que se leyo
+        self._compactando = False  # Se esta escribiendo la foto desde otro hilo: los cambios en disco son nuestros
+        self.lecturas = 0
+
+    def inicializar(self):
+        if not os.path.exists(self.db_file):
+            escribir_csv(self.db_file, FIELDNAMES, [])
+        if not os.path.exists(self.acciones_file):
+            escribir_csv(self.acciones_file, ACCIONES_FIELDS, [])
+        if not os.path.exists(self.movimientos_file):
+            # Paso unico al libro de lotes: las filas de accionesCY.csv, como compras en la fecha del archivo
+            acciones = leer_csv(self.acciones_file, convertir_accion)
+            escribir_csv(self.movimientos_file, MOVIMIENTO_FIELDS, lotes_iniciales(acciones, fecha_archivo(self.acciones_file)))
+
+    # Carga
+    def _firmas_foto(self):
+        return (firma_archivo(self.db_file), firma_archivo(self.acciones_file), firma_archivo(self.efectivo_file),
+                firma_archivo(self.movimientos_file))
+
+    def _comprobar(self):
+        if not self._compactando and self._firmas_foto() != self._firmas:
+            self._cargar()
+
+    def _cargar(self):
+        self.lecturas += 1
+        self._por_id = {r['id']: r for r in leer_csv(self.db_file, convertir_registro)}
+        acciones = leer_csv(self.acciones_file, convertir_accion)
+        self._notas = {a['simbolo']: a['notas'] for a in acciones if a['notas']}
+        if os.path.exists(self.movimientos_file):
+            movimientos = leer_csv(self.movimientos_file, convertir_movimiento)
+        else:
+            movimientos = lotes_iniciales(acciones, fecha_archivo(self.acciones_file))
+        self._libro = Libro(movimientos, self.metodo)
+        try:
+            with open(self.efectivo_file, 'r') as f:
+                self._efectivo = float(f.read())
+        except (FileNotFoundError, ValueError):
+            self._efectivo = None
+        self._max_id = max(self._por_id, default=0)
+        for entrada in self.diario.entradas():
+            try:
+                self._aplicar(entrada)
+            except ValueError as e:
+                print(f"Entrada de diario descartada: {str(e)}")
+        self._lista = None
+        self._acciones = None
+        self._firmas = self._firmas_foto()
+
+    def _aplicar(self, entrada):
+        # Aplicar dos veces la misma entrada da el mismo resultado, por si se corta una compactacion
+        tipo = entrada['tipo']
+        if tipo == 'registro':
+            registro = convertir_registro(entrada['datos'])
+            self._por_id[registro['id']] = registro
+            self._max_id = max(self._max_id, registro['id'])
+        elif tipo == 'registros':
+            # Lote de una importacion: una fila por registro, en el orden de FIELDNAMES, ya con sus tipos
+            por_id = self._por_id
+            for id_registro, d, m, a, cantidad, trans in entrada['filas']:
+                por_id[id_registro] = {'id': id_registro, 'd': d, 'm': m, 'a': a, 'cantidad': cantidad, 'trans': trans}
+            self._max_id = max(self._max_id, max((f[0] for f in entrada['filas']), default=0))
+        elif tipo == 'baja_registro':
+            self._por_id.pop(entrada['id'], None)
+        elif tipo == 'movimiento':
+            # Lanza ValueError si una venta se queda sin acciones; entonces no se anota nada
+            movimiento = convertir_movimiento(entrada['datos'])
+            if self._libro.movimiento(movimiento['id']) is None:
+                self._libro.agregar(movimiento)
+            else:
+                self._libro.modificar(movimiento)
+        elif tipo == 'baja_movimiento':
+            self._libro.eliminar(entrada['id'])
+        elif tipo == 'renombrar':
+            self._libro.renombrar(entrada['de'], entrada['a'])
+            if entrada['de'] in self._notas:
+                self._notas.setdefault(entrada['a'], self._notas.pop(entrada['de']))
+        elif tipo == 'baja_simbolo':
+            self._libro.eliminar_simbolo(entrada['simbolo'])
+            self._notas.pop(entrada['simbolo'], None)
+        elif tipo == 'notas':
+            self._notas[entrada['simbolo']] = entrada['notas']
+        elif tipo == 'acciones':
+            # Diarios de antes del libro de lotes: la lista entera de acciones
+            acciones = [convertir_accion(a) for a in entrada['datos']]
+            self._notas = {a['simbolo']: a['notas'] for a in acciones if a['notas']}
+            self._libro = Libro(lotes_iniciales(acciones, fecha_archivo(self.acciones_file)), self.metodo)
+        elif tipo == 'efectivo':
+            self._efectivo = float(entrada['valor'])
+        if tipo in ('registro', 'registros', 'baja_registro'):
+            self._lista = None
+        else:
+            self._acciones = None
+
+    def _anotar(self, entrada):
+        self._aplicar(entrada)
+        self.diario.anotar(entrada)
+        if not self.diario.en_lote():
+            self._quizas_compactar()
+
+    @contextmanager
+    def lote(self):
+        with self.diario.lote():
+            yield
+        self._quizas_compactar()
+
+    # Compactacion
+    def _quizas_compactar(self):
+        foto = sum(f[1] for f in self._firmas or () if f)
+        if self.diario.tamano > max(UMBRAL_DIARIO, foto * FRACCION_DIARIO):
+            self.compactar()
+
+    def compactar(self):
+        escribir = self.preparar_compactacion()
+        if escribir is not None:
+            escribir()
+
+    def preparar_compactacion(self):
+        # Saca la foto de lo que hay en memoria y devuelve la funcion que la escribe, que puede ir en otro
+        # hilo: los registros y movimientos no se modifican, se sustituyen, asi que las listas tomadas aqui
+        # no cambian aunque se sigan anotando cambios. None si no hay nada que volcar o ya se esta volcando.
+        self._comprobar()
+        if self._compactando or (self.diario.tamano == 0 and not os.path.exists(self.diario.anterior)):
+            return None
+        registros = self.registros()
+        movimientos = self._libro.movimientos()
+        acciones = self.foto_acciones()
+        efectivo = self._efectivo
+        self.diario.apartar()
+        self._compactando = True
+
+        def escribir():
+            try:
+                escribir_csv(self.db_file, FIELDNAMES, registros)
+                escribir_csv(self.movimientos_file, MOVIMIENTO_FIELDS, movimientos)
+                escribir_csv(self.acciones_file, ACCIONES_FIELDS, acciones)
+                if efectivo is not None:
+                    escribir_atomico(self.efectivo_file, lambda f: f.write(str(efectivo)))
+                # Si se corta aqui, lo apartado se reaplica sobre la foto nueva sin cambiar nada
+                self.diario.descartar_anterior()
+                self._firmas = self._firmas_foto()
+            finally:
+                self._compactando = False
+
+        return escribir
+
+    # Registros de aportaciones
+    def registros(self):
+        self._comprobar()
+        if self._lista is None:
+            self._lista = list(self._por_id.values())
+        return self._lista
+
+    def registro(self, id_registro):
+        self._comprobar()
+        return self._por_id.get(int(id_registro))
+
+    def proximo_id(self):
+        self._comprobar()
+        return self._max_id + 1
+
+    def agregar_registro(self, datos):
+        registro = convertir_registro(dict(datos, id=self.proximo_id()))
+        self._anotar({'tipo': 'registro', 'datos': registro})
+        return self._por_id[registro['id']]
+
+    def modificar_registro(self, id_registro, datos):
+        actual = self.registro(id_registro)
+        nuevo = convertir_registro(dict(actual, **datos, id=actual['id']))
+        self._anotar({'tipo': 'registro', 'datos': nuevo})
+        return self._por_id[nuevo['id']]
+
+    def eliminar_registro(self, id_registro):
+        # El maximo id no baja al borrar para no reutilizar ids
+        self._comprobar()
+        self._anotar({'tipo': 'baja_registro', 'id': int(id_registro)})
+
+    def ids_existentes(self, ids):
+        self._comprobar()
+        return {i for i in ids if i in self._por_id}
+
+    def agregar_registros(self, registros):
+        # Registros ya validados y con id (importaciones); todo el lote va en una entrada del diario.
+        # No se compacta lote a lote: quien importa llama a compactar() al terminar.
+        filas = [[r['id'], r['d'], r['m'], r['a'], float(r['cantidad']), r['trans']] for r in registros]
+        if filas:
+            self._comprobar()
+            entrada = {'tipo': 'registros', 'filas': filas}
+            self._aplicar(entrada)
+            self.diario.anotar(entrada)
+
+    def total_invertido(self, desde=None, hasta=None):
+        # desde y hasta son tuplas (a, m, d) de texto, ambas incluidas. Los registros se suman por dia una
+        # vez por version de los datos; cada consulta solo recorre los dias.
+        registros = self.registros()
+        if self._por_dia[0] is not registros:
+            por_dia = {}
+            for r in registros:
+                fecha = fecha_registro(r)
+                cantidad = r['cantidad'] if r['trans'] == 's' else RECARGO_SIN_TRANSACCION * r['cantidad']
+                por_dia[fecha] = por_dia.get(fecha, 0.0) + cantidad
+            self._por_dia = (registros, por_dia)
+        return sum(total for fecha, total in self._por_dia[1].items()
+                   if not ((desde and fecha < desde) or (hasta and fecha > hasta)))
+
+    # Libro de lotes: cada compra y venta es un movimiento con su fecha
+    def movimientos(self, simbolo=None):
+        self._comprobar()
+        return self._libro.movimientos(simbolo)
+
+    def movimiento(self, id_movimiento):
+        self._comprobar()
+        return self._libro.movimiento(int(id_movimiento))
+
+    def proximo_id_movimiento(self):
+        self._comprobar()
+        return self._libro.max_id + 1
+
+    def agregar_movimiento(self, datos):
+        movimiento = convertir_movimiento(dict(datos, id=self.proximo_id_movimiento()))
+        self._anotar({'tipo': 'movimiento', 'datos': movimiento})
+        return movimiento
+
+    def agregar_movimientos(self, movimientos, notas=None):
+        # Movimientos ya validados de una importacion, con notas {simbolo: notas}; todo en una escritura
+        # del diario. Como agregar_registros, no se compacta: quien importa llama a compactar() al terminar.
+        self._comprobar()
+        with self.diario.lote():
+            for datos in movimientos:
+                self.agregar_movimiento(datos)
+            for simbolo, texto in (notas or {}).items():
+                self._anotar({'tipo': 'notas', 'simbolo': simbolo, 'notas': texto})
+
+    def modificar_movimiento(self, id_movimiento, datos):
+        actual = self.movimiento(id_movimiento)
+        nuevo = convertir_movimiento(dict(actual, **datos, id=actual['id']))
+        self._anotar({'tipo': 'movimiento', 'datos': nuevo})
+        return nuevo
+
+    def eliminar_movimiento(self, id_movimiento):
+        # Lanza ValueError si al quitarlo alguna venta se queda sin acciones
+        self._comprobar()
+        self._anotar({'tipo': 'baja_movimiento', 'id': int(id_movimiento)})
+
+    def posicion(self, simbolo):
+        # Cantidad, coste y beneficio realizado de un simbolo, sin recorrer sus lotes
+        self._comprobar()
+        return self._libro.agregado(simbolo)
+
+    def realizado(self):
+        self._comprobar()
+        return self._libro.realizado()
+
+    # Acciones: el agregado del libro, una fila por simbolo con acciones
+    def acciones(self):
+        self._comprobar()
+        if self._acciones is None:
+            self._acciones = self._libro.acciones(self._notas)
+        return self._acciones
+
+    def accion(self, simbolo):
+        agregado = self.posicion(simbolo)
+        if not agregado or not agregado['cantidad']:
+            return None
+        return {'simbolo': simbolo, 'cantidad': agregado['cantidad'], 'precio_compra': agregado['precio_compra'],
+                'notas': self._notas.get(simbolo, '')}
+
+    def foto_acciones(self):
+        # Lo que se escribe en accionesCY.csv: el agregado, y las notas de los simbolos ya vendidos del todo
+        acciones = self.acciones()
+        con_acciones = {a['simbolo'] for a in acciones}
+        return acciones + [{'simbolo': simbolo, 'cantidad': 0.0, 'precio_compra': 0.0, 'notas': notas}
+                           for simbolo, notas in self._notas.items() if simbolo not in con_acciones]
+
+    def agregar_accion(self, datos):
+        # Una compra; sin fecha (d, m, a) se toma la de hoy
+        with self.lote():
+            self.agregar_movimiento(movimiento_de_accion(datos, self.proximo_id_movimiento()))
+            if datos.get('notas'):
+                self.guardar_notas(datos['simbolo'], datos['notas'])
+
+    def guardar_notas(self, simbolo, notas):
+        self._comprobar()
+        self._anotar({'tipo': 'notas', 'simbolo': simbolo, 'notas': notas})
+
+    def modificar_accion(self, simbolo, datos):
+        # Solo simbolo y notas: cantidades y precios se cambian con los movimientos
+        nuevo = datos.get('simbolo') or simbolo
+        with self.lote():
+            if nuevo != simbolo:
+                self._comprobar()
+                self._anotar({'tipo': 'renombrar', 'de': simbolo, 'a': nuevo})
+            if 'notas' in datos:
+                self.guardar_notas(nuevo, datos['notas'] or '')
+
+    def eliminar_accion(self, simbolo):
+        # Borra todos los lotes del simbolo
+        self._comprobar()
+        self._anotar({'tipo': 'baja_simbolo', 'simbolo': simbolo})
+
+    # Efectivo
+    def cargar_efectivo(self):
+        self._comprobar()
+        if self._efectivo is None:
+            # Si el archivo no existe o hay error en el formato, inicializar a 0
+            self._efectivo = 0.0
+            escribir_atomico(self.efectivo_file, lambda f: f.write(str(self._efectivo)))
+            self._firmas = self._firmas_foto()
+        return self._efectivo
+
+    def guardar_efectivo(self, efectivo):
+        self._comprobar()
+        self._anotar({'tipo': 'efectivo', 'valor': efectivo})
+
+
+class RepositorioSQLite:
+    # Misma interfaz que RepositorioCartera sobre una base de datos SQLite en modo WAL
+    def __init__(self, ruta, metodo='fifo'):
+        self.ruta = ruta
+        self.metodo = metodo
+        self._con = sqlite3.connect(ruta)
+        self._con.row_factory = sqlite3.Row
+        self._profundidad = 0
+        # Listas ya leidas; se descartan en cada cambio para que quien las guarde sepa que son nuevas
+        self._lista = None
+        self._lista_acciones = None
+        self._libro = None  # Libro de lotes en memoria; se lee entero la primera vez que hace falta
+        self._notas = {}
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+
+    def inicializar(self):
+        with self._con:
+            self._con.executescript("""
+                CREATE TABLE IF NOT EXISTS registros (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    d TEXT NOT NULL, m TEXT NOT NULL, a TEXT NOT NULL,
+                    cantidad REAL NOT NULL, trans TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS registros_fecha ON registros (a, m, d);
+                CREATE TABLE IF NOT EXISTS acciones (
+                    orden INTEGER PRIMARY KEY,
+                    simbolo TEXT NOT NULL, cantidad REAL NOT NULL,
+                    precio_compra REAL NOT NULL, notas TEXT NOT NULL DEFAULT ''
+                );
+                CREATE INDEX IF NOT EXISTS acciones_simbolo ON acciones (simbolo);
+                CREATE TABLE IF NOT EXISTS movimientos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    simbolo TEXT NOT NULL, d TEXT NOT NULL, m TEXT NOT NULL, a TEXT NOT NULL,
+                    tipo TEXT NOT NULL, cantidad REAL NOT NULL, precio REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS movimientos_simbolo ON movimientos (simbolo);
+                CREATE TABLE IF NOT EXISTS notas (
+                    simbolo TEXT PRIMARY KEY, notas TEXT NOT NULL
+                ) WITHOUT ROWID;
+                CREATE TABLE IF NOT EXISTS efectivo (
+                    id INTEGER PRIMARY KEY CHECK (id = 1), valor REAL NOT NULL
+                );
+            """)
+        # Bases de antes del libro de lotes: cada fila de acciones pasa a ser una compra de hoy
+        acciones = [dict(f) for f in self._con.execute("SELECT simbolo, cantidad, precio_compra, notas FROM acciones "
+                                                       "ORDER BY orden")]
+        if acciones:
+            with self.lote():
+                for movimiento in lotes_iniciales(acciones, date.today()):
+                    self.agregar_movimiento(movimiento)
+                for accion in acciones:
+                    if accion['notas']:
+                        self.guardar_notas(accion['simbolo'], accion['notas'])
+                self._con.execute("DELETE FROM acciones")
+
+    def vacia(self):
+        consulta = ("SELECT (SELECT count(*) FROM registros) + (SELECT count(*) FROM acciones) "
+                    "+ (SELECT count(*) FROM movimientos)")
+        return self._con.execute(consulta).fetchone()[0] == 0
+
+    def _confirmar(self):
+        self._lista = None
+        self._lista_acciones = None
+        if self._profundidad == 0:
+            self._con.commit()
+
+    @contextmanager
+    def lote(self):
+        # Todo el lote en una sola transaccion
+        self._profundidad += 1
+        try:
+            yield
+        except BaseException:
+            self._profundidad -= 1
+            if self._profundidad == 0:
+                self._con.rollback()
+                self._lista = None
+                self._lista_acciones = None
+                self._libro = None
+            raise
+        self._profundidad -= 1
+        self._confirmar()
+
+    def compactar(self):
+        self._con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def preparar_compactacion(self):
+        # El punto de control desde otro hilo necesita su propia conexion
+        def escribir():
+            con = sqlite3.connect(self.ruta)
+            try:
+                con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                con.close()
+        return escribir
+
+    def cerrar(self):
+        self._con.close()
+
+    # Registros de aportaciones
+    def registros(self):
+        if self._lista is None:
+            filas = self._con.execute("SELECT id, d, m, a, cantidad, trans FROM registros ORDER BY id")
+            self._lista = [dict(f) for f in filas]
+        return self._lista
+
+    def registro(self, id_registro):
+        fila = self._con.execute("SELECT id, d, m, a, cantidad, trans FROM registros WHERE id = ?",
+                                 (int(id_registro),)).fetchone()
+        return dict(fila) if fila else None
+
+    def proximo_id(self):
+        # AUTOINCREMENT no reutiliza ids borrados
+        fila = self._con.execute("SELECT seq FROM sqlite_sequence WHERE name = 'registros'").fetchone()
+        return (fila[0] if fila else 0) + 1
+
+    def agregar_registro(self, datos):
+        registro = convertir_registro(dict(datos, id=datos.get('id', 0)))
+        cursor = self._con.execute(
+            "INSERT INTO registros (id, d, m, a, cantidad, trans) VALUES (?, ?, ?, ?, ?, ?)",
+            (registro['id'] or None, registro['d'], registro['m'], registro['a'], registro['cantidad'], registro['trans']))
+        self._confirmar()
+        return self.registro(cursor.lastrowid)
+
+    def modificar_registro(self, id_registro, datos):
+        nuevo = convertir_registro(dict(self.registro(id_registro), **datos, id=int(id_registro)))
+        self._con.execute("UPDATE registros SET d = ?, m = ?, a = ?, cantidad = ?, trans = ? WHERE id = ?",
+                          (nuevo['d'], nuevo['m'], nuevo['a'], nuevo['cantidad'], nuevo['trans'], nuevo['id']))
+        self._confirmar()
+        return nuevo
+
+    def eliminar_registro(self, id_registro):
+        self._con.execute("DELETE FROM registros WHERE id = ?", (int(id_registro),))
+        self._confirmar()
+
+    def ids_existentes(self, ids):
+        # Por trozos: SQLite limita el numero de parametros de una consulta
+        ids = list(ids)
+        existentes = set()
+        for inicio in range(0, len(ids), 900):
+            trozo = ids[inicio:inicio + 900]
+            consulta = f"SELECT id FROM registros WHERE id IN ({','.join('?' * len(trozo))})"
+            existentes.update(f[0] for f in self._con.execute(consulta, trozo))
+        return existentes
+
+    def agregar_registros(self, registros):
+        self._con.executemany("INSERT INTO registros (id, d, m, a, cantidad, trans) VALUES (?, ?, ?, ?, ?, ?)",
+                              ((r['id'], r['d'], r['m'], r['a'], r['cantidad'], r['trans']) for r in registros))
+        self._confirmar()
+
+    def total_invertido(self, desde=None, hasta=None):
+        condiciones, parametros = [], [RECARGO_SIN_TRANSACCION]
+        if desde:
+            condiciones.append("(a, m, d) >= (?, ?, ?)")
+            parametros.extend(desde)
+        if hasta:
+            condiciones.append("(a, m, d) <= (?, ?, ?)")
+            parametros.extend(hasta)
+        consulta = "SELECT total(CASE WHEN trans = 's' THEN cantidad ELSE ? * cantidad END) FROM registros"
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        return self._con.execute(consulta, parametros).fetchone()[0]
+
+    # Libro de lotes
+    def _cargar_libro(self):
+        if self._libro is None:
+            filas = self._con.execute("SELECT id, simbolo, d, m, a, tipo, cantidad, precio FROM movimientos")
+            self._libro = Libro([dict(f) for f in filas], self.metodo)
+            self._notas = {f[0]: f[1] for f in self._con.execute("SELECT simbolo, notas FROM notas")}
+        return self._libro
+
+    def _cambiar_libro(self, cambio, consulta, parametros):
+        # Primero el libro, que lanza ValueError si una venta se queda sin acciones; luego la base de datos
+        cambio(self._cargar_libro())
+        try:
+            cursor = self._con.execute(consulta, parametros)
+        except BaseException:
+            self._libro = None
+            raise
+        self._confirmar()
+        return cursor
+
+    def movimientos(self, simbolo=None):
+        return self._cargar_libro().movimientos(simbolo)
+
+    def movimiento(self, id_movimiento):
+        return self._cargar_libro().movimiento(int(id_movimiento))
+
+    def proximo_id_movimiento(self):
+        fila = self._con.execute("SELECT seq FROM sqlite_sequence WHERE name = 'movimientos'").fetchone()
+        return max(fila[0] if fila else 0, self._cargar_libro().max_id) + 1
+
+    def agregar_movimiento(self, datos):
+        movimiento = convertir_movimiento(dict(datos, id=datos.get('id') or self.proximo_id_movimiento()))
+        self._cambiar_libro(lambda libro: libro.agregar(movimiento),
+                            "INSERT INTO movimientos (id, simbolo, d, m, a, tipo, cantidad, precio) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", itemgetter(*MOVIMIENTO_FIELDS)(movimiento))
+        return movimiento
+
+    def agregar_movimientos(self, movimientos, notas=None):
+        with self.lote():
+            for datos in movimientos:
+                self.agregar_movimiento(datos)
+            for simbolo, texto in (notas or {}).items():
+                self.guardar_notas(simbolo, texto)
+
+    def modificar_movimiento(self, id_movimiento, datos):
+        nuevo = convertir_movimiento(dict(self.movimiento(id_movimiento), **datos, id=int(id_movimiento)))
+        self._cambiar_libro(lambda libro: libro.modificar(nuevo),
+                            "UPDATE movimientos SET simbolo = ?, d = ?, m = ?, a = ?, tipo = ?, cantidad = ?, precio = ? "
+                            "WHERE id = ?", itemgetter(*MOVIMIENTO_FIELDS[1:], 'id')(nuevo))
+        return nuevo
+
+    def eliminar_movimiento(self, id_movimiento):
+        self._cambiar_libro(lambda libro: libro.eliminar(int(id_movimiento)),
+                            "DELETE FROM movimientos WHERE id = ?", (int(id_movimiento),))
+
+    def posicion(self, simbolo):
+        return self._cargar_libro().agregado(simbolo)
+
+    def realizado(self):
+        return self._cargar_libro().realizado()
+
+    # Acciones: el agregado del libro
+    def acciones(self):
+        if self._lista_acciones is None:
+            self._lista_acciones = self._cargar_libro().acciones(self._notas)
+        return self._lista_acciones
+
+    def accion(self, simbolo):
+        agregado = self.posicion(simbolo)
+        if not agregado or not agregado['cantidad']:
+            return None
+        return {'simbolo': simbolo, 'cantidad': agregado['cantidad'], 'precio_compra': agregado['precio_compra'],
+                'notas': self._notas.get(simbolo, '')}
+
+    def agregar_accion(self, datos):
+        with self.lote():
+            self.agregar_movimiento(movimiento_de_accion(datos, self.proximo_id_movimiento()))
+            if datos.get('notas'):
+                self.guardar_notas(datos['simbolo'], datos['notas'])
+
+    def guardar_notas(self, simbolo, notas):
+        self._cargar_libro()
+        self._con.execute("INSERT OR REPLACE INTO notas (simbolo, notas) VALUES (?, ?)", (simbolo, notas))
+        self._notas[simbolo] = notas
+        self._confirmar()
+
+    def modificar_accion(self, simbolo, datos):
+        # Solo simbolo y notas: cantidades y precios se cambian con los movimientos
+        nuevo = datos.get('simbolo') or simbolo
+        with self.lote():
+            if nuevo != simbolo:
+                self._cambiar_libro(lambda libro: libro.renombrar(simbolo, nuevo),
+                                    "UPDATE movimientos SET simbolo = ? WHERE simbolo = ?", (nuevo, simbolo))
+                notas = self._notas.pop(simbolo, None)
+                self._con.execute("DELETE FROM notas WHERE simbolo = ?", (simbolo,))
+                if notas and nuevo not in self._notas:
+                    self.guardar_notas(nuevo, notas)
+            if 'notas' in datos:
+                self.guardar_notas(nuevo, datos['notas'] or '')
+
+    def eliminar_accion(self, simbolo):
+        with self.lote():
+            self._cambiar_libro(lambda libro: libro.eliminar_simbolo(simbolo),
+                                "DELETE FROM movimientos WHERE simbolo = ?", (simbolo,))
+            self._con.execute("DELETE FROM notas WHERE simbolo = ?", (simbolo,))
+            self._notas.pop(simbolo, None)
+
+    # Efectivo
+    def cargar_efectivo(self):
+        fila = self._con.execute("SELECT valor FROM efectivo WHERE id = 1").fetchone()
+        return fila[0] if fila else 0.0
+
+    def guardar_efectivo(self, efectivo):
+        self._con.execute("INSERT OR REPLACE INTO efectivo (id, valor) VALUES (1, ?)", (float(efectivo),))
+        self._confirmar()
+
+
+def importar_csv(repo_sqlite, db_file, acciones_file, efectivo_file):
+    # Copia unica de los archivos de texto (incluido su diario) a SQLite
+    origen = RepositorioCartera(db_file, acciones_file, efectivo_file)
+    with repo_sqlite.lote():
+        for registro in origen.registros():
+            repo_sqlite.agregar_registro(registro)
+        for movimiento in origen.movimientos():
+            repo_sqlite.agregar_movimiento(movimiento)
+        for accion in origen.foto_acciones():
+            if accion['notas']:
+                repo_sqlite.guardar_notas(accion['simbolo'], accion['notas'])
+        repo_sqlite.guardar_efectivo(origen.cargar_efectivo())
+
+
+def exportar_csv(repo, db_file, acciones_file, efectivo_file, movimientos_file=None):
+    # Devuelve (registros, movimientos) escritos
+    return preparar_exportacion(repo, db_file, acciones_file, efectivo_file, movimientos_file)()
+
+
+def preparar_exportacion(repo, db_file, acciones_file, efectivo_file, movimientos_file=None):
+    # Copia de los datos en CSV, de cualquiera de los dos repositorios. Lee en el hilo que usa el
+    # repositorio y devuelve la funcion que escribe, que puede ir a otro hilo: las listas que entrega
+    # el repositorio no se modifican despues.
+    movimientos_file = movimientos_file or os.path.join(os.path.dirname(db_file), "movimientosCY.csv")
+    propios = {os.path.abspath(getattr(repo, atributo)) for atributo in
+               ('db_file', 'acciones_file', 'efectivo_file', 'movimientos_file') if hasattr(repo, atributo)}
+    if propios & {os.path.abspath(r) for r in (db_file, acciones_file, efectivo_file, movimientos_file)}:
+        raise ValueError("Esos son los archivos de datos en uso; elija otra carpeta")
+    registros, movimientos, acciones = repo.registros(), repo.movimientos(), repo.acciones()
+    efectivo = repo.cargar_efectivo()
+
+    def escribir():
+        escribir_csv(db_file, FIELDNAMES, registros)
+        escribir_csv(movimientos_file, MOVIMIENTO_FIELDS, movimientos)
+        escribir_csv(acciones_file, ACCIONES_FIELDS, acciones)
+        escribir_atomico(efectivo_file, lambda f: f.write(str(efectivo)))
+        return len(registros), len(movimientos)
+    return escribir
+
+
+def abrir_repositorio(tipo, db_file, acciones_file, efectivo_file, sqlite_file, metodo='fifo'):
+    # metodo: 'fifo' o 'medio', como se calcula el precio de compra de lo que queda tras vender
+    if tipo == 'sqlite':
+        repo = RepositorioSQLite(sqlite_file, metodo)
+        repo.inicializar()
+        if repo.vacia() and os.path.exists(db_file):
+            importar_csv(repo, db_file, acciones_file, efectivo_file)
+        return repo
+    if tipo != 'csv':
+        raise ValueError(f"Tipo de almacenamiento desconocido: {tipo}")
+    repo = RepositorioCartera(db_file, acciones_file, efectivo_file, metodo=metodo)
+    repo.inicializar()
+    return repo
@@ -0,0 +1,998 @@
+'''
+Medidas de rendimiento del gestor de inversiones.
+
+No necesita red: trabaja con archivos generados en un directorio temporal y, donde hacen falta
+precios, con una grabacion (FuenteGrabada). El arranque y el ciclo de refresco solo miden la pintura
+si hay pantalla (o Xvfb para crear una); sin ella miden el resto.
+Uso: python benchmark.py [escenario ...] [--json resultados.json] [--comparar anteriores.json]
+Sale con codigo 1 si algun escenario con objetivo no lo cumple.
+'''
+
+import argparse
+import contextlib
+import csv
+import glob
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from almacen import ACCIONES_FIELDS, FIELDNAMES, RepositorioCartera, RepositorioSQLite
+from cotizaciones import CacheCotizaciones, MonedasInstrumentos, UltimosPrecios, precios_con_respaldo
+from directo import ServidorRepeticion, Suscriptor
+from fuentes import FuenteGrabada
+from historico import HistoricoPrecios
+from importador import Importacion
+from indicadores import MotorVigilancia, filtrar, ordenar
+from lotes import COMPRA, VENTA, Libro, reconstruir
+from medidas import Medidor
+from red import Circuito, ClienteHTTP, CuboFichas
+from rentabilidad import SerieCartera
+from simbolos import IndiceSimbolos, MetadatosSimbolos
+from tablas import TablaIncremental
+from valoracion import MotorValoracion, revalorar, valorar
+from vigilancia import HILOS_VIGILANCIA, LOTE_VIGILANCIA, precios_por_lotes
+
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+# Objetivos de arranque en ms, medidos desde que se lanza el interprete
+OBJETIVO_IMPORTACION_MS = 300
+OBJETIVO_PRIMERA_PINTURA_MS = 1000
+OBJETIVO_IMPORTACION_S = 15  # Un extracto de un millon de lineas
+OBJETIVO_TRAMO_APAGADO_NS = 1000  # Coste añadido por un tramo de medida con la medicion desactivada
+OBJETIVO_DIRECTO_MS = 50  # Trabajo en el hilo de Tk por cada recogida de ticks en directo
+OBJETIVO_VIGILANCIA_S = 3  # Reescaneo completo de la lista de vigilancia con el historico ya guardado
+OBJETIVO_BUSQUEDA_MS = 10  # Sugerencias al teclear y datos de un simbolo ya consultado
+
+# Se ejecuta en un proceso aparte: cada linea impresa marca una fase del arranque
+PROGRAMA_ARRANQUE = """
+import sys
+import tkinter as tk
+import seguidor_acciones
+pesados = [m for m in ('yfinance', 'pandas', 'numpy') if m in sys.modules]
+print('importado', ','.join(pesados), flush=True)
+try:
+    root = tk.Tk()
+except tk.TclError:
+    sys.exit(0)
+app = seguidor_acciones.StockApp(root)
+root.update()
+print('pintado', flush=True)
+app.cerrar()
+"""
+
+# Ciclo de refresco en un proceso aparte (para medir su memoria), con los precios de una grabacion
+PROGRAMA_CICLO = """
+import json
+import os
+import sys
+import configuracion
+configuracion.FUENTE_PRECIOS = os.path.join(configuracion.SCRIPT_DIR, 'grabacion.json')  # Antes que la aplicacion
+import benchmark
+print(json.dumps(benchmark.medir_ciclo(int(sys.argv[1]))), flush=True)
+"""
+MAX_ACCIONES_CICLO = 10_000  # Nadie tiene un millon de posiciones; la tabla de acciones no es virtual
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def generar_registros(ruta, n, semilla=1):
+    aleatorio = random.Random(semilla)
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDNAMES)
+        for i in range(1, n + 1):
+            writer.writerow([i, f"{aleatorio.randint(1, 28):02d}", f"{aleatorio.randint(1, 12):02d}",
+                             aleatorio.randint(2015, 2025), round(aleatorio.uniform(10, 1000), 2),
+                             aleatorio.choice('sn')])
+
+
+def generar_acciones(ruta, n, semilla=1):
+    aleatorio = random.Random(semilla)
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(ACCIONES_FIELDS)
+        for i in range(n):
+            writer.writerow([f"S{i}", aleatorio.randint(1, 500), round(aleatorio.uniform(1, 300), 2), ''])
+
+
+def generar_grabacion(ruta, simbolos, semilla=1):
+    # Diez cotizaciones por simbolo: cada refresco trae precios distintos, como en la realidad
+    aleatorio = random.Random(semilla)
+    divisas = ['EUR', 'USD', 'GBp']
+    datos = {
+        'cotizaciones': {s: [round(aleatorio.uniform(1, 300), 2) for _ in range(10)] for s in simbolos},
+        'monedas': {s: divisas[i % len(divisas)] for i, s in enumerate(simbolos)},
+    }
+    datos['cotizaciones'].update({'EURUSD=X': [1.08, 1.09], 'EURGBP=X': [0.85, 0.86]})
+    with open(ruta, 'w', encoding='utf-8') as f:
+        json.dump(datos, f)
+
+
+def generar_extracto(ruta, n, semilla=1):
+    # Como los de los bancos y brokers españoles: punto y coma, fecha dd/mm/aaaa y coma decimal
+    aleatorio = random.Random(semilla)
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        f.write("Fecha operación;Concepto;Importe\n")
+        for _ in range(n):
+            importe = f"{aleatorio.uniform(10, 5000):.2f}".replace('.', ',')
+            f.write(f"{aleatorio.randint(1, 28):02d}/{aleatorio.randint(1, 12):02d}/{aleatorio.randint(2015, 2025)};"
+                    f"Aportación;{importe}\n")
+
+
+def generar_extracto_acciones(ruta, n, simbolos=500, semilla=1):
+    # Extracto de compras de un broker: una fila por operacion, con fecha, titulos y precio
+    aleatorio = random.Random(semilla)
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        f.write("Ticker;Fecha operación;Títulos;Precio medio\n")
+        for _ in range(n):
+            precio = f"{aleatorio.uniform(1, 300):.2f}".replace('.', ',')
+            f.write(f"S{aleatorio.randrange(simbolos)};{aleatorio.randint(1, 28):02d}/{aleatorio.randint(1, 12):02d}/"
+                    f"{aleatorio.randint(2015, 2025)};{aleatorio.randint(1, 500)};{precio}\n")
+
+
+def bench_agregar_registro(tamanos=(100, 1_000, 10_000, 100_000, 1_000_000), operaciones=200):
+    # Latencia de añadir un registro segun el tamaño del historico: debe mantenerse plana
+    resultados = []
+    for n in tamanos:
+        with tempfile.TemporaryDirectory() as directorio:
+            db_file = os.path.join(directorio, "basedatosCY.csv")
+            generar_registros(db_file, n)
+            repo = RepositorioCartera(db_file, os.path.join(directorio, "accionesCY.csv"),
+                                      os.path.join(directorio, "efectivoCY.txt"))
+            repo.inicializar()
+            repo.registros()
+
+            tiempos = []
+            for _ in range(operaciones):
+                inicio = time.perf_counter()
+                repo.agregar_registro({'d': '01', 'm': '01', 'a': '2025', 'cantidad': 100.0, 'trans': 's'})
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+
+            resultados.append({
+                'registros': n,
+                'p50_ms': round(statistics.median(tiempos), 3),
+                'p99_ms': round(percentil(tiempos, 99), 3),
+            })
+            print(f"agregar_registro con {n:>9} registros: p50 {resultados[-1]['p50_ms']:.3f} ms"
+                  f"  p99 {resultados[-1]['p99_ms']:.3f} ms")
+    return resultados
+
+
+def bench_valoracion(depositos=1_000_000, posiciones=10_000, repeticiones=20):
+    # Valoracion completa del Resumen: debe quedar muy por debajo de 100 ms
+    aleatorio = random.Random(1)
+    registros = [{'id': i, 'cantidad': round(aleatorio.uniform(10, 1000), 2), 'trans': aleatorio.choice('sn')}
+                 for i in range(depositos)]
+    acciones = [{'simbolo': f"S{i}", 'cantidad': aleatorio.randint(1, 500),
+                 'precio_compra': round(aleatorio.uniform(1, 300), 2)} for i in range(posiciones)]
+    precios = {a['simbolo']: round(aleatorio.uniform(1, 300), 2) for a in acciones}
+
+    motor = MotorValoracion()
+    inicio = time.perf_counter()
+    cartera = motor.preparar(registros, acciones)
+    conversion_ms = (time.perf_counter() - inicio) * 1000
+
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        motor.preparar(registros, acciones)
+        valorar(cartera, precios, 1000.0)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    resultado = {
+        'registros': depositos,
+        'acciones': posiciones,
+        'conversion_ms': round(conversion_ms, 3),
+        'p50_ms': round(statistics.median(tiempos), 3),
+        'p99_ms': round(percentil(tiempos, 99), 3),
+    }
+    print(f"valoracion de {depositos} registros y {posiciones} acciones: p50 {resultado['p50_ms']:.3f} ms"
+          f"  p99 {resultado['p99_ms']:.3f} ms  (conversion inicial {resultado['conversion_ms']:.1f} ms)")
+    return resultado
+
+
+def bench_rentabilidad(anios=20, consultas=1_000):
+    # Rangos de fechas sobre una serie diaria de muchos años: la TWR no debe depender del tamaño del rango
+    dias = 365 * anios
+    aleatorio = np.random.default_rng(1)
+    aportaciones = np.where(aleatorio.random(dias) < 0.05, 100.0, 0.0)
+    cesta = np.cumprod(1 + aleatorio.normal(0.0003, 0.01, dias))
+    valores = np.cumsum(aportaciones / cesta) * cesta
+
+    inicio = time.perf_counter()
+    serie = SerieCartera(np.arange(np.datetime64('2000-01-01'), np.datetime64('2000-01-01') + dias), valores, aportaciones)
+    preparacion_ms = (time.perf_counter() - inicio) * 1000
+
+    resultados = {'dias': dias, 'preparacion_ms': round(preparacion_ms, 3)}
+    for nombre, funcion in (('twr', serie.twr), ('xirr', serie.xirr)):
+        tiempos = []
+        for _ in range(consultas if nombre == 'twr' else consultas // 10):
+            i = int(aleatorio.integers(0, dias // 2))
+            j = int(aleatorio.integers(dias // 2, dias))
+            inicio = time.perf_counter()
+            funcion(i, j)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        resultados[f'{nombre}_p50_ms'] = round(statistics.median(tiempos), 4)
+        resultados[f'{nombre}_p99_ms'] = round(percentil(tiempos, 99), 4)
+        print(f"{nombre} sobre {dias} dias: p50 {resultados[f'{nombre}_p50_ms']:.4f} ms"
+              f"  p99 {resultados[f'{nombre}_p99_ms']:.4f} ms")
+    return resultados
+
+
+def medir_arranque(directorio):
+    # Tiempo hasta cada fase, visto desde fuera del proceso
+    inicio = time.perf_counter()
+    proceso = subprocess.Popen([sys.executable, '-c', PROGRAMA_ARRANQUE], cwd=directorio,
+                               stdout=subprocess.PIPE, text=True)
+    fases = {}
+    for linea in proceso.stdout:
+        fase, _, detalle = linea.strip().partition(' ')
+        fases[fase] = ((time.perf_counter() - inicio) * 1000, detalle)
+    proceso.wait()
+    return fases
+
+
+def bench_arranque(repeticiones=5, registros=10_000):
+    # Tiempo hasta la primera pintura de la ventana, con los modulos copiados junto a datos generados
+    with tempfile.TemporaryDirectory() as directorio:
+        for modulo in glob.glob(os.path.join(DIRECTORIO, '*.py')):
+            shutil.copy(modulo, directorio)
+        generar_registros(os.path.join(directorio, "basedatosCY.csv"), registros)
+
+        mediciones = [medir_arranque(directorio) for _ in range(repeticiones)]
+
+    importacion = [m['importado'][0] for m in mediciones]
+    pesados = mediciones[0]['importado'][1]
+    resultado = {
+        'importacion_p50_ms': round(statistics.median(importacion), 1),
+        'pesados_al_importar': pesados.split(',') if pesados else [],
+    }
+    cumple = resultado['importacion_p50_ms'] <= OBJETIVO_IMPORTACION_MS and not pesados
+    print(f"arranque: importacion p50 {resultado['importacion_p50_ms']:.1f} ms (objetivo {OBJETIVO_IMPORTACION_MS} ms)"
+          + (f", importa {pesados} antes de abrir la ventana" if pesados else ""))
+
+    pintura = [m['pintado'][0] for m in mediciones if 'pintado' in m]
+    if pintura:
+        resultado['primera_pintura_p50_ms'] = round(statistics.median(pintura), 1)
+        cumple = cumple and resultado['primera_pintura_p50_ms'] <= OBJETIVO_PRIMERA_PINTURA_MS
+        print(f"arranque: primera pintura p50 {resultado['primera_pintura_p50_ms']:.1f} ms"
+              f" (objetivo {OBJETIVO_PRIMERA_PINTURA_MS} ms)")
+    else:
+        print("arranque: sin pantalla, no se mide la primera pintura")
+    resultado['cumple'] = cumple
+    return resultado
+
+
+def memoria_pico_mb():
+    # Memoria residente maxima del proceso; None donde no hay modulo resource (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def medir_ciclo(repeticiones):
+    # Lo que hace la aplicacion en cada refresco: leer los archivos, descargar precios, valorar y
+    # pintar las tablas y el resumen. Se ejecuta desde PROGRAMA_CICLO, junto a los datos generados.
+    from configuracion import (ACCIONES_FILE, ALMACENAMIENTO, DB_FILE, EFECTIVO_FILE, FUENTE_PRECIOS, HISTORICO_FILE,
+                               SQLITE_FILE)
+    from almacen import abrir_repositorio
+    from fuentes import crear_fuente
+    from historico import HistoricoPrecios
+    from rentabilidad import MotorRentabilidad
+    from tablas import IndiceRegistros
+
+    app = None
+    try:
+        import tkinter as tk
+        import seguidor_acciones
+        root = tk.Tk()
+        app = seguidor_acciones.StockApp(root)
+        app.planificador.detener()  # Los refrescos los lanza el benchmark
+    except Exception as e:
+        print(f"Sin pantalla, no se mide la pintura: {str(e)}", file=sys.stderr)
+
+    cotizaciones = CacheCotizaciones(crear_fuente(FUENTE_PRECIOS), ttl=0, ttl_divisas=0)
+    monedas = MonedasInstrumentos()
+    ultimos = UltimosPrecios()
+    historico = HistoricoPrecios(HISTORICO_FILE)
+    motor = MotorValoracion()
+    rentabilidad = MotorRentabilidad(historico, monedas)
+
+    fases = {'carga': [], 'precios': [], 'valoracion': [], 'pintura': [], 'total': []}
+    for vez in range(repeticiones + 1):  # La primera calienta cachés e importaciones y no cuenta
+        tiempos = {}
+        inicio = time.perf_counter()
+        repo = abrir_repositorio(ALMACENAMIENTO, DB_FILE, ACCIONES_FILE, EFECTIVO_FILE, SQLITE_FILE)
+        registros, acciones, movimientos = repo.registros(), repo.acciones(), repo.movimientos()
+        tiempos['carga'] = time.perf_counter()
+
+        cartera = motor.preparar(registros, acciones, movimientos)
+        precios, antiguos = precios_con_respaldo(cotizaciones, cartera.simbolos, monedas, ultimos)
+        tiempos['precios'] = time.perf_counter()
+
+        resultado = valorar(cartera, precios, repo.cargar_efectivo())
+        resultado.update(antiguos=antiguos, descargado=True, rentabilidad=rentabilidad.serie(cartera).rango(),
+                         realizado=repo.realizado())
+        tiempos['valoracion'] = time.perf_counter()
+
+        if app is not None:
+            app.indice_registros = IndiceRegistros(registros)
+            app.mostrar_registros()
+            app.mostrar_lista_acciones(acciones, precios, antiguos)
+            app.mostrar_resumen(resultado)
+            root.update()
+        tiempos['pintura'] = time.perf_counter()
+        if hasattr(repo, 'cerrar'):
+            repo.cerrar()
+
+        if vez:
+            anterior = inicio
+            for fase, instante in tiempos.items():
+                fases[fase].append((instante - anterior) * 1000)
+                anterior = instante
+            fases['total'].append((anterior - inicio) * 1000)
+
+    if app is not None:
+        app.cerrar()
+    historico.cerrar()
+    resultado = {'pintura_medida': app is not None, 'memoria_pico_mb': memoria_pico_mb()}
+    for fase, tiempos in fases.items():
+        if fase == 'pintura' and app is None:
+            continue
+        resultado[f'{fase}_p50_ms'] = round(statistics.median(tiempos), 3)
+        resultado[f'{fase}_p99_ms'] = round(percentil(tiempos, 99), 3)
+    return resultado
+
+
+@contextlib.contextmanager
+def pantalla_virtual():
+    # En Linux sin pantalla arranca Xvfb si esta instalado; devuelve el entorno para el proceso hijo
+    entorno = dict(os.environ)
+    if sys.platform.startswith('linux') and not entorno.get('DISPLAY') and shutil.which('Xvfb'):
+        servidor = subprocess.Popen(['Xvfb', ':97', '-screen', '0', '1280x800x24'],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(0.5)
+        entorno['DISPLAY'] = ':97'
+        try:
+            yield entorno
+        finally:
+            servidor.terminate()
+            servidor.wait()
+    else:
+        yield entorno
+
+
+def bench_ciclo(tamanos=(10, 1_000, 100_000, 1_000_000), repeticiones=5):
+    # Refresco completo (carga del CSV, precios, valoracion y pintura) segun el tamaño de los archivos
+    resultados = []
+    with pantalla_virtual() as entorno, tempfile.TemporaryDirectory() as directorio:
+        for modulo in glob.glob(os.path.join(DIRECTORIO, '*.py')):
+            shutil.copy(modulo, directorio)
+        for n in tamanos:
+            for archivo in ('carteraCY.db', 'historicoCY.db', 'preciosCY.json', 'monedasCY.json'):
+                if os.path.exists(os.path.join(directorio, archivo)):
+                    os.remove(os.path.join(directorio, archivo))
+            posiciones = min(n, MAX_ACCIONES_CICLO)
+            generar_registros(os.path.join(directorio, "basedatosCY.csv"), n)
+            generar_acciones(os.path.join(directorio, "accionesCY.csv"), posiciones)
+            generar_grabacion(os.path.join(directorio, "grabacion.json"), [f"S{i}" for i in range(posiciones)])
+
+            proceso = subprocess.run([sys.executable, '-c', PROGRAMA_CICLO, str(repeticiones)], cwd=directorio,
+                                     env=entorno, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            if proceso.returncode != 0:
+                print(f"ciclo con {n} registros: error\n{proceso.stderr}")
+                continue
+            resultado = dict(json.loads(proceso.stdout.strip().splitlines()[-1]), registros=n, acciones=posiciones)
+            resultados.append(resultado)
+            fases = "  ".join(f"{fase} {resultado[f'{fase}_p50_ms']:.1f}"
+                              for fase in ('carga', 'precios', 'valoracion', 'pintura')
+                              if f'{fase}_p50_ms' in resultado)
+            print(f"ciclo con {n:>9} registros y {posiciones:>6} acciones: p50 {resultado['total_p50_ms']:.1f} ms"
+                  f"  p99 {resultado['total_p99_ms']:.1f} ms  memoria {resultado['memoria_pico_mb']} MB  ({fases})")
+    if resultados and not resultados[0]['pintura_medida']:
+        print("ciclo: sin pantalla, no se mide la pintura")
+    return resultados
+
+
+def importar_extracto(repo, ruta, tipo='registros'):
+    # Como la interfaz: paso a paso y el volcado final aparte (la interfaz lo hace en el hilo de precios).
+    # Devuelve (segundos, lote mas lento en ms, volcado final en ms, importacion)
+    importacion = Importacion(repo, ruta, tipo)
+    lotes = []
+    inicio = time.perf_counter()
+    sigue = True
+    while sigue:
+        inicio_lote = time.perf_counter()
+        sigue = importacion.paso()
+        lotes.append((time.perf_counter() - inicio_lote) * 1000)
+    inicio_volcado = time.perf_counter()
+    repo.compactar()
+    volcado_ms = (time.perf_counter() - inicio_volcado) * 1000
+    return time.perf_counter() - inicio, max(lotes, default=0), volcado_ms, importacion
+
+
+def bench_importacion(lineas=1_000_000, lineas_memoria=(100_000, 300_000), lineas_acciones=(20_000, 60_000)):
+    # Importacion de un extracto grande: tiempo total, lote mas lento (lo que se bloquea la interfaz)
+    # y memoria de la importacion, que no debe crecer con el tamaño del archivo
+    resultado = {'lineas': lineas}
+    with tempfile.TemporaryDirectory() as directorio:
+        extracto = os.path.join(directorio, "extracto.csv")
+        generar_extracto(extracto, lineas)
+        repo = RepositorioCartera(os.path.join(directorio, "basedatosCY.csv"), os.path.join(directorio, "accionesCY.csv"),
+                                  os.path.join(directorio, "efectivoCY.txt"))
+        repo.inicializar()
+        segundos, lote_ms, volcado_ms, importacion = importar_extracto(repo, extracto)
+        resultado.update(segundos=round(segundos, 2), filas_por_segundo=round(importacion.importadas / segundos),
+                         lote_max_ms=round(lote_ms, 1), volcado_ms=round(volcado_ms, 1),
+                         importadas=importacion.importadas)
+
+        # Con SQLite el repositorio no guarda los registros en memoria: lo que se mide es la importacion
+        picos = []
+        for n in lineas_memoria:
+            generar_extracto(extracto, n)
+            sqlite = RepositorioSQLite(os.path.join(directorio, f"memoria{n}.db"))
+            sqlite.inicializar()
+            tracemalloc.start()
+            importar_extracto(sqlite, extracto)
+            picos.append(tracemalloc.get_traced_memory()[1] / (1024 * 1024))
+            tracemalloc.stop()
+            sqlite.cerrar()
+        resultado['memoria_pico_mb'] = {n: round(pico, 1) for n, pico in zip(lineas_memoria, picos)}
+
+        # Las compras de un extracto de acciones si se quedan en el libro de lotes: se mide lo que la
+        # importacion necesita por encima de lo que el repositorio guarda al terminar
+        extras = []
+        for n in lineas_acciones:
+            generar_extracto_acciones(extracto, n)
+            sqlite = RepositorioSQLite(os.path.join(directorio, f"acciones{n}.db"))
+            sqlite.inicializar()
+            tracemalloc.start()
+            importacion = importar_extracto(sqlite, extracto, 'acciones')[3]
+            del importacion
+            retenido, pico = tracemalloc.get_traced_memory()
+            extras.append((pico - retenido) / (1024 * 1024))
+            tracemalloc.stop()
+            sqlite.cerrar()
+        resultado['memoria_acciones_mb'] = {n: round(extra, 1) for n, extra in zip(lineas_acciones, extras)}
+
+    resultado['cumple'] = (segundos <= OBJETIVO_IMPORTACION_S and picos[-1] <= picos[0] * 1.5
+                           and extras[-1] <= extras[0] * 1.5)
+    print(f"importacion de {lineas} lineas: {segundos:.1f} s (objetivo {OBJETIVO_IMPORTACION_S} s),"
+          f" {resultado['filas_por_segundo']} filas/s, lote mas lento {lote_ms:.0f} ms, volcado final {volcado_ms:.0f} ms")
+    print("importacion: memoria pico " + ", ".join(f"{pico:.1f} MB con {n} lineas"
+                                                    for n, pico in zip(lineas_memoria, picos)))
+    print("importacion de acciones: memoria por encima del libro " + ", ".join(
+        f"{extra:.1f} MB con {n} lineas" for n, extra in zip(lineas_acciones, extras)))
+    return resultado
+
+
+def bench_medidas(repeticiones=200_000):
+    # Coste de envolver una etapa en un tramo, con la medicion apagada (lo normal) y encendida
+    medidor = Medidor()
+
+    def sin_tramo():
+        pass
+
+    def con_tramo():
+        with medidor.tramo('etapa'):
+            pass
+
+    def coste_ns(funcion):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            funcion()
+        return (time.perf_counter() - inicio) / repeticiones * 1e9
+
+    base = coste_ns(sin_tramo)
+    resultado = {}
+    for nombre, activo in (('apagado', False), ('encendido', True)):
+        medidor.activo = activo
+        resultado[f'{nombre}_ns'] = round(coste_ns(con_tramo) - base, 1)
+    resultado['cumple'] = resultado['apagado_ns'] <= OBJETIVO_TRAMO_APAGADO_NS
+    print(f"medidas: tramo apagado {resultado['apagado_ns']:.0f} ns (objetivo {OBJETIVO_TRAMO_APAGADO_NS} ns),"
+          f" encendido {resultado['encendido_ns']:.0f} ns")
+    return resultado
+
+
+def generar_movimientos(simbolos, lotes, semilla=1):
+    # Compras y ventas fechadas; cada venta es como mucho lo que se tiene en ese momento
+    aleatorio = random.Random(semilla)
+    movimientos = []
+    for s in range(simbolos):
+        simbolo = f"SIM{s:05d}"
+        cantidad = 0
+        for i in range(lotes):
+            dia = 1 + i * 3650 // lotes
+            fecha = {'d': f"{dia % 28 + 1:02d}", 'm': f"{dia // 28 % 12 + 1:02d}", 'a': str(2010 + dia // 336)}
+            if cantidad and aleatorio.random() < 0.3:
+                venta = aleatorio.randint(1, cantidad)
+                cantidad -= venta
+                movimientos.append(dict(fecha, id=len(movimientos) + 1, simbolo=simbolo, tipo=VENTA, cantidad=float(venta),
+                                        precio=round(aleatorio.uniform(5, 500), 2)))
+            else:
+                compra = aleatorio.randint(1, 100)
+                cantidad += compra
+                movimientos.append(dict(fecha, id=len(movimientos) + 1, simbolo=simbolo, tipo=COMPRA, cantidad=float(compra),
+                                        precio=round(aleatorio.uniform(5, 500), 2)))
+    return movimientos
+
+
+def bench_lotes(simbolos=500, lotes=200, operaciones=2_000):
+    # Libro de lotes: lo que cuesta cada compra o venta y leer el agregado en cada refresco,
+    # frente a recorrer todos los lotes en cada refresco como se haria sin agregado
+    movimientos = generar_movimientos(simbolos, lotes)
+    inicio = time.perf_counter()
+    libro = Libro(movimientos)
+    carga_s = time.perf_counter() - inicio
+
+    nombres = list(libro.posiciones)
+    siguiente = len(movimientos)
+    tiempos = []
+    for i in range(operaciones):
+        siguiente += 1
+        movimiento = {'id': siguiente, 'simbolo': nombres[i % len(nombres)], 'd': '01', 'm': '01', 'a': '2030',
+                      'tipo': COMPRA, 'cantidad': 1.0, 'precio': 10.0}
+        inicio = time.perf_counter()
+        libro.agregar(movimiento)
+        tiempos.append((time.perf_counter() - inicio) * 1e6)
+
+    inicio = time.perf_counter()
+    libro.acciones()
+    agregado_ms = (time.perf_counter() - inicio) * 1000
+    inicio = time.perf_counter()
+    for simbolo in nombres:
+        reconstruir(simbolo, libro.movimientos(simbolo))
+    recorrido_ms = (time.perf_counter() - inicio) * 1000
+
+    resultado = {
+        'movimientos': len(movimientos),
+        'carga_s': round(carga_s, 3),
+        'agregar_p50_us': round(statistics.median(tiempos), 2),
+        'agregar_p99_us': round(percentil(tiempos, 99), 2),
+        'agregado_ms': round(agregado_ms, 3),
+        'recorrer_lotes_ms': round(recorrido_ms, 3),
+    }
+    print(f"lotes: {len(movimientos)} movimientos cargados en {carga_s:.3f} s; anotar p50 "
+          f"{resultado['agregar_p50_us']:.1f} µs p99 {resultado['agregar_p99_us']:.1f} µs; acciones por refresco "
+          f"{agregado_ms:.2f} ms con agregado frente a {recorrido_ms:.1f} ms recorriendo los lotes")
+    return resultado
+
+
+class ServidorLimitado(BaseHTTPRequestHandler):
+    # Imita a Yahoo cuando limita: una parte de las respuestas son 429 y, si se pide, todas son 500
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    proporcion_429 = 0.3
+    caido = False
+    aleatorio = random.Random(1)
+    conexiones = set()
+
+    def do_GET(self):
+        ServidorLimitado.conexiones.add(self.client_address)
+        if self.caido:
+            codigo = 500
+        else:
+            codigo = 429 if self.aleatorio.random() < self.proporcion_429 else 200
+        self.send_response(codigo)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_red(peticiones=200):
+    # Cliente HTTP contra un servidor local que limita: reintentos, circuito y conexiones reutilizadas
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), ServidorLimitado)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{servidor.server_port}/"
+    try:
+        cliente = ClienteHTTP(cubo=CuboFichas(tasa=1000, capacidad=50), circuito=Circuito(fallos_para_abrir=3, pausa=0.5),
+                              espera_base=0.001, espera_maxima=0.01)
+        tiempos = []
+        for _ in range(peticiones):
+            inicio = time.perf_counter()
+            cliente.get(url)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+
+        # Con el servidor caido el circuito se abre y deja de enviar peticiones
+        ServidorLimitado.caido = True
+        enviadas = cliente.estadisticas()['peticiones']
+        for _ in range(20):
+            try:
+                cliente.get(url)
+            except Exception:
+                pass
+        ServidorLimitado.caido = False
+        estadisticas = cliente.estadisticas()
+    finally:
+        servidor.shutdown()
+
+    resultado = dict(estadisticas, p50_ms=round(statistics.median(tiempos), 3), p99_ms=round(percentil(tiempos, 99), 3),
+                     conexiones=len(ServidorLimitado.conexiones),
+                     enviadas_con_servidor_caido=estadisticas['peticiones'] - enviadas)
+    # Cada peticion fallida se reintenta hasta 3 veces; con el circuito abierto no sale ninguna
+    resultado['cumple'] = (estadisticas['aperturas_circuito'] == 1 and resultado['enviadas_con_servidor_caido'] <= 12
+                           and estadisticas['rechazadas'] >= 17)
+    print(f"red: {peticiones} peticiones, {estadisticas['reintentadas']} reintentos, {estadisticas['limitadas']} limitadas,"
+          f" {resultado['conexiones']} conexiones; p50 {resultado['p50_ms']:.3f} ms  p99 {resultado['p99_ms']:.3f} ms")
+    print(f"red: servidor caido -> {resultado['enviadas_con_servidor_caido']} enviadas,"
+          f" {estadisticas['rechazadas']} rechazadas con el circuito {estadisticas['circuito']}")
+    return resultado
+
+
+def bench_refresco(posiciones=20, refrescos=200, latencia=0.002, fallos=0.1):
+    # Refresco completo de precios contra una grabacion: latencia y fallos simulados, sin red
+    aleatorio = random.Random(1)
+    simbolos = [f"ACC{i}" for i in range(posiciones)]
+    divisas = ['EUR', 'USD', 'GBp']
+    datos = {
+        'cotizaciones': {s: [round(aleatorio.uniform(5, 500), 2) for _ in range(10)] for s in simbolos},
+        'monedas': {s: divisas[i % len(divisas)] for i, s in enumerate(simbolos)},
+    }
+    datos['cotizaciones'].update({'EURUSD=X': [1.08, 1.09], 'EURGBP=X': [0.85, 0.86]})
+    fuente = FuenteGrabada(datos=datos, latencia=latencia, variacion=latencia / 2, fallos=fallos)
+    # ttl 0: cada refresco va a la fuente, como el primero de cada minuto en la aplicacion
+    cotizaciones = CacheCotizaciones(fuente, ttl=0, ttl_divisas=0)
+    monedas = MonedasInstrumentos()
+    ultimos = UltimosPrecios()
+
+    tiempos = []
+    completos = con_respaldo = 0
+    for _ in range(refrescos):
+        inicio = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):  # Los fallos simulados se anuncian por pantalla
+            precios, antiguos = precios_con_respaldo(cotizaciones, simbolos, monedas, ultimos)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+        completos += len(precios) == posiciones
+        con_respaldo += bool(antiguos)
+
+    resultado = {'posiciones': posiciones, 'refrescos': refrescos, 'llamadas': fuente.llamadas,
+                 'fallidas': fuente.fallidas, 'completos': completos, 'con_respaldo': con_respaldo,
+                 'p50_ms': round(statistics.median(tiempos), 3), 'p99_ms': round(percentil(tiempos, 99), 3)}
+    # Salvo el primero (aun sin precios guardados), todo refresco debe acabar con todos los precios
+    resultado['cumple'] = completos >= refrescos - 1
+    print(f"refresco: {posiciones} posiciones x {refrescos}; {fuente.llamadas} llamadas, {fuente.fallidas} fallidas,"
+          f" {con_respaldo} con precios guardados; p50 {resultado['p50_ms']:.3f} ms  p99 {resultado['p99_ms']:.3f} ms")
+    return resultado
+
+
+class ArbolSinPantalla:
+    # Lo que TablaIncremental usa de un ttk.Treeview, sin Tk: mide el trabajo propio de la tabla
+    def __init__(self):
+        self.filas = {}
+
+    def insert(self, padre, posicion, iid=None, values=()):
+        self.filas[iid] = values
+
+    def item(self, iid, values=()):
+        self.filas[iid] = values
+
+    def delete(self, *iids):
+        for iid in iids:
+            self.filas.pop(iid, None)
+
+    def move(self, iid, padre, posicion):
+        pass
+
+
+def fila_directo(accion, precio):
+    # Las mismas columnas que StockApp.fila_accion
+    valor = accion['cantidad'] * precio
+    return (accion['simbolo'], f"{accion['cantidad']:.5f}", f"{accion['precio_compra']:.4f}", f"{valor:.2f}",
+            f"{valor - accion['cantidad'] * accion['precio_compra']:.2f}", '')
+
+
+def bench_directo(posiciones=2_000, segundos=5, intervalo_ms=250):
+    # Cotizaciones en directo contra el servidor de repeticion local, sin pausa entre ticks: cuantos
+    # ticks por segundo recibe y decodifica el suscriptor, y cuanto cuesta cada recogida en el hilo de Tk
+    # (corregir el resumen y formatear las filas cambiadas) frente a valorar toda la cartera
+    aleatorio = random.Random(1)
+    acciones = [{'simbolo': f"S{i}", 'cantidad': aleatorio.randint(1, 500),
+                 'precio_compra': round(aleatorio.uniform(1, 300), 2)} for i in range(posiciones)]
+    datos = {'cotizaciones': {a['simbolo']: [round(aleatorio.uniform(1, 300), 2) for _ in range(10)] for a in acciones}}
+    cartera = MotorValoracion().preparar([], acciones)
+    resumen = valorar(cartera, {}, 1000.0)
+    por_simbolo = {a['simbolo']: a for a in acciones}
+    tabla = TablaIncremental(ArbolSinPantalla())
+    tabla.sincronizar([(a['simbolo'], fila_directo(a, a['precio_compra'])) for a in acciones])
+    pintadas = tabla.llamadas_tk
+
+    servidor = ServidorRepeticion(datos=datos).iniciar()
+    suscriptor = Suscriptor(servidor.url, CacheCotizaciones())
+    try:
+        suscriptor.suscribir(por_simbolo)
+        limite = time.monotonic() + 30
+        while not suscriptor.ticks and time.monotonic() < limite:
+            time.sleep(0.05)
+        suscriptor.recoger()
+
+        tiempos, cambiados = [], []
+        ticks_inicio = suscriptor.ticks
+        inicio_total = time.perf_counter()
+        while time.perf_counter() - inicio_total < segundos:
+            time.sleep(intervalo_ms / 1000)
+            inicio = time.perf_counter()
+            ticks = suscriptor.recoger()
+            revalorar(resumen, ticks)
+            for simbolo, precio in ticks.items():
+                tabla.actualizar(simbolo, fila_directo(por_simbolo[simbolo], precio))
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            cambiados.append(len(ticks))
+        duracion = time.perf_counter() - inicio_total
+        ticks_recibidos = suscriptor.ticks - ticks_inicio
+    finally:
+        suscriptor.cerrar()
+        servidor.cerrar()
+
+    precios = {a['simbolo']: a['precio_compra'] for a in acciones}
+    inicio = time.perf_counter()
+    valorar(cartera, precios, 1000.0)
+    completa_ms = (time.perf_counter() - inicio) * 1000
+
+    resultado = {
+        'posiciones': posiciones,
+        'ticks_s': round(ticks_recibidos / duracion),
+        'filas_por_recogida': round(statistics.mean(cambiados)) if cambiados else 0,
+        'recogida_p50_ms': round(statistics.median(tiempos), 3),
+        'recogida_p99_ms': round(percentil(tiempos, 99), 3),
+        'valorar_todo_ms': round(completa_ms, 3),
+        'filas_cambiadas': tabla.llamadas_tk - pintadas,  # Filas repintadas por los ticks
+        'errores': suscriptor.errores,
+    }
+    resultado['cumple'] = ticks_recibidos > 0 and resultado['recogida_p99_ms'] <= OBJETIVO_DIRECTO_MS
+    print(f"directo: {resultado['ticks_s']} ticks/s de {posiciones} simbolos; cada {intervalo_ms} ms se recogen "
+          f"{resultado['filas_por_recogida']} filas en p50 {resultado['recogida_p50_ms']:.2f} ms "
+          f"p99 {resultado['recogida_p99_ms']:.2f} ms (objetivo {OBJETIVO_DIRECTO_MS} ms; valorar todo "
+          f"{completa_ms:.2f} ms)")
+    return resultado
+
+
+def bench_vigilancia(simbolos=1_000, sesiones=300, latencia=0.05, repeticiones=5):
+    # Lista de vigilancia con el historico ya guardado: cada llamada a la fuente tarda 'latencia' s,
+    # asi que pedir los lotes en serie o en paralelo es lo que mas se nota
+    aleatorio = np.random.default_rng(1)
+    nombres = [f"V{i}" for i in range(simbolos)]
+    hoy = datetime.now().date()
+    fechas = np.busday_offset(np.datetime64(hoy, 'D'), -np.arange(sesiones, 0, -1), roll='backward').astype(str)
+    cierres = 100 * np.exp(np.cumsum(aleatorio.normal(0, 0.02, (simbolos, sesiones)), axis=1))
+    datos = {'cotizaciones': {s: [round(float(cierres[i, -1]) * (1 + 0.01 * k), 2) for k in range(3)]
+                              for i, s in enumerate(nombres)}}
+
+    directorio = tempfile.mkdtemp(prefix='bench_vigilancia_')
+    historico = HistoricoPrecios(os.path.join(directorio, 'historico.db'))
+    try:
+        for i, simbolo in enumerate(nombres):
+            historico.guardar(simbolo, [(f, c * 1.01, c * 0.99, c * 1.01, c * 0.99, 0.0)
+                                        for f, c in zip(fechas, cierres[i].tolist())])
+        motor = MotorVigilancia(historico)
+
+        def escaneo(en_serie=False):
+            cotizaciones = CacheCotizaciones(FuenteGrabada(datos=datos, latencia=latencia), ttl=0)
+            inicio = time.perf_counter()
+            precios = precios_por_lotes(cotizaciones, nombres, hilos=1 if en_serie else HILOS_VIGILANCIA)
+            resultado = motor.escanear(nombres, precios, hoy)
+            return resultado, time.perf_counter() - inicio
+
+        resultado, primero_s = escaneo()
+        lecturas = motor.lecturas
+        serie_s = escaneo(en_serie=True)[1]
+        tiempos = [escaneo()[1] for _ in range(repeticiones)]
+
+        inicio = time.perf_counter()
+        motor.escanear(nombres, {}, hoy)
+        indicadores_ms = (time.perf_counter() - inicio) * 1000
+        inicio = time.perf_counter()
+        ordenar(resultado, filtrar(resultado, 'rsi<50 cambio>0'), 'rsi', True)
+        filtrar_ms = (time.perf_counter() - inicio) * 1000
+    finally:
+        historico.cerrar()
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    resultado = {
+        'simbolos': simbolos,
+        'sesiones': sesiones,
+        'primer_escaneo_s': round(primero_s, 3),
+        'lecturas_historico': lecturas,
+        'lecturas_al_reescanear': motor.lecturas - lecturas,
+        'reescaneo_p50_s': round(statistics.median(tiempos), 3),
+        'precios_en_serie_s': round(serie_s, 3),
+        'indicadores_ms': round(indicadores_ms, 2),
+        'filtrar_ordenar_ms': round(filtrar_ms, 3),
+    }
+    resultado['cumple'] = resultado['reescaneo_p50_s'] <= OBJETIVO_VIGILANCIA_S and not resultado['lecturas_al_reescanear']
+    print(f"vigilancia: {simbolos} simbolos x {sesiones} sesiones; primer escaneo {primero_s:.2f} s, reescaneo p50 "
+          f"{resultado['reescaneo_p50_s']:.2f} s (objetivo {OBJETIVO_VIGILANCIA_S} s; con los lotes de "
+          f"{LOTE_VIGILANCIA} en serie {serie_s:.2f} s); indicadores {indicadores_ms:.1f} ms, filtrar y ordenar "
+          f"{filtrar_ms:.2f} ms")
+    return resultado
+
+
+def bench_simbolos(simbolos=10_000, consultas=2_000, consultados=20, latencia=0.3):
+    # Autocompletado sobre un indice de 'simbolos' tickers con nombre, y datos de un simbolo con
+    # Ticker.info tardando 'latencia' s: la primera vez se espera a la fuente, despues no
+    aleatorio = random.Random(1)
+    palabras = ['banco', 'energía', 'telefónica', 'global', 'holdings', 'industrial', 'tech', 'pharma', 'capital',
+                'minera', 'seguros', 'inmobiliaria', 'renovables', 'digital', 'foods', 'motors', 'airlines', 'retail']
+    nombres = {}
+    for i in range(simbolos):
+        ticker = ''.join(aleatorio.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') for _ in range(aleatorio.randint(2, 4)))
+        ticker += aleatorio.choice(['', '.MC', '.PA', '.DE', '-EUR'])
+        nombres[f"{ticker}{i}" if ticker in nombres else ticker] = \
+            ' '.join(aleatorio.sample(palabras, 2)).title() + f" {i}"
+    lista = list(nombres)
+
+    inicio = time.perf_counter()
+    indice = IndiceSimbolos()
+    indice.agregar_varios(nombres.items())
+    construir_ms = (time.perf_counter() - inicio) * 1000
+
+    # Lo que se va tecleando: prefijos de tickers, palabras del nombre y trozos de en medio
+    textos = []
+    for _ in range(consultas):
+        simbolo = aleatorio.choice(lista)
+        tipo = aleatorio.random()
+        if tipo < 0.5:
+            textos.append(simbolo[:aleatorio.randint(1, len(simbolo))])
+        elif tipo < 0.8:
+            palabra = aleatorio.choice(nombres[simbolo].split())
+            textos.append(palabra[:aleatorio.randint(2, len(palabra))])
+        else:
+            nombre = nombres[simbolo].lower()
+            desde = aleatorio.randrange(max(1, len(nombre) - 4))
+            textos.append(nombre[desde:desde + 4])
+    tiempos = []
+    for texto in textos:
+        inicio = time.perf_counter()
+        indice.buscar(texto)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    directorio = tempfile.mkdtemp(prefix='bench_simbolos_')
+    try:
+        ruta = os.path.join(directorio, 'simbolos.json')
+        informacion = {s: {'longName': nombres[s], 'currency': 'EUR', 'fullExchangeName': 'Madrid', 'quoteType': 'EQUITY'}
+                       for s in lista[:consultados]}
+        fuente = FuenteGrabada(datos={'informacion': informacion}, latencia=latencia)
+        metadatos = MetadatosSimbolos(ruta)
+        primera = []
+        for simbolo in informacion:
+            inicio = time.perf_counter()
+            metadatos.consultar(simbolo, fuente)
+            primera.append((time.perf_counter() - inicio) * 1000)
+        # Las repetidas, en la misma sesion y tras volver a abrir el programa
+        repetidas = []
+        for abierto in (metadatos, MetadatosSimbolos(ruta)):
+            for simbolo in informacion:
+                inicio = time.perf_counter()
+                abierto.consultar(simbolo, fuente)
+                repetidas.append((time.perf_counter() - inicio) * 1000)
+        llamadas = fuente.llamadas
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    resultado = {
+        'simbolos': simbolos,
+        'construir_indice_ms': round(construir_ms, 1),
+        'buscar_p50_ms': round(percentil(tiempos, 50), 3),
+        'buscar_p99_ms': round(percentil(tiempos, 99), 3),
+        'datos_primera_p50_ms': round(percentil(primera, 50), 1),
+        'datos_repetida_p99_ms': round(percentil(repetidas, 99), 3),
+        'llamadas_fuente': llamadas,
+    }
+    resultado['cumple'] = (resultado['buscar_p99_ms'] <= OBJETIVO_BUSQUEDA_MS
+                           and resultado['datos_repetida_p99_ms'] <= OBJETIVO_BUSQUEDA_MS and llamadas == consultados)
+    print(f"simbolos: indice de {simbolos} en {construir_ms:.0f} ms; sugerencias p50 {resultado['buscar_p50_ms']:.3f} ms, "
+          f"p99 {resultado['buscar_p99_ms']:.3f} ms; datos de un simbolo {resultado['datos_primera_p50_ms']:.0f} ms la "
+          f"primera vez y p99 {resultado['datos_repetida_p99_ms']:.3f} ms las siguientes (objetivo "
+          f"{OBJETIVO_BUSQUEDA_MS} ms); {llamadas} llamadas a la fuente")
+    return resultado
+
+
+ESCENARIOS = {
+    'agregar_registro': bench_agregar_registro,
+    'valoracion': bench_valoracion,
+    'rentabilidad': bench_rentabilidad,
+    'arranque': bench_arranque,
+    'red': bench_red,
+    'refresco': bench_refresco,
+    'ciclo': bench_ciclo,
+    'medidas': bench_medidas,
+    'importacion': bench_importacion,
+    'lotes': bench_lotes,
+    'directo': bench_directo,
+    'vigilancia': bench_vigilancia,
+    'simbolos': bench_simbolos,
+}
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORIO, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def aplanar(valor, prefijo=''):
+    # {'ciclo': [{'registros': 10, 'total_p50_ms': 1.0}]} -> {'ciclo.10.total_p50_ms': 1.0}
+    if isinstance(valor, dict):
+        claves = {}
+        for clave, interior in valor.items():
+            claves.update(aplanar(interior, f"{prefijo}.{clave}" if prefijo else clave))
+        return claves
+    if isinstance(valor, list):
+        claves = {}
+        for i, interior in enumerate(valor):
+            nombre = interior.get('registros', i) if isinstance(interior, dict) else i
+            claves.update(aplanar(interior, f"{prefijo}.{nombre}"))
+        return claves
+    return {prefijo: valor}
+
+
+def comparar(anteriores, actuales):
+    # Diferencias en tiempos y memoria frente a otra ejecucion (por ejemplo, la de otro commit)
+    antes = aplanar(anteriores['escenarios'])
+    ahora = aplanar(actuales['escenarios'])
+    print(f"\nComparado con {anteriores.get('revision') or 'la ejecucion anterior'}:")
+    for clave, valor in ahora.items():
+        previo = antes.get(clave)
+        if not (clave.endswith('_ms') or clave.endswith('_mb')) or not isinstance(previo, (int, float)) or not previo:
+            continue
+        if not isinstance(valor, (int, float)):
+            continue
+        print(f"  {clave}: {previo} -> {valor} ({(valor - previo) / previo * 100:+.1f}%)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Medidas de rendimiento del gestor de inversiones")
+    parser.add_argument('escenarios', nargs='*', metavar='escenario',
+                        help=f"Por defecto, todos: {', '.join(ESCENARIOS)}")
+    parser.add_argument('--json', help="Guarda los resultados en este archivo")
+    parser.add_argument('--comparar', help="Resultados de otra ejecucion (--json) con los que comparar")
+    args = parser.parse_args()
+    desconocidos = [nombre for nombre in args.escenarios if nombre not in ESCENARIOS]
+    if desconocidos:
+        parser.error(f"escenario desconocido: {', '.join(desconocidos)}")
+
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'revision': revision(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'escenarios': {},
+    }
+    fallos = []
+    for nombre in args.escenarios or ESCENARIOS:
+        resultado = ESCENARIOS[nombre]()
+        informe['escenarios'][nombre] = resultado
+        if isinstance(resultado, dict) and resultado.get('cumple') is False:
+            fallos.append(nombre)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+    if args.comparar:
+        with open(args.comparar, 'r', encoding='utf-8') as f:
+            comparar(json.load(f), informe)
+    if fallos:
+        print(f"No cumplen su objetivo: {', '.join(fallos)}")
+        sys.exit(1)
@@ -0,0 +1,31 @@
+'''
+Rutas y constantes compartidas por la interfaz grafica y la consola.
+
+No importa tkinter ni yfinance, para que la consola pueda arrancar en un servidor sin pantalla.
+'''
+
+import os
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent 
+DB_FILE = os.path.join(SCRIPT_DIR, "basedatosCY.csv")
+ACCIONES_FILE = os.path.join(SCRIPT_DIR, "accionesCY.csv")
+EFECTIVO_FILE = os.path.join(SCRIPT_DIR, "efectivoCY.txt")
+MONEDAS_FILE = os.path.join(SCRIPT_DIR, "monedasCY.json")
+SQLITE_FILE = os.path.join(SCRIPT_DIR, "carteraCY.db")
+HISTORICO_FILE = os.path.join(SCRIPT_DIR, "historicoCY.db")
+PRECIOS_FILE = os.path.join(SCRIPT_DIR, "preciosCY.json")  # Ultimo precio conocido de cada simbolo
+VIGILANCIA_FILE = os.path.join(SCRIPT_DIR, "vigilanciaCY.json")  # Simbolos de la pestaña de vigilancia (por defecto, lista_acciones)
+METADATOS_FILE = os.path.join(SCRIPT_DIR, "simbolosCY.json")  # Nombre, moneda, mercado y tipo de cada simbolo consultado
+FUENTE_PRECIOS = 'yahoo'  # 'yahoo' o la ruta de una grabacion .json (consola.py grabar) para trabajar sin red
+FLUJO_PRECIOS = 'yahoo'  # Cotizaciones en directo: 'yahoo', la URL ws:// de un servidor de repeticion (consola.py emitir) o None para solo sondear
+ALMACENAMIENTO = 'csv'  # 'csv' (archivos de texto) o 'sqlite' (SQLITE_FILE, se importa de los CSV la primera vez)
+METODO_COSTE = 'fifo'  # Precio de compra de lo que queda tras vender: 'fifo' (el de Hacienda) o 'medio'
+VALID_TRANS = ['s', 'n']
+MESES = {
+    '01': 'Enero', '02': 'Febrero', '03': 'Marzo', '04': 'Abril',
+    '05': 'Mayo', '06': 'Junio', '07': 'Julio', '08': 'Agosto',
+    '09': 'Septiembre', '10': 'Octubre', '11': 'Noviembre', '12': 'Diciembre'
+}
+
+lista_acciones = ['BTC-USD', 'ETH-USD', 'XRP-USD', 'ADA-USD', 'NVDA', 'TSLA', 'AAPL', 'MSFT', 'AMZN', 'SAN.MC', 'BBVA.MC', 'ITX.MC', 'REP.MC', 'IBE.MC', 'SPY', '^STOXX50E']
@@ -0,0 +1,375 @@
+'''
+Gestor de inversiones sin interfaz grafica.
+
+Usa los mismos archivos y el mismo codigo de datos y valoracion que seguidor_acciones.py, pero no
+importa tkinter, de modo que se puede lanzar desde cron en un servidor sin pantalla.
+
+Ejemplos:
+    python consola.py valorar
+    python consola.py valorar --formato json --salida resumen.json
+    python consola.py aportar 15/03/2025 250 --trans n
+    python consola.py efectivo --ingresar 100
+    python consola.py comprar SAN.MC 100 3.85 --fecha 02/01/2025
+    python consola.py vender SAN.MC 40 4.10
+    python consola.py importar extracto.csv
+    python consola.py importar posiciones.csv --acciones
+    python consola.py exportar copia/
+    python consola.py grabar grabacion.json --veces 5 --dias 30
+    python consola.py --fuente grabacion.json valorar
+    python consola.py emitir grabacion.json --puerto 8765 --ritmo 200
+    python consola.py vigilar --filtro "rsi<30" --orden rsi
+    python consola.py vigilar --agregar MSFT NFLX
+'''
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from almacen import abrir_repositorio, exportar_csv
+from configuracion import (ACCIONES_FILE, ALMACENAMIENTO, DB_FILE, EFECTIVO_FILE, FUENTE_PRECIOS, HISTORICO_FILE,
+                           METODO_COSTE, MONEDAS_FILE, PRECIOS_FILE, SQLITE_FILE, VALID_TRANS, VIGILANCIA_FILE,
+                           lista_acciones)
+from vigilancia import COLUMNAS, ListaVigilancia, formatear_fila, normalizar_simbolo, precios_por_lotes
+
+CAMPOS_CSV = ['simbolo', 'cantidad', 'valor_compra', 'valor_actual', 'beneficio', 'porcentaje', 'precio_del']
+
+
+def abrir():
+    repo = abrir_repositorio(ALMACENAMIENTO, DB_FILE, ACCIONES_FILE, EFECTIVO_FILE, SQLITE_FILE, METODO_COSTE)
+    repo.inicializar()
+    return repo
+
+
+def cerrar(repo):
+    # Igual que al cerrar la ventana: dejar los archivos al dia
+    try:
+        repo.compactar()
+    except Exception as e:
+        print(f"Error al compactar los datos: {str(e)}", file=sys.stderr)
+    if hasattr(repo, 'cerrar'):
+        repo.cerrar()
+
+
+def calcular_resumen(repo, fuente=FUENTE_PRECIOS):
+    # Las descargas solo se importan aqui: aportar o mover efectivo no necesitan red
+    from cotizaciones import CacheCotizaciones, MonedasInstrumentos, UltimosPrecios, precios_con_respaldo
+    from fuentes import crear_fuente
+    from historico import HistoricoPrecios
+    from rentabilidad import MotorRentabilidad
+    from valoracion import MotorValoracion, valorar
+
+    cotizaciones = CacheCotizaciones(crear_fuente(fuente))
+    monedas = MonedasInstrumentos(MONEDAS_FILE)
+    cartera = MotorValoracion().preparar(repo.registros(), repo.acciones(), repo.movimientos())
+    precios, antiguos = precios_con_respaldo(cotizaciones, cartera.simbolos, monedas, UltimosPrecios(PRECIOS_FILE))
+    monedas.guardar()
+    resultado = valorar(cartera, precios, repo.cargar_efectivo())
+    resultado['antiguos'] = antiguos
+    resultado['realizado'] = repo.realizado()
+
+    historico = HistoricoPrecios(HISTORICO_FILE)
+    try:
+        resultado['rentabilidad'] = MotorRentabilidad(historico, monedas).serie(cartera).rango()
+    except Exception as e:
+        print(f"Error al calcular la rentabilidad: {str(e)}", file=sys.stderr)
+        resultado['rentabilidad'] = None
+    finally:
+        historico.cerrar()
+    return resultado
+
+
+def resumen_exportable(resultado):
+    # Solo tipos de Python: los arrays de la valoracion no se pueden pasar a JSON tal cual
+    acciones = []
+    for i, simbolo in enumerate(resultado['simbolos']):
+        con_precio = bool(resultado['con_precio'][i])
+        acciones.append({
+            'simbolo': simbolo,
+            'cantidad': float(resultado['cantidades'][i]),
+            'valor_compra': round(float(resultado['valor_compra'][i]), 2),
+            'valor_actual': round(float(resultado['valor_actual'][i]), 2) if con_precio else None,
+            'beneficio': round(float(resultado['beneficio_accion'][i]), 2) if con_precio else None,
+            'porcentaje': round(float(resultado['porcentaje_accion'][i]), 2) if con_precio else None,
+            # Fecha del precio guardado si no se pudo descargar ahora
+            'precio_del': (datetime.fromtimestamp(resultado['antiguos'][simbolo]).isoformat(timespec='seconds')
+                           if simbolo in resultado['antiguos'] else None),
+        })
+    rentabilidad = resultado.get('rentabilidad')
+    if rentabilidad:
+        rentabilidad = dict(rentabilidad, desde=rentabilidad['desde'].isoformat(),
+                            hasta=rentabilidad['hasta'].isoformat())
+    return {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'patrimonio': round(resultado['patrimonio'], 2),
+        'efectivo': round(resultado['efectivo'], 2),
+        'total_invertido': round(resultado['total_invertido'], 2),
+        'valor_acciones': round(resultado['valor_acciones'], 2),
+        'balance': round(resultado['balance'], 2),
+        'porcentaje': round(resultado['porcentaje'], 2),
+        'beneficio': round(resultado['beneficio'], 2),
+        'realizado': {metodo: round(valor, 2) for metodo, valor in resultado['realizado'].items()},
+        'rentabilidad': rentabilidad,
+        'acciones': acciones,
+    }
+
+
+def formatear(resumen, formato):
+    if formato == 'json':
+        return json.dumps(resumen, ensure_ascii=False, indent=2) + "\n"
+    if formato == 'csv':
+        salida = io.StringIO()
+        writer = csv.DictWriter(salida, fieldnames=CAMPOS_CSV, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(resumen['acciones'])
+        con_precio = [a for a in resumen['acciones'] if a['valor_actual'] is not None]
+        writer.writerow({'simbolo': 'TOTAL', 'valor_compra': round(sum(a['valor_compra'] for a in con_precio), 2),
+                         'valor_actual': resumen['valor_acciones'], 'beneficio': resumen['beneficio']})
+        return salida.getvalue()
+
+    lineas = [
+        f"Patrimonio total: {resumen['patrimonio']:.2f} €",
+        f"Efectivo disponible: {resumen['efectivo']:.2f} €",
+        f"Total invertido: {resumen['total_invertido']:.2f} €",
+        f"Valor total acciones: {resumen['valor_acciones']:.2f} €",
+        f"Balance total: {resumen['balance']:.2f} € ({resumen['porcentaje']:.2f}%)",
+        f"Beneficio total: {resumen['beneficio']:.2f} €",
+        f"Beneficio realizado en ventas: {resumen['realizado']['fifo']:.2f} € (FIFO) | "
+        f"{resumen['realizado']['medio']:.2f} € (coste medio)",
+    ]
+    rentabilidad = resumen['rentabilidad']
+    if rentabilidad:
+        if rentabilidad['twr'] is None:
+            lineas.append(f"TWR desde {rentabilidad['desde']}: sin histórico")
+        else:
+            lineas.append(f"TWR desde {rentabilidad['desde']}: {rentabilidad['twr'] * 100:.2f}%")
+        if rentabilidad['xirr'] is not None:
+            lineas.append(f"TIR anual: {rentabilidad['xirr'] * 100:.2f}%")
+    for accion in resumen['acciones']:
+        if accion['valor_actual'] is None:
+            lineas.append(f"{accion['simbolo']}: sin cotización disponible")
+        else:
+            lineas.append(f"{accion['simbolo']}: {accion['cantidad']:.5f} acciones | "
+                          f"Actual: {accion['valor_actual']:.2f} € | Beneficio: {accion['beneficio']:.2f} € "
+                          f"({accion['porcentaje']:.2f}%)"
+                          + (f" [precio guardado del {accion['precio_del']}]" if accion['precio_del'] else ""))
+    return "\n".join(lineas) + "\n"
+
+
+def comando_valorar(repo, args):
+    texto = formatear(resumen_exportable(calcular_resumen(repo, args.fuente)), args.formato)
+    if args.salida:
+        with open(args.salida, 'w', newline='', encoding='utf-8') as f:
+            f.write(texto)
+    else:
+        sys.stdout.write(texto)
+
+
+def comando_aportar(repo, args):
+    # Mismas comprobaciones que el dialogo de añadir registro
+    fecha = datetime.strptime(args.fecha, '%d/%m/%Y')
+    if args.cantidad <= 0:
+        raise ValueError("La cantidad debe ser positiva")
+    repo.agregar_registro({
+        'd': f"{fecha.day:02d}",
+        'm': f"{fecha.month:02d}",
+        'a': str(fecha.year),
+        'cantidad': args.cantidad,
+        'trans': args.trans,
+    })
+    print(f"Registro añadido: {args.fecha} {args.cantidad:.2f} €")
+
+
+def comando_efectivo(repo, args):
+    efectivo = repo.cargar_efectivo()
+    if args.ingresar is not None:
+        efectivo += args.ingresar
+    elif args.retirar is not None:
+        if args.retirar > efectivo:
+            raise ValueError("No hay suficiente efectivo")
+        efectivo -= args.retirar
+    elif args.establecer is not None:
+        efectivo = args.establecer
+    else:
+        print(f"Efectivo disponible: {efectivo:.2f} €")
+        return
+    repo.guardar_efectivo(efectivo)
+    print(f"Operación realizada. Nuevo saldo: {efectivo:.2f} €")
+
+
+def comando_movimiento(repo, args):
+    fecha = datetime.strptime(args.fecha, '%d/%m/%Y') if args.fecha else datetime.now()
+    movimiento = repo.agregar_movimiento({
+        'simbolo': args.simbolo.upper(),
+        'd': f"{fecha.day:02d}",
+        'm': f"{fecha.month:02d}",
+        'a': str(fecha.year),
+        'tipo': args.tipo,
+        'cantidad': args.cantidad,
+        'precio': args.precio,
+    })
+    posicion = repo.posicion(movimiento['simbolo'])
+    print(f"{args.tipo.capitalize()} anotada. {movimiento['simbolo']}: {posicion['cantidad']:.5f} acciones, "
+          f"precio de compra {posicion['precio_compra']:.4f} €, realizado {posicion['realizado']:.2f} €")
+
+
+def comando_importar(repo, args):
+    from importador import importar
+    importacion = importar(repo, args.archivo, 'acciones' if args.acciones else 'registros')
+    print(importacion.resumen())
+
+
+def comando_exportar(repo, args):
+    # Copia en CSV con los mismos nombres que los archivos de datos; sirve tambien para volver de SQLite a CSV
+    os.makedirs(args.carpeta, exist_ok=True)
+    registros, movimientos = exportar_csv(repo, *(os.path.join(args.carpeta, os.path.basename(ruta))
+                                                  for ruta in (DB_FILE, ACCIONES_FILE, EFECTIVO_FILE)))
+    print(f"Exportados {registros} registros y {movimientos} movimientos a {args.carpeta}")
+
+
+def comando_grabar(repo, args):
+    # Graba cotizaciones reales de la cartera (y sus divisas) para reproducirlas luego con --fuente
+    from cotizaciones import moneda_y_fraccion, par_euro
+    from fuentes import FuenteGrabadora, FuenteYahoo
+
+    grabadora = FuenteGrabadora(FuenteYahoo())
+    simbolos = list(dict.fromkeys(a['simbolo'] for a in repo.acciones()))
+    monedas = grabadora.monedas(simbolos)
+    bases = {moneda_y_fraccion(m)[0] for m in monedas.values()}
+    simbolos += sorted(par_euro(m) for m in bases if m != 'EUR')
+
+    for vez in range(args.veces):
+        if vez:
+            time.sleep(args.intervalo)
+        grabadora.descargar(simbolos)
+    if args.dias:
+        hoy = date.today()
+        grabadora.historico(simbolos, hoy - timedelta(days=args.dias), hoy)
+    grabadora.guardar(args.salida)
+    print(f"Grabados {len(grabadora.datos['cotizaciones'])} símbolos en {args.salida}")
+
+
+def comando_emitir(repo, args):
+    # Sustituto local del streamer de Yahoo: la interfaz lo usa con FLUJO_PRECIOS = 'ws://127.0.0.1:<puerto>'
+    from directo import ServidorRepeticion
+
+    servidor = ServidorRepeticion(args.grabacion, ritmo=args.ritmo or None, puerto=args.puerto)
+    print(f"Emitiendo {args.grabacion} en ws://127.0.0.1:{args.puerto} (Ctrl+C para parar)")
+    try:
+        servidor.servir()
+    except KeyboardInterrupt:
+        print(f"Enviados {servidor.enviados} ticks")
+
+
+def comando_vigilar(repo, args):
+    # La misma lista y los mismos indicadores que la pestaña de vigilancia
+    from cotizaciones import CacheCotizaciones
+    from fuentes import crear_fuente
+    from historico import HistoricoPrecios
+    from indicadores import MotorVigilancia, filtrar, ordenar
+
+    lista = ListaVigilancia(VIGILANCIA_FILE, lista_acciones)
+    if args.agregar:
+        lista.agregar(args.agregar)
+    if args.quitar:
+        lista.quitar([normalizar_simbolo(s) for s in args.quitar])
+    simbolos = lista.simbolos()
+
+    cotizaciones = CacheCotizaciones(crear_fuente(args.fuente))
+    historico = HistoricoPrecios(HISTORICO_FILE)
+    try:
+        motor = MotorVigilancia(historico)
+        motor.completar(simbolos, cotizaciones.fuente)
+        resultado = motor.escanear(simbolos, precios_por_lotes(cotizaciones, simbolos))
+    finally:
+        historico.cerrar()
+
+    posiciones = ordenar(resultado, filtrar(resultado, args.filtro), args.orden, args.desc)
+    filas = [[titulo for _, titulo, _ in COLUMNAS]] + [list(formatear_fila(resultado, i)) for i in posiciones]
+    anchos = [max(len(str(fila[j])) for fila in filas) for j in range(len(COLUMNAS))]
+    for fila in filas:
+        print("  ".join(str(valor).rjust(ancho) for valor, ancho in zip(fila, anchos)))
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Gestor de inversiones sin interfaz gráfica")
+    parser.add_argument('--fuente', default=FUENTE_PRECIOS, help="'yahoo' o una grabación .json para trabajar sin red")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    valorar = comandos.add_parser('valorar', help="Valora la cartera con los precios actuales")
+    valorar.add_argument('--formato', choices=['texto', 'json', 'csv'], default='texto')
+    valorar.add_argument('--salida', help="Archivo donde guardar el resumen (por defecto, la pantalla)")
+    valorar.set_defaults(funcion=comando_valorar)
+
+    aportar = comandos.add_parser('aportar', help="Añade un registro de aportación")
+    aportar.add_argument('fecha', help="DD/MM/AAAA")
+    aportar.add_argument('cantidad', type=float, help="Cantidad en €")
+    aportar.add_argument('--trans', choices=VALID_TRANS, default='s', help="Transacción realizada (s/n)")
+    aportar.set_defaults(funcion=comando_aportar)
+
+    efectivo = comandos.add_parser('efectivo', help="Consulta o ajusta el efectivo disponible")
+    operacion = efectivo.add_mutually_exclusive_group()
+    operacion.add_argument('--ingresar', type=float)
+    operacion.add_argument('--retirar', type=float)
+    operacion.add_argument('--establecer', type=float)
+    efectivo.set_defaults(funcion=comando_efectivo)
+
+    for tipo in ('compra', 'venta'):
+        movimiento = comandos.add_parser('comprar' if tipo == 'compra' else 'vender', help=f"Anota una {tipo} de acciones")
+        movimiento.add_argument('simbolo')
+        movimiento.add_argument('cantidad', type=float)
+        movimiento.add_argument('precio', type=float, help="Precio por acción en €")
+        movimiento.add_argument('--fecha', help="DD/MM/AAAA (por defecto, hoy)")
+        movimiento.set_defaults(funcion=comando_movimiento, tipo=tipo)
+
+    importar = comandos.add_parser('importar', help="Importa un extracto CSV del broker o del exchange")
+    importar.add_argument('archivo', help="CSV con fecha e importe (o d, m y a); separador , ; o tabulador")
+    importar.add_argument('--acciones', action='store_true', help="El archivo es de posiciones: símbolo, cantidad y precio")
+    importar.set_defaults(funcion=comando_importar)
+
+    exportar = comandos.add_parser('exportar', help="Copia los datos de la cartera en archivos CSV")
+    exportar.add_argument('carpeta', help="Carpeta de destino (distinta de la de los datos)")
+    exportar.set_defaults(funcion=comando_exportar)
+
+    grabar = comandos.add_parser('grabar', help="Graba cotizaciones de la cartera para reproducirlas sin red")
+    grabar.add_argument('salida', help="Archivo .json de la grabación")
+    grabar.add_argument('--veces', type=int, default=1, help="Descargas a grabar")
+    grabar.add_argument('--intervalo', type=float, default=15, help="Segundos entre descargas")
+    grabar.add_argument('--dias', type=int, default=0, help="Días de histórico diario a grabar")
+    grabar.set_defaults(funcion=comando_grabar)
+
+    emitir = comandos.add_parser('emitir', help="Reproduce una grabación como cotizaciones en directo por WebSocket")
+    emitir.add_argument('grabacion', help="Archivo .json de 'grabar'")
+    emitir.add_argument('--puerto', type=int, default=8765)
+    emitir.add_argument('--ritmo', type=float, default=10, help="Ticks por segundo a cada cliente (0: sin pausa)")
+    emitir.set_defaults(funcion=comando_emitir)
+
+    vigilar = comandos.add_parser('vigilar', help="Indicadores de la lista de vigilancia")
+    vigilar.add_argument('--agregar', nargs='+', metavar='SIMBOLO', help="Añade símbolos a la lista")
+    vigilar.add_argument('--quitar', nargs='+', metavar='SIMBOLO', help="Quita símbolos de la lista")
+    vigilar.add_argument('--filtro', default='', help="p. ej. \"rsi<30 cambio>2 .MC\"")
+    vigilar.add_argument('--orden', default='simbolo', choices=[clave for clave, _, _ in COLUMNAS])
+    vigilar.add_argument('--desc', action='store_true', help="Orden descendente")
+    vigilar.set_defaults(funcion=comando_vigilar)
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    repo = abrir()
+    try:
+        args.funcion(repo, args)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+    finally:
+        cerrar(repo)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+'''
+Obtencion y cache de cotizaciones.
+
+Aqui vive todo lo relacionado con pedir precios a Yahoo Finance, separado de la interfaz
+para que las pestañas compartan los mismos datos en lugar de descargarlos cada una por su lado.
+'''
+
+import importlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from almacen import escribir_atomico
+from fuentes import FuenteYahoo
+from medidas import Medidor
+
+# Segundos que una cotizacion se considera valida. Menor que el ciclo de refresco (15 s)
+# para que cada ciclo descargue datos nuevos, pero las pestañas de un mismo ciclo compartan precio.
+TTL_COTIZACION = 10
+TTL_DIVISA = 60  # Los tipos de cambio se mueven poco; se reutilizan durante varios ciclos
+MAX_COTIZACIONES = 2048  # Cabe la lista de vigilancia entera sin expulsar los precios de la cartera
+HILOS_PRECIOS = 4
+
+# Monedas que Yahoo da en centimos: se convierten a la moneda principal
+MONEDAS_FRACCION = {'GBp': ('GBP', 100), 'GBX': ('GBP', 100), 'ZAc': ('ZAR', 100), 'ILA': ('ILS', 100)}
+# Moneda supuesta por sufijo cuando Yahoo no responde (no se guarda en disco)
+SUFIJOS_MONEDA = {
+    '-USD': 'USD', '-EUR': 'EUR', '.MC': 'EUR', '.PA': 'EUR', '.DE': 'EUR', '.AS': 'EUR',
+    '.MI': 'EUR', '.BR': 'EUR', '.LS': 'EUR', '.L': 'GBp', '.SW': 'CHF', '.T': 'JPY',
+    '.HK': 'HKD', '.TO': 'CAD', '.AX': 'AUD',
+}
+
+
+class CacheCotizaciones:
+    # Segura entre hilos: la usan a la vez la interfaz y el trabajador de precios
+    def __init__(self, fuente=None, ttl=TTL_COTIZACION, max_entradas=MAX_COTIZACIONES, reloj=time.monotonic,
+                 ttl_divisas=TTL_DIVISA):
+        self.fuente = fuente if fuente is not None else FuenteYahoo()
+        self.ttl = ttl
+        self.ttl_divisas = ttl_divisas
+        self.max_entradas = max_entradas
+        self._reloj = reloj
+        self._datos = OrderedDict()  # simbolo -> (instante, precio), en orden de uso
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.descargas = 0  # Llamadas a la fuente
+
+    def obtener(self, simbolo):
+        precios = self.obtener_varios([simbolo])
+        if simbolo not in precios:
+            raise ValueError(f"Sin datos para {simbolo}")
+        return precios[simbolo]
+
+    def obtener_varios(self, simbolos):
+        ahora = self._reloj()
+        resultado = {}
+        pendientes = []
+        with self._lock:
+            for simbolo in dict.fromkeys(simbolos):
+                entrada = self._datos.get(simbolo)
+                if entrada is not None and ahora - entrada[0] < self._ttl(simbolo):
+                    self.aciertos += 1
+                    self._datos.move_to_end(simbolo)
+                    resultado[simbolo] = entrada[1]
+                else:
+                    self.fallos += 1
+                    pendientes.append(simbolo)
+
+        # Todo lo que falta se pide de una vez, sin bloquear la cache mientras tanto
+        if pendientes:
+            with self._lock:
+                self.descargas += 1
+            for simbolo, precio in self.fuente.descargar(pendientes).items():
+                self.guardar(simbolo, precio, ahora)
+                resultado[simbolo] = precio
+        return resultado
+
+    def _ttl(self, simbolo):
+        return self.ttl_divisas if simbolo.endswith('=X') else self.ttl
+
+    def guardar(self, simbolo, precio, instante=None):
+        with self._lock:
+            self._datos[simbolo] = (self._reloj() if instante is None else instante, precio)
+            self._datos.move_to_end(simbolo)
+            # Expulsar las menos usadas recientemente
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def invalidar(self, simbolo=None):
+        with self._lock:
+            if simbolo is None:
+                self._datos.clear()
+            else:
+                self._datos.pop(simbolo, None)
+
+    def estadisticas(self):
+        with self._lock:
+            total = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'descargas': self.descargas,
+                'entradas': len(self._datos),
+                'tasa_aciertos': self.aciertos / total if total else 0.0,
+            }
+
+
+def par_euro(moneda):
+    # Cotiza cuantas unidades de la moneda da un euro
+    return f"EUR{moneda}=X"
+
+
+def moneda_por_sufijo(simbolo):
+    for sufijo, moneda in SUFIJOS_MONEDA.items():
+        if simbolo.endswith(sufijo):
+            return moneda
+    return 'USD'
+
+
+class MonedasInstrumentos:
+    # Moneda de cotizacion de cada simbolo. Se pregunta a la fuente una sola vez y se guarda en disco.
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        self._monedas = {}
+        self._sin_respuesta = set()  # No se vuelven a preguntar en esta sesion
+        self._lock = threading.Lock()
+        if ruta and os.path.exists(ruta):
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    self._monedas = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error al leer monedas guardadas: {str(e)}")
+
+    def moneda(self, simbolo):
+        return self._monedas.get(simbolo) or moneda_por_sufijo(simbolo)
+
+    def resolver(self, simbolos, fuente):
+        with self._lock:
+            desconocidos = [s for s in simbolos if s not in self._monedas and s not in self._sin_respuesta]
+        if not desconocidos:
+            return
+        nuevas = fuente.monedas(desconocidos)
+        with self._lock:
+            self._sin_respuesta.update(s for s in desconocidos if s not in nuevas)
+            if not nuevas:
+                return
+            self._monedas.update(nuevas)
+            self.guardar()
+
+    def guardar(self):
+        if not self.ruta:
+            return
+        try:
+            datos = json.dumps(self._monedas, indent=1, sort_keys=True)
+            escribir_atomico(self.ruta, lambda f: f.write(datos))
+        except OSError as e:
+            print(f"Error al guardar monedas: {str(e)}")
+
+
+class UltimosPrecios:
+    # Ultimo precio en € descargado de cada simbolo y cuando se obtuvo. Se guarda en disco para
+    # tener algo que enseñar al arrancar y cuando Yahoo no responde.
+    def __init__(self, ruta=None, reloj=time.time):
+        self.ruta = ruta
+        self.reloj = reloj
+        self._precios = {}  # simbolo -> [precio, instante]
+        self._lock = threading.Lock()
+        if ruta and os.path.exists(ruta):
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    self._precios = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error al leer los últimos precios: {str(e)}")
+
+    def obtener(self, simbolo):
+        # (precio, instante) o None si nunca se ha descargado
+        with self._lock:
+            guardado = self._precios.get(simbolo)
+        return tuple(guardado) if guardado else None
+
+    def actualizar(self, precios, instante=None):
+        if not precios:
+            return
+        instante = instante or self.reloj()
+        with self._lock:
+            for simbolo, precio in precios.items():
+                self._precios[simbolo] = [precio, instante]
+            self.guardar()
+
+    def guardar(self):
+        if not self.ruta:
+            return
+        try:
+            datos = json.dumps(self._precios, separators=(',', ':'), sort_keys=True)
+            escribir_atomico(self.ruta, lambda f: f.write(datos))
+        except OSError as e:
+            print(f"Error al guardar los últimos precios: {str(e)}")
+
+
+def moneda_y_fraccion(moneda):
+    # ('GBP', 100) para 'GBp'; (moneda, 1) para el resto
+    return MONEDAS_FRACCION.get(moneda, (moneda, 1))
+
+
+def pares_necesarios(simbolos, monedas):
+    # Pares EURxxx=X para convertir a euros los simbolos dados
+    bases = {moneda_y_fraccion(monedas.moneda(s))[0] for s in simbolos}
+    return sorted(par_euro(m) for m in bases if m != 'EUR')
+
+
+def tasas_euro(cotizaciones, monedas):
+    # {moneda: unidades por euro} para cada moneda pedida. Si Yahoo no tiene el par directo
+    # contra el euro se calcula el cruzado a traves del dolar.
+    tasas = {'EUR': 1.0}
+    cierres = cotizaciones.obtener_varios([par_euro(m) for m in monedas if m != 'EUR'])
+    for moneda in monedas:
+        if par_euro(moneda) in cierres:
+            tasas[moneda] = cierres[par_euro(moneda)]
+
+    faltan = [m for m in monedas if m not in tasas]
+    if faltan:
+        cruces = cotizaciones.obtener_varios([par_euro('USD')] + [f"USD{m}=X" for m in faltan])
+        eur_usd = cruces.get(par_euro('USD'))
+        for moneda in faltan:
+            usd_moneda = cruces.get(f"USD{moneda}=X")
+            if eur_usd and usd_moneda:
+                tasas[moneda] = eur_usd * usd_moneda
+    return tasas
+
+
+def precios_en_euros(cotizaciones, simbolos, monedas):
+    # Devuelve {simbolo: precio en €}: una descarga para los simbolos y otra para los pares de
+    # divisas que necesiten, cada par una sola vez. Los simbolos sin datos no aparecen en el resultado.
+    simbolos = list(dict.fromkeys(simbolos))
+    monedas.resolver(simbolos, cotizaciones.fuente)
+
+    moneda_de = {s: moneda_y_fraccion(monedas.moneda(s)) for s in simbolos}
+
+    cierres = cotizaciones.obtener_varios(simbolos)
+    tasas = tasas_euro(cotizaciones, {m for m, _ in moneda_de.values()})
+
+    precios = {}
+    for simbolo in simbolos:
+        cierre = cierres.get(simbolo)
+        moneda, fraccion = moneda_de[simbolo]
+        tasa = tasas.get(moneda)
+        if cierre is None or not tasa:
+            continue
+        precios[simbolo] = cierre / fraccion / tasa
+    return precios
+
+
+def precios_con_respaldo(cotizaciones, simbolos, monedas, ultimos):
+    # Como precios_en_euros, pero lo que no se pueda descargar (todo, si no hay conexion) sale del
+    # ultimo precio guardado. Devuelve (precios, antiguos); antiguos = {simbolo: instante del precio}.
+    try:
+        precios = precios_en_euros(cotizaciones, simbolos, monedas)
+    except Exception as e:
+        print(f"Error al obtener precios: {str(e)}")
+        precios = {}
+    ultimos.actualizar(precios)
+
+    antiguos = {}
+    for simbolo in simbolos:
+        if simbolo not in precios:
+            guardado = ultimos.obtener(simbolo)
+            if guardado:
+                precios[simbolo], antiguos[simbolo] = guardado
+    return precios, antiguos
+
+
+class TrabajadorPrecios:
+    # Ejecuta las descargas en hilos de fondo. Los resultados se dejan en una cola que la
+    # interfaz vacia con recoger() desde su propio hilo, asi Tk solo se toca desde el hilo principal.
+    def __init__(self, cotizaciones, monedas, hilos=HILOS_PRECIOS, ultimos=None, medidas=None):
+        self.cotizaciones = cotizaciones
+        self.monedas = monedas
+        self.ultimos = ultimos or UltimosPrecios()
+        self.medidas = medidas or Medidor()
+        self.resultados = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='precios')
+
+    def ejecutar(self, funcion, al_terminar, al_fallar=None):
+        def tarea():
+            try:
+                self.resultados.put((al_terminar, funcion()))
+            except Exception as e:
+                if al_fallar is None:
+                    print(f"Error en segundo plano: {str(e)}")
+                else:
+                    self.resultados.put((al_fallar, e))
+        self._pool.submit(tarea)
+
+    def precargar(self, modulos):
+        # Importa en segundo plano los modulos lentos para que la primera descarga no tenga que esperarlos
+        self.ejecutar(lambda: [importlib.import_module(m) for m in modulos], lambda modulos: None)
+
+    def solicitar_precios(self, simbolos, al_terminar):
+        # al_terminar recibe (precios, antiguos) como precios_con_respaldo; nunca falla por la red
+        simbolos = list(simbolos)
+
+        def descargar():
+            with self.medidas.tramo('precios_acciones'):
+                return precios_con_respaldo(self.cotizaciones, simbolos, self.monedas, self.ultimos)
+
+        self.ejecutar(descargar, lambda resultado: al_terminar(*resultado))
+
+    def recoger(self, maximo=50):
+        listos = []
+        while len(listos) < maximo:
+            try:
+                listos.append(self.resultados.get_nowait())
+            except queue.Empty:
+                break
+        return listos
+
+    def cerrar(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,261 @@
+'''
+Cotizaciones en directo.
+
+En vez de preguntar cada 15 s por todas las posiciones, un Suscriptor abre un WebSocket con el
+streamer de Yahoo (el mismo protocolo que usa yfinance.live: se envia {"subscribe": [...]} y llegan
+mensajes {"message": ...} con un PricingData de protobuf en base64) y recibe un tick por cada cambio
+de precio. Los ticks se guardan en la cache de cotizaciones y se acumulan quedandose solo con el
+ultimo de cada simbolo; la interfaz los recoge con un temporizador, asi que su trabajo depende de
+cuantos simbolos han cambiado y no de cuantos ticks llegan. Si no se puede conectar, o la conexion
+se cae y no vuelve, la interfaz sigue con el sondeo cada 15 s.
+
+ServidorRepeticion es un sustituto local del streamer que reproduce una grabacion (ver fuentes.py)
+al ritmo pedido, para probar y medir sin red:
+    python consola.py emitir grabacion.json --puerto 8765 --ritmo 200
+'''
+
+import base64
+import json
+import threading
+import time
+
+URL_YAHOO = 'wss://streamer.finance.yahoo.com/?version=2'
+FALLOS_PARA_SONDEO = 3  # Intentos de conexion fallidos seguidos tras los que se avisa de que se sondea
+ESPERA_BASE = 1.0  # Segundos antes de reconectar; se duplica en cada fallo
+ESPERA_MAXIMA = 60.0
+TIEMPO_CONEXION = 10  # Segundos para abrir la conexion
+
+
+def importar_protocolo():
+    # websockets y el protobuf de yfinance llegan con yfinance; se cargan en el hilo del suscriptor
+    from yfinance.pricing_pb2 import PricingData
+    return PricingData
+
+
+def codificar_tick(simbolo, precio, instante_ms=None):
+    # Mensaje como los del streamer de Yahoo
+    PricingData = importar_protocolo()
+    datos = PricingData(id=simbolo, price=precio, time=int(time.time() * 1000 if instante_ms is None else instante_ms))
+    return json.dumps({'type': 'pricing', 'message': base64.b64encode(datos.SerializeToString()).decode('ascii')})
+
+
+def decodificar_tick(mensaje, PricingData=None):
+    # (simbolo, precio) de un mensaje del streamer
+    PricingData = PricingData or importar_protocolo()
+    datos = PricingData()
+    datos.ParseFromString(base64.b64decode(json.loads(mensaje)['message']))
+    return datos.id, datos.price
+
+
+def crear_suscriptor(flujo, cotizaciones=None):
+    # flujo: 'yahoo', la URL ws:// de un ServidorRepeticion o None para quedarse solo con el sondeo
+    if not flujo:
+        return None
+    return Suscriptor(URL_YAHOO if flujo == 'yahoo' else flujo, cotizaciones)
+
+
+class Suscriptor:
+    # Un hilo con la conexion abierta. cotizaciones: CacheCotizaciones donde se guarda cada tick,
+    # para que los sondeos y las demas pestañas lo aprovechen sin descargar.
+    def __init__(self, url=URL_YAHOO, cotizaciones=None, espera_base=ESPERA_BASE, espera_maxima=ESPERA_MAXIMA,
+                 fallos_para_sondeo=FALLOS_PARA_SONDEO):
+        self.url = url
+        self.cotizaciones = cotizaciones
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.fallos_para_sondeo = fallos_para_sondeo
+        self._simbolos = set()
+        self._pendientes = {}  # simbolo -> ultimo precio aun no recogido
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._ws = None
+        self._hilo = None
+        self.estado = 'parado'  # parado, conectando, directo o sondeo (sin conexion: la interfaz sondea)
+        self.ticks = 0
+        self.conexiones = 0
+        self.errores = 0
+
+    def en_directo(self):
+        return self.estado == 'directo'
+
+    def suscribir(self, simbolos):
+        # Sustituye la lista de simbolos; arranca el hilo la primera vez
+        simbolos = set(simbolos)
+        with self._lock:
+            nuevos = sorted(simbolos - self._simbolos)
+            quitados = sorted(self._simbolos - simbolos)
+            self._simbolos = simbolos
+            ws = self._ws
+        if ws is not None:
+            try:
+                if nuevos:
+                    ws.send(json.dumps({'subscribe': nuevos}))
+                if quitados:
+                    ws.send(json.dumps({'unsubscribe': quitados}))
+            except Exception as e:
+                print(f"Error al suscribirse a cotizaciones en directo: {str(e)}")
+        if self._hilo is None and simbolos:
+            self._hilo = threading.Thread(target=self._bucle, name='directo', daemon=True)
+            self._hilo.start()
+
+    def recoger(self):
+        # {simbolo: precio} de lo que ha cambiado desde la ultima vez
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, {}
+        return pendientes
+
+    def _bucle(self):
+        try:
+            from websockets.sync.client import connect
+            PricingData = importar_protocolo()
+        except ImportError as e:
+            print(f"Sin cotizaciones en directo: {str(e)}")
+            self.estado = 'sondeo'
+            return
+
+        fallos = 0
+        while not self._parar.is_set():
+            if self.estado != 'sondeo':
+                self.estado = 'conectando'
+            try:
+                with connect(self.url, open_timeout=TIEMPO_CONEXION) as ws:
+                    with self._lock:
+                        self._ws = ws
+                        simbolos = sorted(self._simbolos)
+                    ws.send(json.dumps({'subscribe': simbolos}))
+                    self.conexiones += 1
+                    self.estado = 'directo'
+                    fallos = 0
+                    for mensaje in ws:
+                        self._tick(mensaje, PricingData)
+            except Exception as e:
+                if self._parar.is_set():
+                    break
+                fallos += 1
+                print(f"Error en las cotizaciones en directo: {str(e)}")
+            finally:
+                with self._lock:
+                    self._ws = None
+            if self._parar.is_set():
+                break
+            if fallos >= self.fallos_para_sondeo or self.estado == 'directo':
+                # Tras caerse una conexion que iba bien tambien se sondea mientras se reconecta
+                self.estado = 'sondeo'
+            self._parar.wait(min(self.espera_maxima, self.espera_base * 2 ** max(0, fallos - 1)))
+        self.estado = 'parado'
+
+    def _tick(self, mensaje, PricingData):
+        try:
+            simbolo, precio = decodificar_tick(mensaje, PricingData)
+        except Exception:
+            self.errores += 1  # Mensajes de control u otros que no son precios
+            return
+        if not simbolo or not precio:
+            return
+        with self._lock:
+            self._pendientes[simbolo] = precio
+            self.ticks += 1
+        if self.cotizaciones is not None:
+            self.cotizaciones.guardar(simbolo, precio)
+
+    def cerrar(self):
+        self._parar.set()
+        with self._lock:
+            ws = self._ws
+        if ws is not None:
+            ws.close()
+        if self._hilo is not None:
+            self._hilo.join(timeout=2)
+
+
+class ServidorRepeticion:
+    # Imita al streamer de Yahoo con los datos de una grabacion. Si la grabacion trae 'ticks'
+    # ([[simbolo, precio], ...]) se reproducen en ese orden; si no, se van alternando los simbolos
+    # suscritos con su lista de cotizaciones. ritmo: ticks por segundo a cada cliente (None: sin pausa).
+    def __init__(self, ruta=None, datos=None, ritmo=None, puerto=0, anfitrion='127.0.0.1', repetir=True):
+        if datos is None:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+        self.cotizaciones = {s: list(v) for s, v in datos.get('cotizaciones', {}).items()}
+        self.grabados = [tuple(t) for t in datos.get('ticks', [])]
+        self.ritmo = ritmo
+        self.repetir = repetir
+        self.anfitrion = anfitrion
+        self.puerto = puerto
+        self._servidor = None
+        self.enviados = 0
+
+    @property
+    def url(self):
+        return f"ws://{self.anfitrion}:{self.puerto}"
+
+    def iniciar(self):
+        from websockets.sync.server import serve
+        self._servidor = serve(self._atender, self.anfitrion, self.puerto)
+        self.puerto = self._servidor.socket.getsockname()[1]
+        threading.Thread(target=self._servidor.serve_forever, name='repeticion', daemon=True).start()
+        return self
+
+    def servir(self):
+        # Bloquea hasta Ctrl+C (para usarlo desde la consola)
+        from websockets.sync.server import serve
+        with serve(self._atender, self.anfitrion, self.puerto) as servidor:
+            self._servidor = servidor
+            servidor.serve_forever()
+
+    def cerrar(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+
+    def _secuencia(self, suscritos):
+        # suscritos['simbolos'] cambia si el cliente pide otros: entran en la siguiente vuelta
+        vuelta = 0
+        while True:
+            simbolos = suscritos['simbolos']
+            enviados = 0
+            if self.grabados:
+                for simbolo, precio in self.grabados:
+                    if simbolo in suscritos['simbolos']:
+                        enviados += 1
+                        yield simbolo, precio
+                if not self.repetir:
+                    return
+            else:
+                con_datos = [s for s in sorted(simbolos) if self.cotizaciones.get(s)]
+                for simbolo in con_datos:
+                    serie = self.cotizaciones[simbolo]
+                    enviados += 1
+                    yield simbolo, serie[vuelta % len(serie)]
+                if not self.repetir and vuelta + 1 >= max((len(self.cotizaciones[s]) for s in con_datos), default=0):
+                    return
+            vuelta += 1
+            if not enviados:
+                time.sleep(0.1)  # Nada que enviar todavia
+
+    def _atender(self, ws):
+        # El cliente empieza diciendo que quiere; lo que pida despues se atiende sin cortar el envio
+        suscritos = {'simbolos': frozenset(json.loads(ws.recv()).get('subscribe', []))}
+
+        def escuchar():
+            try:
+                for mensaje in ws:
+                    peticion = json.loads(mensaje)
+                    suscritos['simbolos'] = ((suscritos['simbolos'] | set(peticion.get('subscribe', [])))
+                                             - set(peticion.get('unsubscribe', [])))
+            except Exception:
+                pass
+
+        threading.Thread(target=escuchar, daemon=True).start()
+        pausa = 1 / self.ritmo if self.ritmo else 0
+        siguiente = time.perf_counter()
+        try:
+            for simbolo, precio in self._secuencia(suscritos):
+                ws.send(codificar_tick(simbolo, precio))
+                self.enviados += 1
+                if pausa:
+                    siguiente += pausa
+                    espera = siguiente - time.perf_counter()
+                    if espera > 0:
+                        time.sleep(espera)
+        except Exception:
+            pass  # El cliente se ha ido
@@ -0,0 +1,287 @@
+'''
+Fuentes de precios.
+
+Todo lo que sale de la red pasa por una fuente con la interfaz de FuentePrecios: precio de un
+simbolo, precios de varios en una sola peticion, historico diario, moneda e informacion. La de
+Yahoo es la normal; FuenteGrabada reproduce una grabacion desde un archivo local, con latencia y
+fallos configurables, para medir y probar el refresco sin red y siempre con los mismos datos.
+'''
+
+from abc import ABC, abstractmethod
+import json
+import random
+import threading
+import time
+from datetime import timedelta
+
+from red import ClienteHTTP
+
+
+class ErrorFuente(OSError):
+    # Fallo simulado por FuenteGrabada; se comporta como un fallo de red
+    pass
+
+
+class FuentePrecios(ABC):
+    # Interfaz comun. Los precios van en la moneda de cotizacion del simbolo (ver monedas()).
+    # Cada fuente tiene que dar al menos descargar e historico; el resto tiene un valor por defecto.
+    @abstractmethod
+    def descargar(self, simbolos):
+        # {simbolo: ultimo cierre} de todos los pedidos, en una sola peticion si la fuente lo permite.
+        # Los simbolos sin datos no aparecen en el resultado.
+        raise NotImplementedError
+
+    def precio(self, simbolo):
+        precios = self.descargar([simbolo])
+        if simbolo not in precios:
+            raise ValueError(f"Sin datos para {simbolo}")
+        return precios[simbolo]
+
+    @abstractmethod
+    def historico(self, simbolos, desde, hasta):
+        # {simbolo: [(fecha 'AAAA-MM-DD', apertura, maximo, minimo, cierre, volumen), ...]} entre dos fechas incluidas
+        raise NotImplementedError
+
+    def monedas(self, simbolos):
+        # {simbolo: moneda de cotizacion} de los que se conozcan
+        return {}
+
+    def informacion(self, simbolo):
+        # Datos descriptivos (nombre, cambio del dia...) como los da Yahoo
+        return {}
+
+    def buscar(self, texto):
+        # Simbolos cuyo nombre o ticker se parece al texto, como los da la busqueda de Yahoo
+        # (lista de dicts con 'symbol', 'shortname', 'exchDisp', 'quoteType'...)
+        return []
+
+
+def importar_yfinance():
+    # yfinance arrastra pandas y requests y tarda medio segundo en importarse: se carga al primer uso,
+    # que siempre es en el hilo de precios, nunca antes de que aparezca la ventana
+    import yfinance
+    return yfinance
+
+
+class FuenteYahoo(FuentePrecios):
+    # Descarga todos los simbolos pedidos en una sola peticion a Yahoo. Todas las llamadas usan la
+    # sesion del cliente, que reutiliza conexiones y aplica ritmo, reintentos y circuito.
+    def __init__(self, cliente=None):
+        self.cliente = cliente or ClienteHTTP()
+
+    def descargar(self, simbolos):
+        simbolos = list(simbolos)
+        if not simbolos:
+            return {}
+
+        # 5 dias para tener siempre un cierre aunque algun mercado no haya abierto hoy
+        yf = importar_yfinance()
+        datos = yf.download(simbolos, period='5d', progress=False, session=self.cliente.sesion)
+        cierres = datos['Close']
+        if hasattr(cierres, 'columns'):
+            columnas = {simbolo: cierres[simbolo] for simbolo in cierres.columns}
+        else:
+            columnas = {simbolos[0]: cierres}
+
+        resultado = {}
+        for simbolo, serie in columnas.items():
+            serie = serie.dropna()
+            if not serie.empty:
+                resultado[simbolo] = float(serie.iloc[-1])
+        return resultado
+
+    def historico(self, simbolos, desde, hasta):
+        # {simbolo: [(fecha, apertura, maximo, minimo, cierre, volumen), ...]} entre dos fechas incluidas
+        simbolos = list(simbolos)
+        yf = importar_yfinance()
+        datos = yf.download(simbolos, start=desde.isoformat(), end=(hasta + timedelta(days=1)).isoformat(),
+                            progress=False, group_by='ticker', session=self.cliente.sesion)
+        resultado = {}
+        for simbolo in simbolos:
+            try:
+                tabla = datos[simbolo] if datos.columns.nlevels > 1 else datos
+            except KeyError:
+                continue
+            tabla = tabla.dropna(subset=['Close'])
+            resultado[simbolo] = [
+                (fecha.strftime('%Y-%m-%d'), float(fila['Open']), float(fila['High']), float(fila['Low']),
+                 float(fila['Close']), float(fila['Volume']) if fila['Volume'] == fila['Volume'] else 0.0)
+                for fecha, fila in tabla.iterrows()
+            ]
+        return resultado
+
+    def monedas(self, simbolos):
+        yf = importar_yfinance()
+        resultado = {}
+        for simbolo in simbolos:
+            try:
+                resultado[simbolo] = yf.Ticker(simbolo, session=self.cliente.sesion).fast_info['currency']
+            except Exception as e:
+                print(f"Error al obtener la moneda de {simbolo}: {str(e)}")
+        return resultado
+
+    def informacion(self, simbolo):
+        return importar_yfinance().Ticker(simbolo, session=self.cliente.sesion).info
+
+    def buscar(self, texto):
+        busqueda = importar_yfinance().Search(texto, max_results=10, news_count=0, lists_count=0, include_cb=False,
+                                              recommended=0, session=self.cliente.sesion)
+        return busqueda.quotes
+
+
+class FuenteFalsa(FuentePrecios):
+    # Fuente sin red para probar el calculo por lotes y el historico; cuenta las descargas realizadas.
+    # historicos: {simbolo: [(fecha 'AAAA-MM-DD', apertura, maximo, minimo, cierre, volumen), ...]}
+    def __init__(self, precios, monedas=None, historicos=None):
+        self.precios = dict(precios)
+        self.monedas_conocidas = dict(monedas or {})
+        self.historicos = dict(historicos or {})
+        self.descargas = 0
+        self.simbolos_pedidos = 0
+        self.descargas_historico = []  # (simbolos, desde, hasta) de cada peticion
+
+    def descargar(self, simbolos):
+        simbolos = list(simbolos)
+        self.descargas += 1
+        self.simbolos_pedidos += len(simbolos)
+        return {s: self.precios[s] for s in simbolos if s in self.precios}
+
+    def monedas(self, simbolos):
+        return {s: self.monedas_conocidas[s] for s in simbolos if s in self.monedas_conocidas}
+
+    def historico(self, simbolos, desde, hasta):
+        simbolos = list(simbolos)
+        self.descargas_historico.append((simbolos, desde, hasta))
+        resultado = {}
+        for simbolo in simbolos:
+            if simbolo in self.historicos:
+                resultado[simbolo] = [b for b in self.historicos[simbolo]
+                                      if desde.isoformat() <= b[0] <= hasta.isoformat()]
+        return resultado
+
+
+class FuenteGrabada(FuentePrecios):
+    # Reproduce una grabacion (ver FuenteGrabadora) sin red. Cada simbolo tiene una lista de cotizaciones
+    # que se van sirviendo en orden, una por descarga, y se vuelve a empezar al acabar.
+    # latencia: segundos que tarda cada llamada (mas un reparto uniforme de +-variacion).
+    # fallos: probabilidad de que una llamada falle; fallar_en: numeros de llamada (desde 1) que fallan siempre.
+    def __init__(self, ruta=None, datos=None, latencia=0.0, variacion=0.0, fallos=0.0, fallar_en=(), semilla=1,
+                 dormir=time.sleep):
+        if datos is None:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+        self.cotizaciones = {s: list(v) for s, v in datos.get('cotizaciones', {}).items()}
+        self.monedas_grabadas = dict(datos.get('monedas', {}))
+        self.historicos = {s: [tuple(b) for b in v] for s, v in datos.get('historicos', {}).items()}
+        self.informaciones = dict(datos.get('informacion', {}))
+        self.latencia = latencia
+        self.variacion = variacion
+        self.fallos = fallos
+        self.fallar_en = set(fallar_en)
+        self._azar = random.Random(semilla)
+        self._dormir = dormir
+        self._posicion = {}
+        self._lock = threading.Lock()
+        self.llamadas = 0
+        self.fallidas = 0
+
+    def _llamada(self):
+        # Simula el coste y los fallos de ir a la red; decide con la semilla para que sea repetible
+        with self._lock:
+            self.llamadas += 1
+            numero = self.llamadas
+            espera = max(0.0, self.latencia + self._azar.uniform(-self.variacion, self.variacion))
+            falla = numero in self.fallar_en or self._azar.random() < self.fallos
+            if falla:
+                self.fallidas += 1
+        if espera:
+            self._dormir(espera)
+        if falla:
+            raise ErrorFuente(f"Fallo simulado en la llamada {numero}")
+
+    def descargar(self, simbolos):
+        self._llamada()
+        resultado = {}
+        with self._lock:
+            for simbolo in dict.fromkeys(simbolos):
+                serie = self.cotizaciones.get(simbolo)
+                if serie:
+                    posicion = self._posicion.get(simbolo, 0)
+                    resultado[simbolo] = serie[posicion % len(serie)]
+                    self._posicion[simbolo] = posicion + 1
+        return resultado
+
+    def historico(self, simbolos, desde, hasta):
+        self._llamada()
+        resultado = {}
+        for simbolo in simbolos:
+            if simbolo in self.historicos:
+                resultado[simbolo] = [b for b in self.historicos[simbolo]
+                                      if desde.isoformat() <= b[0] <= hasta.isoformat()]
+        return resultado
+
+    def monedas(self, simbolos):
+        return {s: self.monedas_grabadas[s] for s in simbolos if s in self.monedas_grabadas}
+
+    def informacion(self, simbolo):
+        self._llamada()
+        return dict(self.informaciones.get(simbolo, {}))
+
+    def buscar(self, texto):
+        # Entre los simbolos con informacion grabada, los que contienen el texto en el ticker o el nombre
+        self._llamada()
+        texto = texto.lower()
+        return [dict(info, symbol=simbolo) for simbolo, info in self.informaciones.items()
+                if texto in simbolo.lower() or texto in str(info.get('shortName', '')).lower()]
+
+
+class FuenteGrabadora(FuentePrecios):
+    # Envuelve otra fuente y apunta todo lo que devuelve para reproducirlo despues con FuenteGrabada
+    def __init__(self, fuente):
+        self.fuente = fuente
+        self.datos = {'cotizaciones': {}, 'monedas': {}, 'historicos': {}, 'informacion': {}}
+        self._lock = threading.Lock()
+
+    def descargar(self, simbolos):
+        precios = self.fuente.descargar(simbolos)
+        with self._lock:
+            for simbolo, precio in precios.items():
+                self.datos['cotizaciones'].setdefault(simbolo, []).append(precio)
+        return precios
+
+    def historico(self, simbolos, desde, hasta):
+        historicos = self.fuente.historico(simbolos, desde, hasta)
+        with self._lock:
+            for simbolo, barras in historicos.items():
+                guardadas = {b[0]: list(b) for b in self.datos['historicos'].get(simbolo, [])}
+                guardadas.update((b[0], list(b)) for b in barras)
+                self.datos['historicos'][simbolo] = [guardadas[f] for f in sorted(guardadas)]
+        return historicos
+
+    def monedas(self, simbolos):
+        monedas = self.fuente.monedas(simbolos)
+        with self._lock:
+            self.datos['monedas'].update(monedas)
+        return monedas
+
+    def informacion(self, simbolo):
+        informacion = self.fuente.informacion(simbolo)
+        with self._lock:
+            # Solo lo que se puede pasar a JSON
+            self.datos['informacion'][simbolo] = json.loads(json.dumps(informacion, default=str))
+        return informacion
+
+    def buscar(self, texto):
+        return self.fuente.buscar(texto)
+
+    def guardar(self, ruta):
+        with self._lock:
+            with open(ruta, 'w', encoding='utf-8') as f:
+                json.dump(self.datos, f)
+
+
+def crear_fuente(tipo='yahoo', **opciones):
+    # 'yahoo' o la ruta de una grabacion .json; las opciones van a FuenteGrabada (latencia, fallos...)
+    if tipo == 'yahoo':
+        return FuenteYahoo()
+    return FuenteGrabada(tipo, **opciones)
@@ -0,0 +1,88 @@
+'''
+Historico local de precios diarios.
+
+Guarda en SQLite una barra diaria (apertura, maximo, minimo, cierre, volumen) por simbolo y fecha.
+Cada vez que se completa solo se descarga lo que falta desde la ultima barra guardada, de modo que
+las valoraciones historicas, graficos y rentabilidades se calculan sin red.
+'''
+
+import sqlite3
+import threading
+from datetime import date, timedelta
+
+ANIOS_HISTORICO = 5  # Profundidad de la primera descarga de un simbolo nuevo
+
+
+class HistoricoPrecios:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        # Se completa desde el hilo de precios y se consulta desde la interfaz
+        self._con = sqlite3.connect(ruta, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._con:
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute("""
+                CREATE TABLE IF NOT EXISTS barras (
+                    simbolo TEXT NOT NULL, fecha TEXT NOT NULL,
+                    apertura REAL, maximo REAL, minimo REAL, cierre REAL NOT NULL, volumen REAL,
+                    PRIMARY KEY (simbolo, fecha)
+                ) WITHOUT ROWID
+            """)
+        self.descargas = 0
+        self.cambios = 0  # Sube con cada guardado para que quien calcule sobre el historico sepa que rehacer
+        self.versiones = {}  # simbolo -> valor de cambios la ultima vez que se guardo, para rehacer solo ese simbolo
+
+    def ultima_fecha(self, simbolo):
+        with self._lock:
+            fila = self._con.execute("SELECT max(fecha) FROM barras WHERE simbolo = ?", (simbolo,)).fetchone()
+        return date.fromisoformat(fila[0]) if fila[0] else None
+
+    def guardar(self, simbolo, barras):
+        # barras: iterable de (fecha 'AAAA-MM-DD', apertura, maximo, minimo, cierre, volumen)
+        with self._lock, self._con:
+            self._con.executemany("INSERT OR REPLACE INTO barras VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                  ((simbolo,) + tuple(barra) for barra in barras))
+            self.cambios += 1
+            self.versiones[simbolo] = self.cambios
+
+    def cierres(self, simbolo, desde=None, hasta=None):
+        # Lista de (fecha, cierre) ordenada por fecha; desde y hasta son date o texto ISO
+        with self._lock:
+            filas = self._con.execute(
+                "SELECT fecha, cierre FROM barras WHERE simbolo = ? AND fecha BETWEEN ? AND ? ORDER BY fecha",
+                (simbolo, str(desde or ''), str(hasta or '9999'))).fetchall()
+        return filas
+
+    def ultimas_barras(self, simbolo, sesiones):
+        # Las ultimas sesiones guardadas como (fecha, maximo, minimo, cierre), de la mas antigua a la mas nueva
+        with self._lock:
+            filas = self._con.execute(
+                "SELECT fecha, maximo, minimo, cierre FROM barras WHERE simbolo = ? ORDER BY fecha DESC LIMIT ?",
+                (simbolo, sesiones)).fetchall()
+        return filas[::-1]
+
+    def simbolos(self):
+        with self._lock:
+            return [f[0] for f in self._con.execute("SELECT DISTINCT simbolo FROM barras")]
+
+    def completar(self, simbolos, fuente, hoy=None, inicio=None):
+        # Descarga lo que falta de cada simbolo. Los que empiezan en la misma fecha van en una
+        # sola peticion. Se vuelve a pedir la ultima barra guardada por si era de un dia a medias.
+        hoy = hoy or date.today()
+        inicio = inicio or hoy - timedelta(days=365 * ANIOS_HISTORICO)
+        por_fecha = {}
+        for simbolo in dict.fromkeys(simbolos):
+            desde = self.ultima_fecha(simbolo) or inicio
+            por_fecha.setdefault(desde, []).append(simbolo)
+
+        nuevas = 0
+        for desde, grupo in sorted(por_fecha.items()):
+            self.descargas += 1
+            for simbolo, barras in fuente.historico(grupo, desde, hoy).items():
+                self.guardar(simbolo, barras)
+                nuevas += len(barras)
+        return nuevas
+
+    def cerrar(self):
+        with self._lock:
+            self._con.close()
@@ -0,0 +1,368 @@
+'''
+Importacion masiva de extractos de brokers y exchanges.
+
+El archivo se lee como un flujo: cada fila pasa por un generador que reconoce las columnas, valida
+y normaliza la fecha y el importe, y las filas validas se guardan por lotes descartando los ids que
+ya existen. En memoria solo hay un lote cada vez, sea cual sea el tamaño del archivo. Cada fila de
+un extracto de acciones es una compra con su fecha, que va al libro de lotes (lotes.py).
+Importacion.paso() procesa un solo lote y devuelve el control, de modo que la interfaz puede pintar
+el progreso entre lote y lote sin quedarse bloqueada.
+'''
+
+import csv
+import itertools
+import os
+import tempfile
+import unicodedata
+from datetime import date
+from functools import lru_cache
+
+from configuracion import MESES, VALID_TRANS
+from lotes import COMPRA
+
+TAMANO_LOTE = 10_000
+MAX_ERRORES = 20  # Errores que se guardan con detalle; del resto solo se lleva la cuenta
+
+# Nombres de columna de los distintos extractos (en minusculas, sin acentos) -> campo
+COLUMNAS = {
+    'registros': {
+        'id': 'id',
+        'fecha': 'fecha', 'date': 'fecha', 'fecha valor': 'fecha', 'fecha operacion': 'fecha',
+        'fecha de operacion': 'fecha', 'trade date': 'fecha', 'datetime': 'fecha', 'time': 'fecha',
+        'd': 'd', 'dia': 'd', 'day': 'd',
+        'm': 'm', 'mes': 'm', 'month': 'm',
+        'a': 'a', 'ano': 'a', 'anio': 'a', 'year': 'a',
+        'cantidad': 'cantidad', 'importe': 'cantidad', 'amount': 'cantidad', 'total': 'cantidad',
+        'valor': 'cantidad', 'importe eur': 'cantidad',
+        'trans': 'trans', 'transaccion': 'trans',
+    },
+    'acciones': {
+        'simbolo': 'simbolo', 'symbol': 'simbolo', 'ticker': 'simbolo',
+        'cantidad': 'cantidad', 'quantity': 'cantidad', 'shares': 'cantidad', 'titulos': 'cantidad',
+        'participaciones': 'cantidad', 'unidades': 'cantidad',
+        'precio compra': 'precio_compra', 'precio medio': 'precio_compra', 'average price': 'precio_compra',
+        'avg price': 'precio_compra', 'precio': 'precio_compra', 'price': 'precio_compra',
+        'notas': 'notas', 'notes': 'notas', 'comentario': 'notas', 'nombre': 'notas', 'name': 'notas',
+        'fecha': 'fecha', 'date': 'fecha', 'fecha valor': 'fecha', 'fecha operacion': 'fecha',
+        'fecha de operacion': 'fecha', 'fecha compra': 'fecha', 'trade date': 'fecha', 'datetime': 'fecha',
+    },
+}
+OBLIGATORIAS = {'registros': ('cantidad',), 'acciones': ('simbolo', 'cantidad', 'precio_compra')}
+
+# 'marzo', 'mar' y 'march' -> '03'
+NOMBRES_MES = {}
+for _numero, _nombre in MESES.items():
+    NOMBRES_MES[_nombre.lower()] = _numero
+    NOMBRES_MES[_nombre.lower()[:3]] = _numero
+NOMBRES_MES.update({'jan': '01', 'apr': '04', 'aug': '08', 'dec': '12', 'january': '01', 'february': '02',
+                    'march': '03', 'april': '04', 'may': '05', 'june': '06', 'july': '07', 'august': '08',
+                    'september': '09', 'october': '10', 'november': '11', 'december': '12', 'sept': '09'})
+
+VALORES_TRANS = {'': 's', 's': 's', 'si': 's', 'y': 's', 'yes': 's', 'true': 's', '1': 's',
+                 'n': 'n', 'no': 'n', 'false': 'n', '0': 'n'}
+
+
+def simplificar(texto):
+    # 'Fecha_Operación ' -> 'fecha operacion'
+    texto = unicodedata.normalize('NFKD', texto.strip().lower().replace('_', ' '))
+    return ''.join(c for c in texto if not unicodedata.combining(c))
+
+
+def normalizar_mes(mes):
+    mes = mes.strip()
+    if mes.isdigit():
+        mes = mes.zfill(2)
+        if mes in MESES:
+            return mes
+    else:
+        numero = NOMBRES_MES.get(simplificar(mes).rstrip('.'))
+        if numero:
+            return numero
+    raise ValueError(f"Mes inválido: {mes}")
+
+
+@lru_cache(maxsize=4096)
+def normalizar_partes(d, m, a):
+    # Dia, mes (numero o nombre) y año -> ('05', '03', '2024'), comprobando que la fecha existe
+    m = normalizar_mes(m)
+    d, a = d.strip(), a.strip()
+    if not (d.isdigit() and a.isdigit()):
+        raise ValueError("La fecha debe contener solo números")
+    if len(a) == 2:
+        a = '20' + a
+    try:
+        date(int(a), int(m), int(d))
+    except ValueError:
+        raise ValueError("La fecha no existe")  # 31 de abril, 29 de febrero de un año no bisiesto...
+    return d.zfill(2), m, a
+
+
+@lru_cache(maxsize=4096)
+def normalizar_fecha(texto):
+    # '15/03/2024', '15-mar-2024', '2024-03-15' o '2024-03-15T10:00:00' -> ('15', '03', '2024')
+    parte = texto.strip().replace('T', ' ').split(' ')[0]
+    for separador in '/-.':
+        if separador in parte:
+            trozos = parte.split(separador)
+            break
+    else:
+        raise ValueError(f"Fecha inválida: {texto}")
+    if len(trozos) != 3:
+        raise ValueError(f"Fecha inválida: {texto}")
+    if len(trozos[0]) == 4:
+        a, m, d = trozos
+    else:
+        d, m, a = trozos
+    try:
+        return normalizar_partes(d, m, a)
+    except ValueError as e:
+        raise ValueError(f"Fecha inválida: {texto} ({str(e)})")
+
+
+def normalizar_importe(texto):
+    # '1.234,56 €', '1,234.56', '250' -> float. Con una sola coma, la coma es decimal.
+    # Primero los casos normales, sin excepciones: '250.5' y '250,5'
+    try:
+        if ',' not in texto:
+            return float(texto)
+        if '.' not in texto and texto.count(',') == 1:
+            return float(texto.replace(',', '.'))
+    except ValueError:
+        pass
+    limpio = texto.strip().replace('\xa0', '').replace(' ', '').replace('€', '').replace('$', '')
+    limpio = limpio.replace('EUR', '').replace('USD', '')
+    if ',' in limpio and '.' in limpio:
+        if limpio.rfind(',') > limpio.rfind('.'):
+            limpio = limpio.replace('.', '').replace(',', '.')
+        else:
+            limpio = limpio.replace(',', '')
+    else:
+        limpio = limpio.replace(',', '.')
+    try:
+        return float(limpio)
+    except ValueError:
+        raise ValueError(f"Importe inválido: {texto}")
+
+
+def normalizar_trans(texto):
+    valor = VALORES_TRANS.get(simplificar(texto))
+    if valor not in VALID_TRANS:
+        raise ValueError(f"Transacción inválida: {texto} (use s/n)")
+    return valor
+
+
+def clave_compra(movimiento):
+    return (movimiento['simbolo'], movimiento['a'], movimiento['m'], movimiento['d'],
+            round(movimiento['cantidad'], 9), round(movimiento['precio'], 9))
+
+
+class Importacion:
+    # tipo: 'registros' (aportaciones) o 'acciones'
+    def __init__(self, repo, ruta, tipo='registros', tamano_lote=TAMANO_LOTE):
+        if tipo not in COLUMNAS:
+            raise ValueError(f"Tipo de importación desconocido: {tipo}")
+        self.repo = repo
+        self.ruta = ruta
+        self.tipo = tipo
+        self.tamano_lote = tamano_lote
+        self.total_bytes = max(1, os.path.getsize(ruta))
+        self.importadas = 0
+        self.duplicadas = 0
+        self.erroneas = 0
+        self.errores = []  # (linea, mensaje) de los primeros MAX_ERRORES
+        self.leido = False  # Ya no queda nada por leer; faltan las filas sin id
+        self.terminada = False
+        self._hoy = date.today()
+        self._sin_id = None  # Temporal con las filas sin id: se numeran al final, cuando ya estan todos los del archivo
+        self._lector_sin_id = None
+
+        self._archivo = open(ruta, 'r', newline='', encoding='utf-8-sig')
+        try:
+            muestra = self._archivo.read(64 * 1024)
+            self._archivo.seek(0)
+            try:
+                dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t|')
+            except csv.Error:
+                dialecto = csv.excel
+            self._lector = csv.reader(self._archivo, dialecto)
+            self._posiciones = self._columnas(next(self._lector, []))
+        except BaseException:
+            self.cerrar()
+            raise
+        self._filas = self._normalizar()
+
+    def _columnas(self, cabecera):
+        # {campo: posicion} a partir de los nombres de la cabecera
+        alias = COLUMNAS[self.tipo]
+        posiciones = {}
+        for i, nombre in enumerate(cabecera):
+            campo = alias.get(simplificar(nombre))
+            if campo and campo not in posiciones:
+                posiciones[campo] = i
+        faltan = [c for c in OBLIGATORIAS[self.tipo] if c not in posiciones]
+        if self.tipo == 'registros' and 'fecha' not in posiciones and not {'d', 'm', 'a'} <= posiciones.keys():
+            faltan.append('fecha (o d, m y a)')
+        if faltan:
+            raise ValueError(f"Faltan columnas: {', '.join(faltan)}. Cabecera leída: {', '.join(cabecera)}")
+        return posiciones
+
+    def _anotar_error(self, linea, mensaje):
+        self.erroneas += 1
+        if len(self.errores) < MAX_ERRORES:
+            self.errores.append((linea, mensaje))
+
+    def _normalizar(self):
+        # Generador de filas ya validadas; las erroneas se cuentan y se saltan
+        convertir = self._registro if self.tipo == 'registros' else self._accion
+        for fila in self._lector:
+            if not any(fila):
+                continue
+            try:
+                yield convertir(fila)
+            except (ValueError, IndexError) as e:
+                self._anotar_error(self._lector.line_num, str(e) if isinstance(e, ValueError) else "Faltan campos")
+
+    def _registro(self, fila):
+        p = self._posiciones
+        if 'fecha' in p:
+            d, m, a = normalizar_fecha(fila[p['fecha']])
+        else:
+            d, m, a = normalizar_partes(fila[p['d']], fila[p['m']], fila[p['a']])
+        cantidad = normalizar_importe(fila[p['cantidad']])
+        if cantidad <= 0:
+            raise ValueError("La cantidad debe ser positiva")
+        trans = normalizar_trans(fila[p['trans']]) if 'trans' in p else 's'
+        id_registro = fila[p['id']].strip() if 'id' in p else ''
+        if id_registro and not id_registro.isdigit():
+            raise ValueError(f"Id inválido: {id_registro}")
+        return {'id': int(id_registro) if id_registro else None, 'd': d, 'm': m, 'a': a,
+                'cantidad': cantidad, 'trans': trans}
+
+    def _accion(self, fila):
+        p = self._posiciones
+        simbolo = fila[p['simbolo']].strip().upper()
+        if not simbolo:
+            raise ValueError("Falta el símbolo")
+        cantidad = normalizar_importe(fila[p['cantidad']])
+        precio_compra = normalizar_importe(fila[p['precio_compra']])
+        if cantidad <= 0 or precio_compra < 0:
+            raise ValueError("Cantidad o precio inválidos")
+        notas = fila[p['notas']].strip() if 'notas' in p else ''
+        # Cada fila es una compra con su fecha; los extractos sin fecha de operacion se toman como de hoy
+        if 'fecha' in p:
+            d, m, a = normalizar_fecha(fila[p['fecha']])
+        else:
+            d, m, a = f"{self._hoy.day:02d}", f"{self._hoy.month:02d}", str(self._hoy.year)
+        return {'simbolo': simbolo, 'd': d, 'm': m, 'a': a, 'tipo': COMPRA, 'cantidad': cantidad,
+                'precio': precio_compra, 'notas': notas}
+
+    def paso(self):
+        # Lee, valida y guarda un lote; devuelve False cuando ya no queda nada
+        if self.terminada:
+            return False
+        if self.leido:
+            lote = self._lote_sin_id()
+            if lote:
+                self._numerar(lote)
+                return True
+            # Los lotes han ido al diario; quien importa los vuelca a la foto una sola vez al terminar
+            # (la interfaz, desde el hilo de precios con repo.preparar_compactacion())
+            self.cerrar()
+            return False
+        lote = list(itertools.islice(self._filas, self.tamano_lote))
+        if lote:
+            self._guardar(lote)
+        if len(lote) < self.tamano_lote:
+            self._archivo.close()
+            self.leido = True
+        return True
+
+    def _guardar(self, lote):
+        if self.tipo == 'acciones':
+            # Varias compras del mismo simbolo son lotes distintos; solo se descarta una fila identica
+            # (simbolo, fecha, cantidad y precio) a otra del lote o a una compra que ya esta en el libro.
+            # Los lotes anteriores del archivo ya estan en el libro, asi que no hace falta recordarlos.
+            por_clave = {}
+            for accion in lote:
+                por_clave.setdefault(clave_compra(accion), accion)
+            for simbolo in {clave[0] for clave in por_clave}:
+                for movimiento in self.repo.movimientos(simbolo):
+                    if movimiento['tipo'] == COMPRA:
+                        por_clave.pop(clave_compra(movimiento), None)
+            nuevas = list(por_clave.values())
+            self.duplicadas += len(lote) - len(nuevas)
+            notas = {accion['simbolo']: accion['notas'] for accion in nuevas if accion['notas']}
+            # Por fecha, para que el libro añada cada compra al final en vez de rehacer el simbolo
+            nuevas.sort(key=lambda a: (a['a'], a['m'], a['d']))
+            self.repo.agregar_movimientos(nuevas, notas)
+            self.importadas += len(nuevas)
+            return
+
+        # Los ids del archivo se respetan si no existen ya. Las filas sin id esperan en un temporal: si se
+        # numeraran ahora, un id que aparece mas adelante en el archivo podria estar ya cogido.
+        con_id = {r['id'] for r in lote if r['id'] is not None}
+        existentes = self.repo.ids_existentes(con_id) if con_id else set()
+        nuevos, usados, sin_id = [], set(), []
+        for registro in lote:
+            if registro['id'] is None:
+                sin_id.append((registro['d'], registro['m'], registro['a'], registro['cantidad'], registro['trans']))
+            elif registro['id'] in existentes or registro['id'] in usados:
+                self.duplicadas += 1
+            else:
+                usados.add(registro['id'])
+                nuevos.append(registro)
+        self.repo.agregar_registros(nuevos)
+        self.importadas += len(nuevos)
+        if sin_id:
+            if self._sin_id is None:
+                self._sin_id = tempfile.TemporaryFile('w+', newline='', encoding='utf-8')
+            csv.writer(self._sin_id).writerows(sin_id)
+
+    def _lote_sin_id(self):
+        if self._sin_id is None:
+            return []
+        if self._lector_sin_id is None:
+            self._sin_id.seek(0)
+            self._lector_sin_id = csv.reader(self._sin_id)
+        return list(itertools.islice(self._lector_sin_id, self.tamano_lote))
+
+    def _numerar(self, lote):
+        # Tras el ultimo id del repositorio, que ya incluye todos los del archivo
+        siguiente = self.repo.proximo_id()
+        self.repo.agregar_registros([{'id': siguiente + i, 'd': d, 'm': m, 'a': a, 'cantidad': float(cantidad),
+                                      'trans': trans} for i, (d, m, a, cantidad, trans) in enumerate(lote)])
+        self.importadas += len(lote)
+
+    def progreso(self):
+        # Posicion del archivo binario de debajo: va por bloques, de sobra para una barra de progreso
+        if self.leido or self.terminada:
+            return 1.0
+        return min(1.0, self._archivo.buffer.tell() / self.total_bytes)
+
+    def cerrar(self):
+        self.terminada = True
+        self._archivo.close()
+        if self._sin_id is not None:
+            self._sin_id.close()
+
+    def resumen(self):
+        lineas = [f"Importados: {self.importadas}", f"Duplicados descartados: {self.duplicadas}",
+                  f"Filas con errores: {self.erroneas}"]
+        for linea, mensaje in self.errores:
+            lineas.append(f"  línea {linea}: {mensaje}")
+        if self.erroneas > len(self.errores):
+            lineas.append(f"  ... y {self.erroneas - len(self.errores)} más")
+        return "\n".join(lineas)
+
+
+def importar(repo, ruta, tipo='registros', al_progresar=None):
+    # Importacion completa de una vez (consola, pruebas de rendimiento)
+    importacion = Importacion(repo, ruta, tipo)
+    try:
+        while importacion.paso():
+            if al_progresar:
+                al_progresar(importacion)
+    finally:
+        importacion.cerrar()
+        repo.compactar()
+    return importacion
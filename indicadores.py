@@ -0,0 +1,171 @@
+'''
+Indicadores tecnicos de la lista de vigilancia.
+
+Las ultimas sesiones de cada simbolo se ponen en matrices (simbolos x sesiones) alineadas a la
+derecha, con nan donde falta historico, y cada indicador se calcula para todos los simbolos a la
+vez: medias, RSI y rango de 52 semanas son operaciones sobre columnas, no bucles por simbolo. Las
+barras de cada simbolo se leen del historico una vez y solo se vuelven a leer si cambia su historico.
+'''
+
+import re
+import threading
+from datetime import date
+
+import numpy as np
+
+from vigilancia import COLUMNAS, EMA, RSI, SESIONES_ANIO, SMA
+
+SESIONES = SESIONES_ANIO + 1  # Una mas para el cambio del dia
+CLAVES_NUMERICAS = [clave for clave, _, decimales in COLUMNAS if decimales is not None]
+CONDICION = re.compile(r'^([a-z_]+)(<=|>=|<|>|=)(-?\d+(?:[.,]\d+)?)$')
+
+
+def media_exponencial(matriz, alfa):
+    # Media exponencial de cada fila (como ewm(adjust=False) de pandas), empezando en su primer valor;
+    # los nan no la cambian. El bucle es por sesiones: cada paso trabaja con todos los simbolos.
+    media = np.full(matriz.shape[0], np.nan)
+    for columna in matriz.T:
+        actualizada = media + alfa * (columna - media)
+        media = np.where(np.isnan(media), columna, np.where(np.isnan(columna), media, actualizada))
+    return media
+
+
+def indice_fuerza(cierres, periodo=RSI):
+    # RSI con el suavizado de Wilder (media exponencial con alfa 1/periodo)
+    cambios = np.diff(cierres, axis=1)
+    faltan = np.isnan(cambios)
+    subidas = np.where(faltan, np.nan, np.where(cambios > 0, cambios, 0.0))
+    bajadas = np.where(faltan, np.nan, np.where(cambios < 0, -cambios, 0.0))
+    media_subidas = media_exponencial(subidas, 1 / periodo)
+    media_bajadas = media_exponencial(bajadas, 1 / periodo)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = 100 - 100 / (1 + media_subidas / media_bajadas)
+    # Sin bajadas el RSI es 100, y 50 si el precio no se ha movido
+    return np.where(media_bajadas == 0, np.where(media_subidas > 0, 100.0, 50.0), rsi)
+
+
+def con_precio_actual(maximos, minimos, cierres, precios, guardado_hoy):
+    # El precio de ahora pasa a ser la ultima sesion; si la de hoy ya estaba guardada, la sustituye.
+    # Los simbolos sin precio se quedan con lo guardado.
+    tiene = ~np.isnan(precios)
+    sustituir = (tiene & guardado_hoy)[:, None]
+    desplazar = (tiene & ~guardado_hoy)[:, None]
+
+    def nueva(matriz, ultimo):
+        desplazada = np.concatenate((matriz[:, 1:], ultimo[:, None]), axis=1)
+        sustituida = np.concatenate((matriz[:, :-1], ultimo[:, None]), axis=1)
+        return np.where(desplazar, desplazada, np.where(sustituir, sustituida, matriz))
+
+    return (nueva(maximos, np.where(guardado_hoy, np.fmax(maximos[:, -1], precios), precios)),
+            nueva(minimos, np.where(guardado_hoy, np.fmin(minimos[:, -1], precios), precios)),
+            nueva(cierres, precios))
+
+
+def calcular_indicadores(maximos, minimos, cierres):
+    # Un array por columna. Lo que necesita mas historico del que hay queda en nan.
+    validos = (~np.isnan(cierres)).sum(axis=1)
+    precio = cierres[:, -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        maximo = np.fmax.reduce(maximos[:, -SESIONES_ANIO:], axis=1)
+        minimo = np.fmin.reduce(minimos[:, -SESIONES_ANIO:], axis=1)
+        return {
+            'precio': precio,
+            'cambio': (precio / cierres[:, -2] - 1) * 100,
+            'sma': cierres[:, -SMA:].mean(axis=1),
+            'ema': np.where(validos >= EMA, media_exponencial(cierres, 2 / (EMA + 1)), np.nan),
+            'rsi': np.where(validos > RSI, indice_fuerza(cierres), np.nan),
+            'minimo': minimo,
+            'maximo': maximo,
+            'desde_maximo': (precio / maximo - 1) * 100,
+        }
+
+
+def filtrar(indicadores, texto):
+    # Posiciones de las filas que cumplen todo lo pedido: 'rsi<30 cambio>=2' compara columnas y una
+    # palabra suelta busca en el simbolo ('rsi<30 .MC'). Las comparaciones con nan no se cumplen.
+    simbolos = indicadores['simbolos']
+    mascara = np.ones(len(simbolos), dtype=bool)
+    texto = re.sub(r'\s*(<=|>=|<|>|=)\s*', r'\1', texto.strip().lower())
+    for parte in re.split(r'[\s;]+', texto) if texto else []:
+        condicion = CONDICION.match(parte)
+        if condicion:
+            clave, operador, valor = condicion.groups()
+            if clave not in CLAVES_NUMERICAS:
+                raise ValueError(f"Columna desconocida: {clave} (hay {', '.join(CLAVES_NUMERICAS)})")
+            columna = indicadores[clave]
+            valor = float(valor.replace(',', '.'))
+            with np.errstate(invalid='ignore'):
+                mascara &= {'<': columna < valor, '<=': columna <= valor, '>': columna > valor,
+                            '>=': columna >= valor, '=': np.isclose(columna, valor)}[operador]
+        elif re.search(r'[<>=]', parte):
+            raise ValueError(f"Filtro no válido: {parte}")
+        else:
+            buscado = parte.upper()
+            mascara &= np.fromiter((buscado in s for s in simbolos), dtype=bool, count=len(simbolos))
+    return np.flatnonzero(mascara)
+
+
+def ordenar(indicadores, posiciones, clave, descendente=False):
+    # Las filas sin dato van al final en los dos sentidos
+    if clave == 'simbolo':
+        return np.array(sorted(posiciones, key=lambda i: indicadores['simbolos'][i], reverse=descendente),
+                        dtype=np.intp)
+    valores = indicadores[clave][posiciones]
+    orden = np.argsort(-valores if descendente else valores, kind='stable')
+    return posiciones[orden]
+
+
+class MotorVigilancia:
+    # Guarda las ultimas sesiones de cada simbolo y solo las vuelve a leer si cambia su historico
+    def __init__(self, historico):
+        self.historico = historico
+        self._filas = {}  # simbolo -> (version del historico, ultima fecha, maximos, minimos, cierres)
+        self._completado = {}  # simbolo -> dia en que se completo su historico
+        self._lock = threading.Lock()
+        self.lecturas = 0
+
+    def completar(self, simbolos, fuente, hoy=None):
+        # Una vez al dia por simbolo; los escaneos siguientes solo piden precios
+        # (dos escaneos a la vez esperan aqui en vez de descargar lo mismo)
+        hoy = hoy or date.today()
+        with self._lock:
+            pendientes = [s for s in dict.fromkeys(simbolos) if self._completado.get(s) != hoy]
+            if pendientes:
+                self.historico.completar(pendientes, fuente, hoy)
+                for simbolo in pendientes:
+                    self._completado[simbolo] = hoy
+        return len(pendientes)
+
+    def _fila(self, simbolo):
+        version = self.historico.versiones.get(simbolo, 0)
+        fila = self._filas.get(simbolo)
+        if fila is None or fila[0] != version:
+            barras = self.historico.ultimas_barras(simbolo, SESIONES)
+            self.lecturas += 1
+            cierres = np.array([b[3] for b in barras], dtype=np.float64)
+            maximos = np.array([b[1] for b in barras], dtype=np.float64)
+            minimos = np.array([b[2] for b in barras], dtype=np.float64)
+            # Barras sin maximo o minimo (algunas criptos y fondos): se usa el cierre
+            fila = (version, barras[-1][0] if barras else None, np.where(np.isnan(maximos), cierres, maximos),
+                    np.where(np.isnan(minimos), cierres, minimos), cierres)
+            self._filas[simbolo] = fila
+        return fila
+
+    def escanear(self, simbolos, precios, hoy=None):
+        # precios: {simbolo: precio de ahora}. Devuelve los indicadores de todos los simbolos, en su orden.
+        simbolos = list(simbolos)
+        hoy = str(hoy or date.today())
+        matrices = [np.full((len(simbolos), SESIONES), np.nan) for _ in range(3)]
+        guardado_hoy = np.zeros(len(simbolos), dtype=bool)
+        with self._lock:
+            for i, simbolo in enumerate(simbolos):
+                _, ultima, *columnas = self._fila(simbolo)
+                for matriz, valores in zip(matrices, columnas):
+                    if len(valores):
+                        matriz[i, -len(valores):] = valores
+                guardado_hoy[i] = ultima == hoy
+        actuales = np.fromiter((precios.get(s, np.nan) for s in simbolos), dtype=np.float64, count=len(simbolos))
+        indicadores = calcular_indicadores(*con_precio_actual(*matrices, actuales, guardado_hoy))
+        indicadores['simbolos'] = simbolos
+        indicadores['con_precio'] = ~np.isnan(actuales)
+        return indicadores
@@ -0,0 +1,254 @@
+'''
+Libro de lotes: compras y ventas fechadas de cada simbolo.
+
+Cada compra es un lote con su fecha, cantidad y precio; cada venta consume lotes. De cada simbolo se
+mantiene al dia un agregado (cantidad, coste de lo que queda y beneficio realizado), a la vez por FIFO
+y por coste medio, de modo que la pestaña de acciones y el resumen lo leen sin recorrer los lotes.
+Un movimiento con fecha igual o posterior a los que ya hay se aplica en O(1); uno con fecha anterior,
+un cambio o una baja rehacen solo el simbolo afectado.
+'''
+
+from collections import deque
+from datetime import date
+
+COMPRA = 'compra'
+VENTA = 'venta'
+TIPOS_MOVIMIENTO = [COMPRA, VENTA]
+METODOS_COSTE = ['fifo', 'medio']  # FIFO es el que usa Hacienda; el medio, el que enseñan muchos brokers
+TOLERANCIA = 1e-9  # Cantidades por debajo de esto son cero (fracciones de cripto y redondeos)
+MOVIMIENTO_FIELDS = ["id", "simbolo", "d", "m", "a", "tipo", "cantidad", "precio"]
+
+
+def convertir_movimiento(fila):
+    return {
+        'id': int(fila['id']),
+        'simbolo': fila['simbolo'],
+        'd': fila['d'],
+        'm': fila['m'],
+        'a': fila['a'],
+        'tipo': fila['tipo'],
+        'cantidad': float(fila['cantidad']),
+        'precio': float(fila['precio']),
+    }
+
+
+def movimiento_de_accion(datos, id_movimiento, fecha=None):
+    # Una fila con el formato de acciones (simbolo, cantidad, precio_compra y quizas d, m, a) como compra
+    fecha = fecha or date.today()
+    return convertir_movimiento({
+        'id': id_movimiento,
+        'simbolo': datos['simbolo'],
+        'd': datos.get('d') or f"{fecha.day:02d}",
+        'm': datos.get('m') or f"{fecha.month:02d}",
+        'a': datos.get('a') or str(fecha.year),
+        'tipo': COMPRA,
+        'cantidad': datos['cantidad'],
+        'precio': datos['precio_compra'],
+    })
+
+
+def lotes_iniciales(acciones, fecha):
+    # Datos de antes del libro de lotes: cada fila de acciones pasa a ser una compra en la fecha dada
+    return [movimiento_de_accion({'simbolo': a['simbolo'], 'cantidad': a['cantidad'], 'precio_compra': a['precio_compra']},
+                                 i, fecha)
+            for i, a in enumerate((a for a in acciones if a['cantidad'] > 0), 1)]
+
+
+def clave_movimiento(movimiento):
+    # Orden de aplicacion: por fecha y, el mismo dia, por orden de alta
+    return (movimiento['a'], movimiento['m'], movimiento['d'], movimiento['id'])
+
+
+def validar_movimiento(movimiento):
+    if movimiento['tipo'] not in TIPOS_MOVIMIENTO:
+        raise ValueError(f"Tipo de movimiento inválido: {movimiento['tipo']}")
+    if not movimiento['simbolo']:
+        raise ValueError("Falta el símbolo")
+    if movimiento['cantidad'] <= 0:
+        raise ValueError("La cantidad debe ser positiva")
+    if movimiento['precio'] < 0:
+        raise ValueError("El precio no puede ser negativo")
+
+
+class Posicion:
+    def __init__(self, simbolo):
+        self.simbolo = simbolo
+        self.lotes = deque()  # [cantidad que queda, precio] de las compras sin vender, de la mas antigua a la mas nueva
+        self.cantidad = 0.0
+        self.coste_fifo = 0.0  # Lo que costaron las acciones que quedan, segun FIFO
+        self.coste_medio = 0.0  # Idem a coste medio ponderado
+        self.realizado_fifo = 0.0
+        self.realizado_medio = 0.0
+        self.ultima = None  # Clave del ultimo movimiento aplicado
+
+    def aplicar(self, movimiento):
+        # Comprueba antes de tocar nada: si la venta no cabe, la posicion queda como estaba
+        cantidad = movimiento['cantidad']
+        precio = movimiento['precio']
+        if movimiento['tipo'] == COMPRA:
+            self.lotes.append([cantidad, precio])
+            self.cantidad += cantidad
+            self.coste_fifo += cantidad * precio
+            self.coste_medio += cantidad * precio
+        else:
+            if cantidad > self.cantidad + TOLERANCIA:
+                raise ValueError(f"No hay suficientes {self.simbolo} para vender {cantidad:g} el "
+                                 f"{movimiento['d']}/{movimiento['m']}/{movimiento['a']} (hay {self.cantidad:g})")
+            medio = self.coste_medio / self.cantidad
+            self.realizado_medio += cantidad * (precio - medio)
+            self.coste_medio -= cantidad * medio
+            pendiente = cantidad
+            while pendiente > TOLERANCIA and self.lotes:
+                lote = self.lotes[0]
+                usado = min(lote[0], pendiente)
+                self.realizado_fifo += usado * (precio - lote[1])
+                self.coste_fifo -= usado * lote[1]
+                lote[0] -= usado
+                pendiente -= usado
+                if lote[0] <= TOLERANCIA:
+                    self.lotes.popleft()
+            self.cantidad -= cantidad
+            if self.cantidad <= TOLERANCIA:
+                self.cantidad = self.coste_fifo = self.coste_medio = 0.0
+                self.lotes.clear()
+        self.ultima = clave_movimiento(movimiento)
+
+    def coste(self, metodo):
+        return self.coste_fifo if metodo == 'fifo' else self.coste_medio
+
+    def realizado(self, metodo):
+        return self.realizado_fifo if metodo == 'fifo' else self.realizado_medio
+
+
+def reconstruir(simbolo, movimientos):
+    posicion = Posicion(simbolo)
+    for movimiento in movimientos:
+        posicion.aplicar(movimiento)
+    return posicion
+
+
+class Libro:
+    def __init__(self, movimientos=(), metodo='fifo'):
+        if metodo not in METODOS_COSTE:
+            raise ValueError(f"Método de coste desconocido: {metodo}")
+        self.metodo = metodo
+        self._por_id = {}  # id -> movimiento
+        self._por_simbolo = {}  # simbolo -> movimientos en orden de aplicacion
+        self.posiciones = {}  # simbolo -> Posicion; el orden es el de la primera compra
+        self.max_id = 0
+        for movimiento in sorted(movimientos, key=clave_movimiento):
+            self.agregar(movimiento)
+
+    def movimientos(self, simbolo=None):
+        if simbolo is not None:
+            return list(self._por_simbolo.get(simbolo, []))
+        return sorted(self._por_id.values(), key=clave_movimiento)
+
+    def movimiento(self, id_movimiento):
+        return self._por_id.get(id_movimiento)
+
+    def agregar(self, movimiento):
+        validar_movimiento(movimiento)
+        simbolo = movimiento['simbolo']
+        lista = self._por_simbolo.get(simbolo, [])
+        posicion = self.posiciones.get(simbolo)
+        if posicion is not None and clave_movimiento(movimiento) < posicion.ultima:
+            # Con fecha anterior a lo ya aplicado: se rehace el simbolo (y si no cuadra, no se cambia nada)
+            lista = sorted(lista + [movimiento], key=clave_movimiento)
+            self.posiciones[simbolo] = reconstruir(simbolo, lista)
+        else:
+            if posicion is None:
+                posicion = Posicion(simbolo)
+            posicion.aplicar(movimiento)
+            self.posiciones[simbolo] = posicion
+            lista.append(movimiento)
+        self._por_simbolo[simbolo] = lista
+        self._por_id[movimiento['id']] = movimiento
+        self.max_id = max(self.max_id, movimiento['id'])
+
+    def _rehacer(self, simbolo, lista):
+        # Rehace el simbolo con la lista nueva; si alguna venta deja de cuadrar, lanza ValueError sin cambiar nada
+        if lista:
+            self.posiciones[simbolo] = reconstruir(simbolo, lista)
+            self._por_simbolo[simbolo] = lista
+        else:
+            self.posiciones.pop(simbolo, None)
+            self._por_simbolo.pop(simbolo, None)
+
+    def eliminar(self, id_movimiento):
+        actual = self._por_id.get(id_movimiento)
+        if actual is None:
+            return
+        simbolo = actual['simbolo']
+        self._rehacer(simbolo, [m for m in self._por_simbolo[simbolo] if m['id'] != id_movimiento])
+        del self._por_id[id_movimiento]
+
+    def modificar(self, movimiento):
+        # El movimiento con el mismo id se sustituye; puede cambiar de simbolo
+        validar_movimiento(movimiento)
+        actual = self._por_id.get(movimiento['id'])
+        if actual is None:
+            self.agregar(movimiento)
+            return
+        nuevo = movimiento['simbolo']
+        anterior = actual['simbolo']
+        con_nuevo = sorted([m for m in self._por_simbolo.get(nuevo, []) if m['id'] != movimiento['id']] + [movimiento],
+                           key=clave_movimiento)
+        sin_actual = [m for m in self._por_simbolo[anterior] if m['id'] != movimiento['id']]
+        # Se comprueban las dos listas antes de cambiar ninguna
+        reconstruir(nuevo, con_nuevo)
+        if anterior != nuevo:
+            reconstruir(anterior, sin_actual)
+            self._rehacer(anterior, sin_actual)
+        self._rehacer(nuevo, con_nuevo)
+        self._por_id[movimiento['id']] = movimiento
+
+    def renombrar(self, anterior, nuevo):
+        # Pasa todos los movimientos de un simbolo a otro (un cambio de ticker, o juntar dos filas repetidas)
+        if anterior == nuevo or anterior not in self._por_simbolo:
+            return
+        cambiados = [dict(m, simbolo=nuevo) for m in self._por_simbolo[anterior]]
+        self._rehacer(nuevo, sorted(self._por_simbolo.get(nuevo, []) + cambiados, key=clave_movimiento))
+        self._rehacer(anterior, [])
+        for movimiento in cambiados:
+            self._por_id[movimiento['id']] = movimiento
+
+    def eliminar_simbolo(self, simbolo):
+        for movimiento in self._por_simbolo.pop(simbolo, []):
+            del self._por_id[movimiento['id']]
+        self.posiciones.pop(simbolo, None)
+
+    def agregado(self, simbolo):
+        # Lo que se pinta de un simbolo: O(1), sin recorrer lotes
+        posicion = self.posiciones.get(simbolo)
+        if posicion is None:
+            return None
+        coste = posicion.coste(self.metodo)
+        return {
+            'simbolo': simbolo,
+            'cantidad': posicion.cantidad,
+            'precio_compra': coste / posicion.cantidad if posicion.cantidad else 0.0,
+            'coste': coste,
+            'realizado': posicion.realizado(self.metodo),
+            'realizado_fifo': posicion.realizado_fifo,
+            'realizado_medio': posicion.realizado_medio,
+            'lotes': len(posicion.lotes),
+        }
+
+    def acciones(self, notas=None):
+        # Una fila por simbolo con acciones, en el formato de siempre (simbolo, cantidad, precio_compra, notas)
+        notas = notas or {}
+        filas = []
+        for simbolo, posicion in self.posiciones.items():
+            if posicion.cantidad > TOLERANCIA:
+                coste = posicion.coste(self.metodo)
+                filas.append({'simbolo': simbolo, 'cantidad': posicion.cantidad,
+                              'precio_compra': coste / posicion.cantidad, 'notas': notas.get(simbolo, '')})
+        return filas
+
+    def realizado(self):
+        # Beneficio realizado de todas las ventas por los dos metodos
+        return {
+            'fifo': sum(p.realizado_fifo for p in self.posiciones.values()),
+            'medio': sum(p.realizado_medio for p in self.posiciones.values()),
+        }
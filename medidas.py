@@ -0,0 +1,122 @@
+'''
+Medidas de tiempo de la aplicacion.
+
+Las partes lentas (cargar y guardar datos, descargar precios, rehacer tablas, valorar) se envuelven
+en tramos con nombre. Con la medicion apagada un tramo no hace nada mas que comprobar una bandera;
+encendida, cada tramo suma su duracion al histograma de su etapa y se guarda en una lista circular
+que se puede exportar como traza de Chrome (chrome://tracing o https://ui.perfetto.dev).
+'''
+
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Limites de los cubos del histograma en ms: cada uno dobla al anterior, de 0,05 ms a ~30 s
+LIMITES_MS = [0.05 * 2 ** i for i in range(20)]
+MAX_EVENTOS = 20_000  # Tramos guardados para la traza; los mas viejos se descartan
+
+_NULO = contextlib.nullcontext()
+
+
+class Histograma:
+    def __init__(self):
+        self.cubos = [0] * (len(LIMITES_MS) + 1)
+        self.cuenta = 0
+        self.total_ms = 0.0
+        self.maximo_ms = 0.0
+
+    def anotar(self, ms):
+        self.cubos[bisect.bisect_left(LIMITES_MS, ms)] += 1
+        self.cuenta += 1
+        self.total_ms += ms
+        self.maximo_ms = max(self.maximo_ms, ms)
+
+    def percentil(self, p):
+        # Limite superior del cubo donde cae el percentil (nunca mas que el maximo visto)
+        if not self.cuenta:
+            return 0.0
+        objetivo = self.cuenta * p / 100
+        acumulado = 0
+        for i, n in enumerate(self.cubos):
+            acumulado += n
+            if acumulado >= objetivo:
+                return min(LIMITES_MS[i] if i < len(LIMITES_MS) else self.maximo_ms, self.maximo_ms)
+        return self.maximo_ms
+
+
+class Medidor:
+    def __init__(self, activo=False, reloj=time.perf_counter, max_eventos=MAX_EVENTOS):
+        self.activo = activo
+        self._reloj = reloj
+        self._origen = reloj()
+        self._lock = threading.Lock()
+        self._local = threading.local()  # Profundidad de tramos anidados de cada hilo
+        self._hilo_principal = threading.main_thread().ident
+        self.histogramas = {}
+        self.eventos = deque(maxlen=max_eventos)
+        self.bloqueado_ms = 0.0  # Tiempo del hilo de Tk dentro de tramos (sin contar los anidados dos veces)
+        self.bloqueo_max_ms = 0.0
+
+    def tramo(self, nombre):
+        # with medidor.tramo('cargar_registros'): ...
+        if not self.activo:
+            return _NULO
+        return self._medir(nombre)
+
+    @contextlib.contextmanager
+    def _medir(self, nombre):
+        profundidad = getattr(self._local, 'profundidad', 0)
+        self._local.profundidad = profundidad + 1
+        inicio = self._reloj()
+        try:
+            yield
+        finally:
+            fin = self._reloj()
+            self._local.profundidad = profundidad
+            self.anotar(nombre, inicio, fin, exterior=profundidad == 0)
+
+    def anotar(self, nombre, inicio, fin, exterior=True):
+        ms = (fin - inicio) * 1000
+        hilo = threading.get_ident()
+        with self._lock:
+            if nombre not in self.histogramas:
+                self.histogramas[nombre] = Histograma()
+            self.histogramas[nombre].anotar(ms)
+            self.eventos.append((nombre, inicio, fin, hilo))
+            if exterior and hilo == self._hilo_principal:
+                self.bloqueado_ms += ms
+                self.bloqueo_max_ms = max(self.bloqueo_max_ms, ms)
+
+    def reiniciar(self):
+        with self._lock:
+            self.histogramas = {}
+            self.eventos.clear()
+            self.bloqueado_ms = 0.0
+            self.bloqueo_max_ms = 0.0
+
+    def resumen(self):
+        # [(etapa, llamadas, p50, p99, maximo, total)] de la mas costosa a la que menos
+        with self._lock:
+            filas = [(nombre, h.cuenta, h.percentil(50), h.percentil(99), h.maximo_ms, h.total_ms)
+                     for nombre, h in self.histogramas.items()]
+        return sorted(filas, key=lambda fila: fila[5], reverse=True)
+
+    def traza(self):
+        # Formato "Trace Event" de Chrome: un evento completo (ph X) por tramo, tiempos en microsegundos
+        with self._lock:
+            eventos = list(self.eventos)
+        pid = os.getpid()
+        return {
+            'traceEvents': [{'name': nombre, 'ph': 'X', 'pid': pid, 'tid': hilo,
+                             'ts': round((inicio - self._origen) * 1e6, 1), 'dur': round((fin - inicio) * 1e6, 1)}
+                            for nombre, inicio, fin, hilo in eventos],
+            'displayTimeUnit': 'ms',
+        }
+
+    def exportar_traza(self, ruta):
+        with open(ruta, 'w', encoding='utf-8') as f:
+            json.dump(self.traza(), f)
@@ -0,0 +1,285 @@
+'''
+Acceso a la red para las descargas de cotizaciones.
+
+Todas las peticiones a Yahoo pasan por un mismo ClienteHTTP, que reparte una sola sesion (conexiones
+reutilizadas), limita el ritmo con un cubo de fichas, reintenta con espera exponencial y, si el
+servicio falla una y otra vez, abre el circuito: durante un rato no se hace ninguna peticion y la
+interfaz se queda con los ultimos precios guardados.
+'''
+
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+PETICIONES_POR_SEGUNDO = 4.0
+RAFAGA = 10  # Peticiones seguidas permitidas antes de empezar a esperar
+REINTENTOS = 3
+ESPERA_BASE = 0.5  # Segundos antes del primer reintento; se duplica en cada uno
+ESPERA_MAXIMA = 8.0
+FALLOS_PARA_ABRIR = 5  # Fallos seguidos (ya reintentados) que abren el circuito
+PAUSA_CIRCUITO = 60.0  # Segundos con el circuito abierto antes de probar otra vez
+TIEMPO_MAXIMO = 10  # Segundos por peticion
+CONEXIONES = 8
+
+
+class CircuitoAbierto(Exception):
+    pass
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, estado, url, reintentar_en=None):
+        super().__init__(f"HTTP {estado} en {url}")
+        self.estado = estado
+        self.reintentar_en = reintentar_en  # Segundos que pide el servidor con la cabecera Retry-After
+
+
+def segundos_retry_after(valor):
+    # Retry-After viene en segundos o como fecha HTTP; None si no viene o no se entiende
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        fecha = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (fecha - datetime.now(timezone.utc)).total_seconds())
+
+
+def espera_pedida(e):
+    # Lo que pide esperar el servidor en una excepcion nuestra o de requests/curl_cffi con su respuesta
+    espera = getattr(e, 'reintentar_en', None)
+    respuesta = getattr(e, 'response', None)
+    if espera is None and respuesta is not None:
+        espera = segundos_retry_after((getattr(respuesta, 'headers', None) or {}).get('Retry-After'))
+    return espera
+
+
+def codigo_estado(e):
+    # Codigo HTTP de una excepcion de requests, curl_cffi, yfinance o nuestra, si lo lleva
+    estado = getattr(e, 'estado', None)
+    respuesta = getattr(e, 'response', None)
+    if estado is None and respuesta is not None:
+        estado = getattr(respuesta, 'status_code', None)
+    return estado or None  # curl_cffi pone 0 cuando no hubo respuesta
+
+
+def es_limitacion(e):
+    texto = f"{type(e).__name__} {e}".lower()
+    return codigo_estado(e) == 429 or 'ratelimit' in texto or 'too many requests' in texto
+
+
+def es_reintentable(e):
+    # Limitaciones, errores del servidor y fallos de conexion; un 404 no mejora reintentando
+    estado = codigo_estado(e)
+    if es_limitacion(e) or (estado is not None and estado >= 500):
+        return True
+    if estado is not None:
+        return False
+    nombre = type(e).__name__.lower()
+    return isinstance(e, (OSError, TimeoutError)) or 'timeout' in nombre or 'connection' in nombre
+
+
+def crear_sesion(cliente=None):
+    # Sesion de la misma libreria que usa yfinance (curl_cffi, o requests si no esta) cuyas peticiones
+    # pasan todas por el cliente: asi tambien quedan limitadas las que hace yfinance por dentro.
+    try:
+        from curl_cffi import requests as libreria
+        opciones = {'impersonate': 'chrome'}
+    except ImportError:
+        import requests as libreria
+        opciones = {}
+
+    class SesionLimitada(libreria.Session):
+        def request(self, method, url, *args, **kwargs):
+            if cliente is None:
+                return super().request(method, url, *args, **kwargs)
+
+            def peticion():
+                respuesta = super(SesionLimitada, self).request(method, url, *args, **kwargs)
+                if respuesta.status_code == 429 or respuesta.status_code >= 500:
+                    raise ErrorHTTP(respuesta.status_code, url, segundos_retry_after(respuesta.headers.get('Retry-After')))
+                return respuesta
+
+            return cliente.ejecutar(peticion)
+
+    sesion = SesionLimitada(**opciones)
+    if hasattr(libreria, 'adapters'):
+        adaptador = libreria.adapters.HTTPAdapter(pool_connections=CONEXIONES, pool_maxsize=CONEXIONES)
+        sesion.mount('https://', adaptador)
+        sesion.mount('http://', adaptador)
+    return sesion
+
+
+class CuboFichas:
+    # Limita el ritmo medio a 'tasa' peticiones por segundo dejando pasar rafagas de 'capacidad'
+    def __init__(self, tasa=PETICIONES_POR_SEGUNDO, capacidad=RAFAGA, reloj=time.monotonic, dormir=time.sleep):
+        self.tasa = tasa
+        self.capacidad = capacidad
+        self._fichas = float(capacidad)
+        self._reloj = reloj
+        self._dormir = dormir
+        self._ultimo = reloj()
+        self._lock = threading.Lock()
+        self.esperas = 0
+
+    def tomar(self):
+        # Bloquea el hilo que llama hasta que haya ficha; devuelve los segundos esperados
+        esperado = 0.0
+        while True:
+            with self._lock:
+                ahora = self._reloj()
+                self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultimo) * self.tasa)
+                self._ultimo = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return esperado
+                espera = (1 - self._fichas) / self.tasa
+                self.esperas += 1
+            self._dormir(espera)
+            esperado += espera
+
+
+class Circuito:
+    # cerrado -> abierto tras varios fallos seguidos -> semiabierto pasada la pausa (una prueba) -> ...
+    def __init__(self, fallos_para_abrir=FALLOS_PARA_ABRIR, pausa=PAUSA_CIRCUITO, reloj=time.monotonic):
+        self.fallos_para_abrir = fallos_para_abrir
+        self.pausa = pausa
+        self._reloj = reloj
+        self._fallos = 0
+        self._abierto_hasta = None
+        self._probando = False
+        self._lock = threading.Lock()
+        self.aperturas = 0
+
+    def estado(self):
+        with self._lock:
+            return self._estado()
+
+    def _estado(self):
+        if self._abierto_hasta is None:
+            return 'cerrado'
+        return 'abierto' if self._reloj() < self._abierto_hasta else 'semiabierto'
+
+    def permitir(self):
+        with self._lock:
+            estado = self._estado()
+            if estado == 'cerrado':
+                return True
+            if estado == 'semiabierto' and not self._probando:
+                self._probando = True  # Solo una peticion de prueba a la vez
+                return True
+            return False
+
+    def exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._abierto_hasta = None
+            self._probando = False
+
+    def fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self._probando or self._fallos >= self.fallos_para_abrir:
+                if self._abierto_hasta is None or self._probando:
+                    self.aperturas += 1
+                self._abierto_hasta = self._reloj() + self.pausa
+                self._probando = False
+
+    def liberar(self):
+        # La prueba termino sin decir nada del servicio (p. ej. un 404): otra peticion puede probar
+        with self._lock:
+            self._probando = False
+
+
+class ClienteHTTP:
+    # sesion: la que usara yfinance; por defecto una de crear_sesion() ligada a este cliente
+    def __init__(self, sesion=None, cubo=None, circuito=None, reintentos=REINTENTOS, espera_base=ESPERA_BASE,
+                 espera_maxima=ESPERA_MAXIMA, dormir=time.sleep, azar=random.random):
+        self._sesion = sesion
+        self.cubo = cubo or CuboFichas()
+        self.circuito = circuito or Circuito()
+        self.reintentos = reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self._dormir = dormir
+        self._azar = azar
+        self._lock = threading.Lock()
+        self.peticiones = 0
+        self.reintentadas = 0
+        self.limitadas = 0  # Respuestas 429 o avisos de limite de Yahoo
+        self.fallidas = 0  # Peticiones que fallaron tras agotar los reintentos
+        self.rechazadas = 0  # No enviadas por estar el circuito abierto
+
+    @property
+    def sesion(self):
+        # Se crea al primer uso para no importar la libreria HTTP al arrancar
+        with self._lock:
+            if self._sesion is None:
+                self._sesion = crear_sesion(self)
+            return self._sesion
+
+    def _contar(self, contador):
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + 1)
+
+    def espera(self, intento, error=None):
+        # Exponencial con jitter completo: entre 0 y base * 2^intento, con tope. Si el servidor dice cuanto
+        # esperar (Retry-After, normalmente con un 429) se espera al menos eso, con el mismo tope.
+        espera = self._azar() * min(self.espera_maxima, self.espera_base * 2 ** intento)
+        pedida = espera_pedida(error) if error is not None else None
+        if pedida is not None:
+            espera = min(self.espera_maxima, max(espera, pedida))
+        return espera
+
+    def ejecutar(self, peticion):
+        # Lanza peticion() respetando el ritmo, los reintentos y el circuito
+        if not self.circuito.permitir():
+            self._contar('rechazadas')
+            raise CircuitoAbierto("Demasiados fallos seguidos con Yahoo; se usan los últimos precios guardados")
+
+        for intento in range(self.reintentos + 1):
+            self.cubo.tomar()
+            self._contar('peticiones')
+            try:
+                resultado = peticion()
+            except Exception as e:
+                if es_limitacion(e):
+                    self._contar('limitadas')
+                if not es_reintentable(e):
+                    self.circuito.liberar()
+                    raise
+                if intento == self.reintentos:
+                    self._contar('fallidas')
+                    self.circuito.fallo()
+                    raise
+                self._contar('reintentadas')
+                self._dormir(self.espera(intento, e))
+            else:
+                self.circuito.exito()
+                return resultado
+
+    def get(self, url, **opciones):
+        # La sesion ya aplica ritmo, reintentos y circuito; aqui solo se convierten los 4xx en error
+        opciones.setdefault('timeout', TIEMPO_MAXIMO)
+        respuesta = self.sesion.get(url, **opciones)
+        if respuesta.status_code >= 400:
+            raise ErrorHTTP(respuesta.status_code, url)
+        return respuesta
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'peticiones': self.peticiones,
+                'reintentadas': self.reintentadas,
+                'limitadas': self.limitadas,
+                'fallidas': self.fallidas,
+                'rechazadas': self.rechazadas,
+                'esperas_ritmo': self.cubo.esperas,
+                'circuito': self.circuito.estado(),
+                'aperturas_circuito': self.circuito.aperturas,
+            }
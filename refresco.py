@@ -0,0 +1,91 @@
+'''
+Planificador unico de refrescos de la interfaz.
+
+Todas las vistas que se actualizan solas se registran aqui con su intervalo. Solo hay un
+temporizador de Tk activo a la vez: las peticiones repetidas se agrupan y, mientras la
+ventana esta minimizada o sin foco, los intervalos se alargan.
+'''
+
+import time
+
+FACTOR_REPOSO = 4  # Los intervalos se multiplican por esto con la ventana en segundo plano
+
+
+class PlanificadorRefresco:
+    def __init__(self, root, factor_reposo=FACTOR_REPOSO, reloj=time.monotonic):
+        self.root = root
+        self.factor_reposo = factor_reposo
+        self._reloj = reloj
+        self._tareas = {}  # vista -> (funcion, intervalo en ms)
+        self._ultima = {}  # vista -> instante del ultimo refresco
+        self._pendientes = set()  # vistas que deben refrescarse cuanto antes
+        self._timer = None
+        self._instante_timer = None
+        self.en_reposo = False
+        # Contadores para comprobar que no se acumulan temporizadores
+        self.programados = 0
+        self.ejecutados = 0
+
+    def registrar(self, vista, funcion, intervalo_ms):
+        self._tareas[vista] = (funcion, intervalo_ms)
+
+    def cambiar_intervalo(self, vista, intervalo_ms):
+        funcion, _ = self._tareas[vista]
+        self._tareas[vista] = (funcion, intervalo_ms)
+        self._programar()
+
+    def solicitar(self, *vistas):
+        # Sin argumentos se refrescan todas. Varias solicitudes seguidas producen un solo refresco.
+        self._pendientes.update(vistas or self._tareas)
+        self._programar()
+
+    def reposo(self, activo):
+        if activo != self.en_reposo:
+            self.en_reposo = activo
+            self._programar()
+
+    def timers_activos(self):
+        return 0 if self._timer is None else 1
+
+    def detener(self):
+        if self._timer is not None:
+            self.root.after_cancel(self._timer)
+            self._timer = None
+
+    def _vence(self, vista, ahora):
+        ultima = self._ultima.get(vista)
+        if vista in self._pendientes or ultima is None:
+            return ahora
+        intervalo = self._tareas[vista][1] / 1000
+        if self.en_reposo:
+            intervalo *= self.factor_reposo
+        return ultima + intervalo
+
+    def _programar(self):
+        if not self._tareas:
+            return
+        ahora = self._reloj()
+        instante = min(self._vence(v, ahora) for v in self._tareas)
+        if self._timer is not None:
+            if self._instante_timer <= instante:
+                return  # El temporizador actual ya llega a tiempo
+            self.root.after_cancel(self._timer)
+
+        retraso = max(0, int((instante - ahora) * 1000))
+        self._timer = self.root.after(retraso, self._ejecutar)
+        self._instante_timer = instante
+        self.programados += 1
+
+    def _ejecutar(self):
+        self._timer = None
+        ahora = self._reloj()
+        vencidas = [v for v in self._tareas if self._vence(v, ahora) <= ahora]
+        self._pendientes.clear()
+        for vista in vencidas:
+            self._ultima[vista] = ahora
+            self.ejecutados += 1
+            try:
+                self._tareas[vista][0]()
+            except Exception as e:
+                print(f"Error al refrescar {vista}: {str(e)}")
+        self._programar()
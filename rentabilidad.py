@@ -0,0 +1,232 @@
+'''
+Evolucion historica de la cartera y rentabilidades.
+
+A partir de las aportaciones fechadas, de las compras y ventas del libro de lotes y de los cierres
+diarios guardados en local se construye una serie diaria de valor y aportaciones. Sobre ella se precalculan sumas acumuladas, de modo que la
+rentabilidad ponderada por tiempo (TWR) y las aportaciones de cualquier rango de fechas salen en
+tiempo constante. La TIR (XIRR) necesita iterar, pero solo sobre las aportaciones del rango.
+'''
+
+import threading
+from datetime import date
+
+import numpy as np
+
+from cotizaciones import moneda_y_fraccion, par_euro
+
+DIAS_ANIO = 365.0
+ITERACIONES_TIR = 100
+TOLERANCIA_TIR = 1e-10
+
+
+def a_dia(fecha):
+    # date, texto ISO o datetime64 -> datetime64[D]
+    return np.datetime64(str(fecha)[:10], 'D') if isinstance(fecha, (date, str)) else np.datetime64(fecha, 'D')
+
+
+def rellenar_huecos(valores):
+    # Cada nan toma el ultimo valor conocido anterior; los del principio, el primero conocido
+    conocidos = ~np.isnan(valores)
+    if not conocidos.any():
+        return valores
+    indices = np.where(conocidos, np.arange(len(valores)), 0)
+    indices[:np.argmax(conocidos)] = np.argmax(conocidos)
+    np.maximum.accumulate(indices, out=indices)
+    return valores[indices]
+
+
+def serie_cierres(historico, simbolo, fechas):
+    # Cierres de un simbolo sobre el calendario dado, arrastrando el ultimo cierre en fines de semana y
+    # festivos. Antes del primer cierre guardado se supone ese mismo precio.
+    valores = np.full(len(fechas), np.nan)
+    filas = historico.cierres(simbolo, hasta=str(fechas[-1]))
+    if filas:
+        dias = np.array([f[0] for f in filas], dtype='datetime64[D]')
+        cierres = np.array([f[1] for f in filas], dtype=np.float64)
+        # Lo anterior al calendario cuenta como cierre del primer dia
+        posiciones = np.clip((dias - fechas[0]).astype(np.int64), 0, len(fechas) - 1)
+        valores[posiciones] = cierres
+    return rellenar_huecos(valores)
+
+
+def cierres_en_euros(historico, simbolos, monedas, fechas):
+    # Matriz (simbolos x dias) con los cierres convertidos a euros con el tipo de cambio de cada dia
+    tasas = {'EUR': np.ones(len(fechas))}
+    matriz = np.full((len(simbolos), len(fechas)), np.nan)
+    for i, simbolo in enumerate(simbolos):
+        moneda, fraccion = moneda_y_fraccion(monedas.moneda(simbolo))
+        if moneda not in tasas:
+            tasas[moneda] = serie_cierres(historico, par_euro(moneda), fechas)
+        matriz[i] = serie_cierres(historico, simbolo, fechas) / fraccion / tasas[moneda]
+    return matriz
+
+
+class SerieCartera:
+    # Serie diaria (un punto por dia natural) con sus sumas acumuladas. valorada=False si no habia
+    # cierres con que valorar y los valores son solo lo aportado: entonces no hay TWR ni TIR.
+    def __init__(self, fechas, valores, aportaciones, valorada=True):
+        self.fechas = np.asarray(fechas, dtype='datetime64[D]')
+        self.valorada = valorada
+        self.valores = np.asarray(valores, dtype=np.float64)
+        self.aportaciones = np.asarray(aportaciones, dtype=np.float64)
+        self.aportado = np.cumsum(self.aportaciones)
+
+        # Rentabilidad de cada dia: las aportaciones se suponen hechas al cierre, con el precio del dia
+        anteriores = np.concatenate(([0.0], self.valores[:-1]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factores = np.where(anteriores > 0, (self.valores - self.aportaciones) / anteriores, 1.0)
+        self.rentabilidades = factores - 1
+        # log(1 + r) acumulado: la TWR entre dos dias es exp(diferencia) - 1
+        self.log_acumulado = np.cumsum(np.log(np.maximum(factores, 1e-12)))
+
+        self._dias_aportacion = np.flatnonzero(self.aportaciones)
+
+    def __len__(self):
+        return len(self.fechas)
+
+    def indice(self, fecha):
+        # Posicion del dia en la serie, limitada a sus extremos
+        return int(np.clip((a_dia(fecha) - self.fechas[0]).astype(np.int64), 0, len(self.fechas) - 1))
+
+    def aportado_entre(self, i, j):
+        # Aportaciones de los dias i+1..j: lo aportado el dia i ya esta en el valor inicial
+        return float(self.aportado[j] - self.aportado[i])
+
+    def twr(self, i, j):
+        return float(np.expm1(self.log_acumulado[j] - self.log_acumulado[i]))
+
+    def flujos(self, i, j):
+        # Flujos del inversor en el rango: valor inicial y aportaciones salen (negativos), el valor final entra
+        dias = self._dias_aportacion[np.searchsorted(self._dias_aportacion, i, side='right'):
+                                     np.searchsorted(self._dias_aportacion, j, side='right')]
+        posiciones = np.concatenate(([i], dias, [j]))
+        importes = np.concatenate(([-self.valores[i]], -self.aportaciones[dias], [self.valores[j]]))
+        return (posiciones - i) / DIAS_ANIO, importes
+
+    def xirr(self, i, j):
+        anios, importes = self.flujos(i, j)
+        return tir(anios, importes)
+
+    def rango(self, desde=None, hasta=None):
+        i = self.indice(desde) if desde is not None else 0
+        j = self.indice(hasta) if hasta is not None else len(self.fechas) - 1
+        return {
+            'desde': self.fechas[i].item(),
+            'hasta': self.fechas[j].item(),
+            'valor_inicial': float(self.valores[i]),
+            'valor_final': float(self.valores[j]),
+            'aportaciones': self.aportado_entre(i, j),
+            'twr': self.twr(i, j) if self.valorada else None,
+            'xirr': self.xirr(i, j) if self.valorada else None,
+        }
+
+
+def tir(anios, importes):
+    # Tasa anual que anula el valor actual de los flujos. Newton desde el 10% y biseccion si se escapa.
+    # None si no hay solucion (todos los flujos del mismo signo).
+    if not (importes > 0).any() or not (importes < 0).any():
+        return None
+
+    def van(tasa):
+        with np.errstate(over='ignore'):
+            return float(np.sum(importes * (1 + tasa) ** -anios))
+
+    tasa = 0.1
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        for _ in range(ITERACIONES_TIR):
+            descuento = (1 + tasa) ** -anios
+            valor = np.sum(importes * descuento)
+            derivada = np.sum(-anios * importes * descuento / (1 + tasa))
+            if derivada == 0:
+                break
+            nueva = tasa - valor / derivada
+            if not np.isfinite(nueva) or nueva <= -1:
+                break
+            if abs(nueva - tasa) < TOLERANCIA_TIR:
+                return float(nueva)
+            tasa = nueva
+
+    bajo, alto = -0.9999, 1.0
+    while van(alto) > 0 and alto < 1e6:
+        alto *= 2
+    if van(bajo) * van(alto) > 0:
+        return None
+    for _ in range(200):
+        medio = (bajo + alto) / 2
+        if van(bajo) * van(medio) <= 0:
+            alto = medio
+        else:
+            bajo = medio
+        if alto - bajo < TOLERANCIA_TIR:
+            break
+    return (bajo + alto) / 2
+
+
+def cantidades_por_dia(cartera, fechas):
+    # (simbolos, matriz simbolos x dias con las acciones que se tenian al cierre de cada dia) a partir de las
+    # compras y ventas fechadas. Lo anterior al calendario cuenta el primer dia y lo posterior no cuenta.
+    # Sin movimientos se supone que las cantidades de hoy se tenian desde el principio.
+    if cartera.tenencias is None:
+        return cartera.simbolos, np.repeat(cartera.cantidades[:, None], len(fechas), axis=1)
+    simbolos, dias, filas, cantidades = cartera.tenencias
+    matriz = np.zeros((len(simbolos), len(fechas)))
+    dentro = dias <= fechas[-1]
+    posiciones = np.maximum((dias[dentro] - fechas[0]).astype(np.int64), 0)
+    np.add.at(matriz, (filas[dentro], posiciones), cantidades[dentro])
+    return simbolos, np.cumsum(matriz, axis=1)
+
+
+def serie_cartera(cartera, historico, monedas, hasta=None):
+    # Serie diaria desde la primera aportacion, valorada como un fondo: cada aportacion compra
+    # participaciones al valor liquidativo del dia. El valor liquidativo sigue a las acciones que se
+    # tenian cada dia segun el libro de lotes (incluidas las ya vendidas): la rentabilidad de un dia es
+    # la de lo que se tenia al cierre del anterior, asi que comprar o vender no la mueve. La TWR es la
+    # de esas acciones y la TIR refleja cuando se aporto el dinero. El efectivo sin invertir no rinde.
+    hasta = a_dia(hasta or date.today())
+    inicio = min(cartera.fechas.min(), hasta) if len(cartera.fechas) else hasta
+    fechas = np.arange(inicio, hasta + 1, dtype='datetime64[D]')
+
+    posiciones = np.clip((cartera.fechas - inicio).astype(np.int64), 0, len(fechas) - 1)
+    aportaciones = np.bincount(posiciones, weights=cartera.aportaciones, minlength=len(fechas))
+
+    simbolos, cantidades = cantidades_por_dia(cartera, fechas)
+    valorada = False
+    factores = np.ones(len(fechas))
+    if simbolos:
+        # Lo que no tiene cierres (ni el simbolo ni su divisa) queda fuera de la valoracion todos los dias
+        cierres = np.nan_to_num(cierres_en_euros(historico, simbolos, monedas, fechas))
+        valorada = bool(((cantidades * cierres).sum(axis=0) > 0).any())
+        ayer = (cantidades[:, :-1] * cierres[:, :-1]).sum(axis=0)
+        hoy = (cantidades[:, :-1] * cierres[:, 1:]).sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            factores[1:] = np.where(ayer > 0, hoy / ayer, 1.0)
+    if not valorada:
+        # Sin cierres guardados no hay con que valorar: la serie es solo lo aportado
+        return SerieCartera(fechas, np.cumsum(aportaciones), aportaciones, valorada=False)
+
+    liquidativo = np.cumprod(factores)
+    participaciones = np.cumsum(aportaciones / liquidativo)
+    return SerieCartera(fechas, participaciones * liquidativo, aportaciones)
+
+
+class MotorRentabilidad:
+    # Guarda la ultima serie y solo la rehace si cambian los datos, el historico o el dia
+    def __init__(self, historico, monedas):
+        self.historico = historico
+        self.monedas = monedas
+        self._cartera = None
+        self._clave = None
+        self._serie = None
+        self._lock = threading.Lock()
+        self.construcciones = 0
+
+    def serie(self, cartera, hasta=None):
+        hasta = a_dia(hasta or date.today())
+        clave = (self.historico.cambios, hasta)
+        with self._lock:
+            if cartera is not self._cartera or clave != self._clave:
+                self._serie = serie_cartera(cartera, self.historico, self.monedas, hasta)
+                self._cartera = cartera
+                self._clave = clave
+                self.construcciones += 1
+            return self._serie
@@ -9,27 +9,42 @@ consultar precios actuales y gestionar efectivo. Crea automaticamente todos los
 
 
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import csv
+from tkinter import ttk, messagebox, simpledialog, filedialog
 import os
-from pathlib import Path
-import yfinance as yf
-from datetime import datetime
+import threading
+import time
+from datetime import date, datetime, timedelta
+from almacen import abrir_repositorio, preparar_exportacion
+from configuracion import (ACCIONES_FILE, ALMACENAMIENTO, DB_FILE, EFECTIVO_FILE, FLUJO_PRECIOS, FUENTE_PRECIOS,
+                           HISTORICO_FILE, MESES, METADATOS_FILE, METODO_COSTE, MONEDAS_FILE, PRECIOS_FILE, SQLITE_FILE,
+                           VIGILANCIA_FILE, lista_acciones)
+from cotizaciones import (CacheCotizaciones, MonedasInstrumentos, TrabajadorPrecios, UltimosPrecios, moneda_y_fraccion,
+                          par_euro, pares_necesarios, precios_con_respaldo, precios_en_euros)
+from directo import crear_suscriptor
+from fuentes import crear_fuente
+from historico import HistoricoPrecios
+from importador import Importacion
+from lotes import COMPRA, VENTA
+from medidas import Medidor
+from refresco import PlanificadorRefresco
+from simbolos import (CALENTAR_POR_SESION, MAX_SUGERENCIAS, IndiceSimbolos, MetadatosSimbolos, describir,
+                      metadatos_de_info)
+from tablas import IndiceRegistros, TablaIncremental, VentanaVirtual, iids_unicos
+from vigilancia import COLUMNAS, ListaVigilancia, formatear_fila, normalizar_simbolo, precios_por_lotes
 
-# Configuración inicial
-SCRIPT_DIR = Path(__file__).resolve().parent 
-DB_FILE = os.path.join(SCRIPT_DIR, "basedatosCY.csv")
-ACCIONES_FILE = os.path.join(SCRIPT_DIR, "accionesCY.csv")
-FIELDNAMES = ["id", "d", "m", "a", "cantidad", "trans"]
-ACCIONES_FIELDS = ["simbolo", "cantidad", "precio_compra", "notas"]
-VALID_TRANS = ['s', 'n']
-MESES = {
-    '01': 'Enero', '02': 'Febrero', '03': 'Marzo', '04': 'Abril',
-    '05': 'Mayo', '06': 'Junio', '07': 'Julio', '08': 'Agosto',
-    '09': 'Septiembre', '10': 'Octubre', '11': 'Noviembre', '12': 'Diciembre'
-}
-
-lista_acciones = ['BTC-USD', 'ETH-USD', 'XRP-USD', 'ADA-USD', 'NVDA', 'TSLA', 'AAPL', 'MSFT', 'AMZN', 'SAN.MC', 'BBVA.MC', 'ITX.MC', 'REP.MC', 'IBE.MC', 'SPY', '^STOXX50E']
+# Configuración inicial (rutas y constantes compartidas con la consola en configuracion.py)
+INTERVALO_RESULTADOS = 100  # ms entre revisiones de la cola de precios descargados
+INTERVALOS_REFRESCO = {'acciones': 15000, 'resumen': 15000, 'historico': 6 * 3600 * 1000,
+                       'vigilancia': 60000}  # ms entre refrescos automáticos por vista
+ALTO_FILA = 20  # px por fila en la tabla de registros, para saber cuántas caben
+ALTO_CABECERA = 25
+FILAS_RUEDA = 3  # filas que se desplazan con cada paso de la rueda del ratón
+MODULOS_PESADOS = ('yfinance', 'valoracion', 'rentabilidad')  # Se importan en segundo plano tras abrir la ventana
+INTERVALO_RENDIMIENTO = 2000  # ms entre refrescos de la pestaña de rendimiento
+INTERVALO_DIRECTO = 250  # ms entre recogidas de cotizaciones en directo
+INTERVALO_SONDEO_DIRECTO = 5 * 60 * 1000  # Con el directo funcionando, el sondeo completo solo repasa de vez en cuando
+INTERVALO_RESUMEN_DIRECTO = 1.0  # s mínimos entre repintados del resumen por cotizaciones en directo
+ESPERA_BUSQUEDA = 400  # ms sin teclear antes de preguntar a Yahoo por lo que no está en el índice local
 
 class StockApp:
     def __init__(self, root):
@@ -39,6 +54,44 @@ class StockApp:
         
         # Variables
         self.efectivo = 0.0  # Valor temporal, será sobrescrito por cargar_efectivo()
+        self.medidas = Medidor()  # Tiempos por etapa; apagado hasta activarlo en la pestaña de rendimiento
+        self.repo = abrir_repositorio(ALMACENAMIENTO, DB_FILE, ACCIONES_FILE, EFECTIVO_FILE, SQLITE_FILE, METODO_COSTE)
+        self.cotizaciones = CacheCotizaciones(crear_fuente(FUENTE_PRECIOS))  # Compartida por todas las pestañas
+        self.monedas = MonedasInstrumentos(MONEDAS_FILE)  # Moneda de cotización de cada símbolo
+        self.ultimos = UltimosPrecios(PRECIOS_FILE)  # Último precio conocido, para arrancar y para trabajar sin conexión
+        self.trabajador = TrabajadorPrecios(self.cotizaciones, self.monedas, ultimos=self.ultimos,
+                                             medidas=self.medidas)  # Descargas fuera del hilo de Tk
+        self.historico = HistoricoPrecios(HISTORICO_FILE)  # Cierres diarios guardados en local
+        self.motor = None  # Cálculo del resumen con arrays; se crea al valorar por primera vez (ver motores)
+        self.rentabilidad = None  # Serie diaria, TWR y TIR
+        self._lock_motores = threading.Lock()
+        self.resumen_con_descarga = False  # Ya se ha pintado un resumen tras intentar descargar
+        self.directo = crear_suscriptor(FLUJO_PRECIOS, self.cotizaciones)  # Ticks en directo; None para solo sondear
+        self.filas_acciones = {}  # simbolo -> (iid, accion) de lo pintado, para cambiar filas sueltas con los ticks
+        self.antiguos_acciones = {}
+        self.ultimo_resumen = None  # Último resultado pintado, que los ticks corrigen sin volver a valorar
+        self.resumen_pintado = 0.0
+        self.resumen_pendiente = False
+        self.estado_directo = None
+        self.vigilancia = ListaVigilancia(VIGILANCIA_FILE, lista_acciones)  # Editable desde su pestaña
+        self.motor_vigilancia = None  # Indicadores de la lista; se crea al escanear por primera vez
+        self.resultado_vigilancia = None
+        self.orden_vigilancia = ('simbolo', False)
+        self.metadatos = MetadatosSimbolos(METADATOS_FILE)  # Nombre, moneda, mercado y tipo, sin pedir Ticker.info cada vez
+        self.indice_simbolos = None  # Autocompletado; se crea al teclear el primer símbolo
+        self.simbolos_calentados = False
+        self.busqueda_pendiente = None
+        self.busquedas_hechas = set()  # Textos ya preguntados a Yahoo en esta sesión
+        
+        # Un solo temporizador para todos los refrescos automáticos
+        self.planificador = PlanificadorRefresco(root)
+        self.planificador.registrar('acciones', self.actualizar_lista_acciones, INTERVALOS_REFRESCO['acciones'])
+        self.planificador.registrar('resumen', self.actualizar_resumen, INTERVALOS_REFRESCO['resumen'])
+        self.planificador.registrar('historico', self.completar_historico, INTERVALOS_REFRESCO['historico'])
+        self.planificador.registrar('rendimiento', self.actualizar_rendimiento, INTERVALO_RENDIMIENTO)
+        self.planificador.registrar('vigilancia', self.actualizar_vigilancia, INTERVALOS_REFRESCO['vigilancia'])
+        if self.directo:
+            self.planificador.registrar('directo', self.aplicar_ticks, INTERVALO_DIRECTO)
         
         # Cargar datos iniciales
         self.inicializar_csv()
@@ -69,119 +122,213 @@ class StockApp:
         self.tab_control.add(self.tab_acciones, text='📈 Acciones')
         self.setup_acciones_tab()
         
+        # Pestaña de Vigilancia
+        self.tab_vigilancia = ttk.Frame(self.tab_control)
+        self.tab_control.add(self.tab_vigilancia, text='👀 Vigilancia')
+        self.setup_vigilancia_tab()
+        
         # Pestaña de Efectivo
         self.tab_efectivo = ttk.Frame(self.tab_control)
         self.tab_control.add(self.tab_efectivo, text='💵 Efectivo')
         self.setup_efectivo_tab()
         
+        # Pestaña de Rendimiento
+        self.tab_rendimiento = ttk.Frame(self.tab_control)
+        self.tab_control.add(self.tab_rendimiento, text='⏱ Rendimiento')
+        self.setup_rendimiento_tab()
+        
         self.tab_control.pack(expand=1, fill="both")
+        self.tab_control.bind('<<NotebookTabChanged>>', self.cambio_pestana)
         
-        # Cargar datos iniciales
-        self.inicializar_csv()
-        self.cargar_efectivo()
+        # Primero lo que sale de los archivos locales; importaciones pesadas y precios, en segundo plano
         self.actualizar_lista_registros()
-        self.actualizar_lista_acciones()
-        self.actualizar_info_acciones()
+        self.pintar_sin_precios()
+        self.trabajador.precargar(MODULOS_PESADOS)
+        self.planificador.solicitar()
+        
+        # Refrescar menos a menudo con la ventana minimizada o sin foco
+        for evento in ('<Map>', '<Unmap>', '<FocusIn>', '<FocusOut>'):
+            self.root.bind(evento, self.comprobar_reposo, add='+')
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.cerrar)
+        self.procesar_resultados()
+    
+    def motores(self):
+        # numpy se importa la primera vez que se valora, desde el hilo de precios
+        with self._lock_motores:
+            if self.motor is None:
+                from rentabilidad import MotorRentabilidad
+                from valoracion import MotorValoracion
+                self.motor = MotorValoracion()
+                self.rentabilidad = MotorRentabilidad(self.historico, self.monedas)
+            return self.motor, self.rentabilidad
+    
+    def precios_guardados(self, simbolos):
+        # (precios, antiguos) solo con los últimos precios guardados, sin red
+        precios, antiguos = {}, {}
+        for simbolo in simbolos:
+            guardado = self.ultimos.obtener(simbolo)
+            if guardado:
+                precios[simbolo], antiguos[simbolo] = guardado
+        return precios, antiguos
+    
+    def pintar_sin_precios(self):
+        # Mientras llega la primera descarga se enseñan los últimos precios guardados, marcados como antiguos
+        acciones = self.cargar_acciones()
+        self.mostrar_lista_acciones(acciones, *self.precios_guardados(a['simbolo'] for a in acciones), sin_precio="...")
+        self.resumen_text.config(state=tk.NORMAL)
+        self.resumen_text.delete(1.0, tk.END)
+        self.resumen_text.insert(tk.END, "Resumen de Inversión\n", 'header')
+        self.resumen_text.insert(tk.END, "\nEfectivo disponible: ", 'text')
+        self.resumen_text.insert(tk.END, f"{self.efectivo:.2f} €\n", 'positive' if self.efectivo >= 0 else 'negative')
+        self.resumen_text.insert(tk.END, "\nCargando cotizaciones...\n", 'text')
+        self.resumen_text.config(state=tk.DISABLED)
+        self.actualizar_resumen(descargar=False)
+    
+    def describir_antiguos(self, antiguos):
+        # Texto del aviso de precios sin actualizar, con la fecha del más viejo
+        instante = datetime.fromtimestamp(min(antiguos.values())).strftime('%d/%m/%Y %H:%M')
+        return f"Sin conexión: {len(antiguos)} precio(s) guardado(s), el más antiguo del {instante}"
+    
+    def procesar_resultados(self):
+        # Pintar lo que haya terminado de descargarse en segundo plano
+        for al_terminar, resultado in self.trabajador.recoger():
+            try:
+                with self.medidas.tramo('pintar_resultado'):
+                    al_terminar(resultado)
+            except Exception as e:
+                print(f"Error al mostrar resultado: {str(e)}")
+        self.root.after(INTERVALO_RESULTADOS, self.procesar_resultados)
+    
+    def comprobar_reposo(self, event=None):
+        try:
+            enfocada = self.root.focus_get() is not None
+        except (KeyError, tk.TclError):
+            enfocada = True
+        self.planificador.reposo(self.root.state() == 'iconic' or not enfocada)
+    
+    def cerrar(self):
+        self.planificador.detener()
+        if self.directo:
+            self.directo.cerrar()
+        self.trabajador.cerrar()
+        try:
+            self.repo.compactar()  # Dejar los CSV al día al salir
+        except Exception as e:
+            print(f"Error al compactar los datos: {str(e)}")
+        self.root.destroy()
     
     # Funciones base de datos
     def inicializar_csv(self):
-        if not os.path.exists(DB_FILE):
-            with open(DB_FILE, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.DictWriter(file, fieldnames=FIELDNAMES)
-                writer.writeheader()
-                
-        if not os.path.exists(ACCIONES_FILE):
-            with open(ACCIONES_FILE, mode='w', newline='', encoding='utf-8') as file:
-                writer = csv.DictWriter(file, fieldnames=ACCIONES_FIELDS)
-                writer.writeheader()
+        self.repo.inicializar()
 
     def cargar_registros(self):
-        try:
-            with open(DB_FILE, mode='r', newline='', encoding='utf-8') as file:
-                registros = list(csv.DictReader(file))
-                if registros and 'id' not in registros[0]:
-                    for i, r in enumerate(registros, 1):
-                        r['id'] = str(i)
-                return registros
-        except FileNotFoundError:
-            return []
+        with self.medidas.tramo('cargar_registros'):
+            return self.repo.registros()
 
     def cargar_acciones(self):
-        try:
-            with open(ACCIONES_FILE, mode='r', newline='', encoding='utf-8') as file:
-                return list(csv.DictReader(file))
-        except FileNotFoundError:
-            return []
+        with self.medidas.tramo('cargar_acciones'):
+            return self.repo.acciones()
 
     def cargar_efectivo(self):
-        try:
-            with open(os.path.join(SCRIPT_DIR, "efectivoCY.txt"), 'r') as f:
-                self.efectivo = float(f.read())
-        except (FileNotFoundError, ValueError):
-            # Si el archivo no existe o hay error en el formato, inicializar a 0
-            self.efectivo = 0.0
-            self.guardar_efectivo()  # Crear archivo con valor inicial
+        with self.medidas.tramo('cargar_efectivo'):
+            self.efectivo = self.repo.cargar_efectivo()
     
     def guardar_efectivo(self):
-        with open(os.path.join(SCRIPT_DIR, "efectivoCY.txt"), 'w') as f:
-            f.write(str(self.efectivo))
-
-    def guardar_registros(self, registros):
-        with open(DB_FILE, mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=FIELDNAMES)
-            writer.writeheader()
-            writer.writerows(registros)
-
-    def guardar_acciones(self, acciones):
-        with open(ACCIONES_FILE, mode='w', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=ACCIONES_FIELDS)
-            writer.writeheader()
-            writer.writerows(acciones)
+        with self.medidas.tramo('guardar_efectivo'):
+            self.repo.guardar_efectivo(self.efectivo)
 
     def obtener_proximo_id(self):
-        registros = self.cargar_registros()
-        if not registros:
-            return 1
-        return max(int(r['id']) for r in registros) + 1
+        return self.repo.proximo_id()
 
     # Funciones acciones
     def precio_en_euros(self, simbolo):
         try:
-            if simbolo.endswith('-USD') or simbolo in ['NVDA', 'TSLA', 'AAPL', 'MSFT', 'AMZN']:
-                accion = yf.Ticker(simbolo)
-                usd_eur = yf.Ticker("EURUSD=X").history(period='1d')['Close'].iloc[-1]
-                precio_usd = accion.history(period='1d')['Close'].iloc[-1]
-                return precio_usd / usd_eur
-            else:
-                return yf.Ticker(simbolo).history(period='1d')['Close'].iloc[-1]
+            with self.medidas.tramo('precio_en_euros'):
+                precios = precios_en_euros(self.cotizaciones, [simbolo], self.monedas)
         except Exception as e:
             raise ValueError(f"Error al obtener precio: {str(e)}")
+        if simbolo not in precios:
+            raise ValueError(f"Error al obtener precio: sin datos para {simbolo}")
+        return precios[simbolo]
+
+    def completar_historico(self):
+        # Descarga en segundo plano los cierres que falten de la cartera y sus divisas
+        # (los de la lista de vigilancia los completa su pestaña al escanear)
+        simbolos = list(dict.fromkeys(a['simbolo'] for a in self.cargar_acciones()))
+        
+        def completar():
+            self.monedas.resolver(simbolos, self.cotizaciones.fuente)
+            return self.historico.completar(simbolos + pares_necesarios(simbolos, self.monedas),
+                                            self.cotizaciones.fuente)
+        
+        def completado(nuevas):
+            # Con cierres nuevos cambian la serie diaria y la rentabilidad del resumen
+            if nuevas:
+                self.planificador.solicitar('resumen')
+        
+        self.trabajador.ejecutar(completar, completado)
 
     # GUI Registros
     def setup_registros_tab(self):
+        # Filtro por año y mes
+        filtro_frame = ttk.Frame(self.tab_registros)
+        filtro_frame.pack(fill='x', padx=10, pady=(10, 0))
+        
+        ttk.Label(filtro_frame, text="Año:").pack(side='left', padx=5)
+        self.filtro_anio = ttk.Combobox(filtro_frame, width=8, state='readonly', values=['Todos'])
+        self.filtro_anio.set('Todos')
+        self.filtro_anio.pack(side='left', padx=5)
+        
+        ttk.Label(filtro_frame, text="Mes:").pack(side='left', padx=5)
+        self.filtro_mes = ttk.Combobox(filtro_frame, width=12, state='readonly', values=['Todos'] + list(MESES.values()))
+        self.filtro_mes.set('Todos')
+        self.filtro_mes.pack(side='left', padx=5)
+        
+        for combo in (self.filtro_anio, self.filtro_mes):
+            combo.bind('<<ComboboxSelected>>', lambda e: self.filtrar_registros())
+        
+        self.invertido_label = ttk.Label(filtro_frame, text="")
+        self.invertido_label.pack(side='right', padx=5)
+        
         frame = ttk.Frame(self.tab_registros)
         frame.pack(fill='both', expand=True, padx=10, pady=10)
         
         scroll_y = ttk.Scrollbar(frame, orient='vertical')
         scroll_x = ttk.Scrollbar(frame, orient='horizontal')
         
+        # Solo existen en Tk las filas que se ven; la barra vertical recorre la lista completa
+        self.style.configure('Registros.Treeview', rowheight=ALTO_FILA)
         self.tree = ttk.Treeview(frame, columns=('ID', 'Fecha', 'Cantidad', 'Trans'), 
-                               yscrollcommand=scroll_y.set, xscrollcommand=scroll_x.set,
+                               xscrollcommand=scroll_x.set, style='Registros.Treeview',
                                selectmode='browse')
         
-        scroll_y.config(command=self.tree.yview)
+        self.tabla_registros = TablaIncremental(self.tree)
+        self.indice_registros = IndiceRegistros([])
+        self.ventana_registros = VentanaVirtual()
+        self.orden_registros = ('id', False)
+        self.scroll_registros = scroll_y
+        
+        scroll_y.config(command=self.desplazar_registros)
         scroll_x.config(command=self.tree.xview)
         
-        self.tree.heading('ID', text='ID', anchor='center')
-        self.tree.heading('Fecha', text='Fecha', anchor='center')
-        self.tree.heading('Cantidad', text='Cantidad (€)', anchor='center')
-        self.tree.heading('Trans', text='Transacción', anchor='center')
+        self.tree.heading('ID', text='ID', anchor='center', command=lambda: self.ordenar_registros('id'))
+        self.tree.heading('Fecha', text='Fecha', anchor='center', command=lambda: self.ordenar_registros('fecha'))
+        self.tree.heading('Cantidad', text='Cantidad (€)', anchor='center', command=lambda: self.ordenar_registros('cantidad'))
+        self.tree.heading('Trans', text='Transacción', anchor='center', command=lambda: self.ordenar_registros('trans'))
         
         self.tree.column('ID', width=50, anchor='center')
         self.tree.column('Fecha', width=150, anchor='center')
         self.tree.column('Cantidad', width=100, anchor='e')
         self.tree.column('Trans', width=100, anchor='center')
         
+        self.tree.bind('<Configure>', self.redimensionar_registros)
+        self.tree.bind('<MouseWheel>', lambda e: self.rueda_registros(-1 if e.delta > 0 else 1))
+        self.tree.bind('<Button-4>', lambda e: self.rueda_registros(-1))
+        self.tree.bind('<Button-5>', lambda e: self.rueda_registros(1))
+        self.tree.bind('<Up>', self.tecla_registros)
+        self.tree.bind('<Down>', self.tecla_registros)
+        
         self.tree.grid(row=0, column=0, sticky='nsew')
         scroll_y.grid(row=0, column=1, sticky='ns')
         scroll_x.grid(row=1, column=0, sticky='ew')
@@ -195,6 +342,8 @@ class StockApp:
         ttk.Button(btn_frame, text="➕ Añadir", command=self.agregar_registro_gui).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="✏️ Modificar", command=self.modificar_registro_gui).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="🗑️ Eliminar", command=self.eliminar_registro_gui).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="📥 Importar CSV", command=lambda: self.importar_gui('registros')).pack(side='left', padx=5)
+        ttk.Button(btn_frame, text="📤 Exportar CSV", command=self.exportar_gui).pack(side='left', padx=5)
         ttk.Button(btn_frame, text="🔄 Actualizar", command=self.actualizar_lista_registros).pack(side='right', padx=5)
     
     # GUI Acciones
@@ -211,6 +360,8 @@ class StockApp:
                                         yscrollcommand=scroll_y.set, xscrollcommand=scroll_x.set,
                                         selectmode='browse')
         
+        self.tabla_acciones = TablaIncremental(self.acciones_tree)
+        
         scroll_y.config(command=self.acciones_tree.yview)
         scroll_x.config(command=self.acciones_tree.xview)
         
@@ -235,23 +386,31 @@ class StockApp:
         acciones_list_frame.grid_rowconfigure(0, weight=1)
         acciones_list_frame.grid_columnconfigure(0, weight=1)
         
+        # Aviso cuando algún valor sale del último precio guardado
+        self.aviso_acciones = ttk.Label(self.tab_acciones, text="", foreground='#b36b00')
+        self.aviso_acciones.pack(fill='x', padx=10)
+        self.directo_label = ttk.Label(self.tab_acciones, text="Sondeo cada 15 s")
+        self.directo_label.pack(fill='x', padx=10)
+        
         # Frame para botones de acciones
         acciones_btn_frame = ttk.Frame(self.tab_acciones)
         acciones_btn_frame.pack(fill='x', padx=10, pady=5)
         
-        ttk.Button(acciones_btn_frame, text="➕ Añadir Acción", command=self.agregar_accion_gui).pack(side='left', padx=5)
-        ttk.Button(acciones_btn_frame, text="✏️ Modificar", command=self.modificar_accion_gui).pack(side='left', padx=5)
+        ttk.Button(acciones_btn_frame, text="➕ Compra/Venta", command=self.agregar_accion_gui).pack(side='left', padx=5)
+        ttk.Button(acciones_btn_frame, text="✏️ Lotes", command=self.modificar_accion_gui).pack(side='left', padx=5)
         ttk.Button(acciones_btn_frame, text="🗑️ Eliminar", command=self.eliminar_accion_gui).pack(side='left', padx=5)
-        ttk.Button(acciones_btn_frame, text="🔄 Actualizar", command=self.actualizar_lista_acciones).pack(side='right', padx=5)
+        ttk.Button(acciones_btn_frame, text="📥 Importar CSV", command=lambda: self.importar_gui('acciones')).pack(side='left', padx=5)
+        ttk.Button(acciones_btn_frame, text="🔄 Actualizar", command=lambda: self.planificador.solicitar('acciones')).pack(side='right', padx=5)
         
         # Frame de consulta
         consulta_frame = ttk.LabelFrame(self.tab_acciones, text="Consultar Acción/Cripto")
         consulta_frame.pack(fill='x', padx=10, pady=10)
         
         ttk.Label(consulta_frame, text="Símbolo:").pack(side='left', padx=5)
-        self.simbolo_entry = ttk.Entry(consulta_frame, width=15)
+        self.simbolo_entry = self.autocompletar(ttk.Combobox(consulta_frame, width=40))
         self.simbolo_entry.pack(side='left', padx=5)
         self.simbolo_entry.insert(0, "NVDA")
+        self.simbolo_entry.bind('<Return>', lambda event: self.consultar_accion())
         
         ttk.Button(consulta_frame, text="Buscar", command=self.consultar_accion).pack(side='left', padx=5)
         
@@ -271,6 +430,44 @@ class StockApp:
         self.resultado_text.tag_configure('positive', foreground='green')
         self.resultado_text.tag_configure('negative', foreground='red')
     
+    # GUI Vigilancia
+    def setup_vigilancia_tab(self):
+        controles = ttk.Frame(self.tab_vigilancia)
+        controles.pack(fill='x', padx=10, pady=5)
+        
+        ttk.Label(controles, text="Símbolo:").pack(side='left', padx=5)
+        self.vigilancia_entry = self.autocompletar(ttk.Combobox(controles, width=30))
+        self.vigilancia_entry.pack(side='left', padx=5)
+        self.vigilancia_entry.bind('<Return>', lambda event: self.agregar_vigilancia())
+        ttk.Button(controles, text="➕ Añadir", command=self.agregar_vigilancia).pack(side='left', padx=5)
+        ttk.Button(controles, text="🗑️ Quitar", command=self.quitar_vigilancia).pack(side='left', padx=5)
+        
+        ttk.Label(controles, text="Filtro:").pack(side='left', padx=(20, 5))
+        self.filtro_vigilancia = ttk.Entry(controles, width=30)
+        self.filtro_vigilancia.pack(side='left', padx=5)
+        self.filtro_vigilancia.bind('<Return>', lambda event: self.pintar_vigilancia())
+        ttk.Button(controles, text="Filtrar", command=self.pintar_vigilancia).pack(side='left', padx=5)
+        ttk.Button(controles, text="🔄 Escanear", command=lambda: self.planificador.solicitar('vigilancia')).pack(side='right', padx=5)
+        
+        lista_frame = ttk.LabelFrame(self.tab_vigilancia, text="Lista de vigilancia (filtro, p. ej.: rsi<30 cambio>2 .MC)")
+        lista_frame.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        scroll_y = ttk.Scrollbar(lista_frame, orient='vertical')
+        claves = [clave for clave, _, _ in COLUMNAS]
+        self.vigilancia_tree = ttk.Treeview(lista_frame, columns=claves, show='headings', yscrollcommand=scroll_y.set)
+        scroll_y.config(command=self.vigilancia_tree.yview)
+        for clave, titulo, _ in COLUMNAS:
+            self.vigilancia_tree.heading(clave, text=titulo, anchor='center',
+                                         command=lambda clave=clave: self.ordenar_vigilancia(clave))
+            self.vigilancia_tree.column(clave, width=90, anchor='center')
+        self.tabla_vigilancia = TablaIncremental(self.vigilancia_tree)
+        
+        self.vigilancia_tree.pack(side='left', fill='both', expand=True)
+        scroll_y.pack(side='right', fill='y')
+        
+        self.estado_vigilancia = ttk.Label(self.tab_vigilancia, text="Abre esta pestaña para escanear la lista")
+        self.estado_vigilancia.pack(fill='x', padx=10, pady=5)
+    
     # GUI Efectivo
     def setup_efectivo_tab(self):
         frame = ttk.Frame(self.tab_efectivo)
@@ -314,7 +511,7 @@ class StockApp:
                 
                 self.guardar_efectivo()
                 self.actualizar_efectivo_display()
-                self.actualizar_resumen()
+                self.planificador.solicitar('resumen')
                 messagebox.showinfo("Éxito", f"Operación realizada. Nuevo saldo: {self.efectivo:.2f} €")
             except Exception as e:
                 messagebox.showerror("Error", f"No se pudo realizar la operación: {str(e)}")
@@ -322,6 +519,80 @@ class StockApp:
     def actualizar_efectivo_display(self):
         self.efectivo_label.config(text=f"Efectivo disponible: {self.efectivo:.2f} €")
     
+    # GUI Rendimiento
+    def setup_rendimiento_tab(self):
+        frame = ttk.Frame(self.tab_rendimiento)
+        frame.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        # Medir cuesta poco, pero solo se mide mientras esta casilla esté marcada
+        controles = ttk.Frame(frame)
+        controles.pack(fill='x', pady=5)
+        self.medir_var = tk.BooleanVar(value=self.medidas.activo)
+        ttk.Checkbutton(controles, text="Medir tiempos", variable=self.medir_var, command=self.cambiar_medicion).pack(side='left', padx=5)
+        ttk.Button(controles, text="Exportar traza...", command=self.exportar_traza).pack(side='right', padx=5)
+        ttk.Button(controles, text="Reiniciar", command=self.reiniciar_medidas).pack(side='right', padx=5)
+        
+        etapas_frame = ttk.LabelFrame(frame, text="Tiempo por etapa (ms)")
+        etapas_frame.pack(fill='both', expand=True, pady=5)
+        columnas = ('Etapa', 'Llamadas', 'p50', 'p99', 'Máximo', 'Total')
+        self.rendimiento_tree = ttk.Treeview(etapas_frame, columns=columnas, show='headings', height=12)
+        for columna in columnas:
+            self.rendimiento_tree.heading(columna, text=columna, anchor='center')
+            self.rendimiento_tree.column(columna, width=180 if columna == 'Etapa' else 90,
+                                         anchor='w' if columna == 'Etapa' else 'e')
+        self.rendimiento_tree.pack(fill='both', expand=True)
+        self.tabla_rendimiento = TablaIncremental(self.rendimiento_tree)
+        
+        self.contadores_label = ttk.Label(frame, text="", justify='left')
+        self.contadores_label.pack(fill='x', pady=5)
+    
+    def cambiar_medicion(self):
+        self.medidas.activo = self.medir_var.get()
+        self.actualizar_rendimiento()
+    
+    def reiniciar_medidas(self):
+        self.medidas.reiniciar()
+        self.actualizar_rendimiento()
+    
+    def exportar_traza(self):
+        ruta = filedialog.asksaveasfilename(title="Exportar traza", defaultextension='.json',
+                                            initialfile='traza.json', filetypes=[('Traza de Chrome', '*.json')])
+        if not ruta:
+            return
+        try:
+            self.medidas.exportar_traza(ruta)
+            messagebox.showinfo("Éxito", f"Traza guardada en {ruta}\nSe puede abrir en chrome://tracing o ui.perfetto.dev")
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar la traza: {str(e)}")
+    
+    def rendimiento_visible(self):
+        return self.pestana_visible(self.tab_rendimiento)
+    
+    def actualizar_rendimiento(self):
+        # Etapas medidas, descargas, aciertos de la caché y tiempo que el hilo de Tk ha estado ocupado.
+        # Solo con la pestaña a la vista; al abrirla se pinta en el momento (cambio_pestana).
+        if not self.rendimiento_visible():
+            return
+        filas = [(etapa, (etapa, llamadas, f"{p50:.2f}", f"{p99:.2f}", f"{maximo:.2f}", f"{total:.1f}"))
+                 for etapa, llamadas, p50, p99, maximo, total in self.medidas.resumen()]
+        self.tabla_rendimiento.sincronizar(filas)
+        
+        cache = self.cotizaciones.estadisticas()
+        lineas = [
+            f"Descargas de precios: {cache['descargas']} | Consultas a la caché: {cache['aciertos'] + cache['fallos']}"
+            f" | Aciertos: {cache['tasa_aciertos'] * 100:.1f}%",
+        ]
+        cliente = getattr(self.cotizaciones.fuente, 'cliente', None)
+        if cliente is not None:
+            red = cliente.estadisticas()
+            lineas.append(f"Peticiones HTTP: {red['peticiones']} | Reintentadas: {red['reintentadas']}"
+                          f" | Limitadas: {red['limitadas']} | Circuito: {red['circuito']}")
+        lineas.append(f"Hilo principal: {self.medidas.bloqueado_ms:.1f} ms ocupado en etapas medidas"
+                      f" | Mayor bloqueo: {self.medidas.bloqueo_max_ms:.1f} ms")
+        if not self.medidas.activo:
+            lineas.append("Medición desactivada")
+        self.contadores_label.config(text="\n".join(lineas))
+    
     # GUI Resumen
     def setup_resumen_tab(self):
         resumen_frame = ttk.LabelFrame(self.tab_resumen, text="Resumen Financiero")
@@ -340,168 +611,413 @@ class StockApp:
         self.resumen_text.tag_configure('negative', foreground='red', font=('Arial', 16, 'bold'))
         self.resumen_text.tag_configure('text', font=('Arial', 20))
         self.resumen_text.tag_configure('highlight', font=('Arial', 28, 'bold'))
-        
-        # Actualizar periódicamente
-        self.actualizar_resumen()
+        self.resumen_text.tag_configure('aviso', foreground='#b36b00', font=('Arial', 12))
+    
+    # Funciones GUI Vigilancia
+    def pestana_visible(self, pestana):
+        try:
+            return self.tab_control.select() == str(pestana)
+        except tk.TclError:
+            return False
+    
+    def vigilancia_visible(self):
+        return self.pestana_visible(self.tab_vigilancia)
+    
+    def cambio_pestana(self, event=None):
+        # Las pestañas que solo se refrescan a la vista se ponen al día al abrirlas
+        if self.vigilancia_visible():
+            self.planificador.solicitar('vigilancia')
+        elif self.rendimiento_visible():
+            self.planificador.solicitar('rendimiento')
+    
+    def actualizar_vigilancia(self):
+        # Solo con la pestaña a la vista: precios de toda la lista por lotes en paralelo e indicadores con
+        # el histórico ya guardado (que se completa una vez al día)
+        if not self.vigilancia_visible():
+            return
+        simbolos = self.vigilancia.simbolos()
+        
+        def escanear():
+            from indicadores import MotorVigilancia
+            inicio = time.perf_counter()
+            with self.medidas.tramo('vigilancia'):
+                with self._lock_motores:
+                    if self.motor_vigilancia is None:
+                        self.motor_vigilancia = MotorVigilancia(self.historico)
+                try:
+                    self.motor_vigilancia.completar(simbolos, self.cotizaciones.fuente)
+                except Exception as e:
+                    print(f"Error al completar el histórico de vigilancia: {str(e)}")
+                precios = precios_por_lotes(self.cotizaciones, simbolos)
+                resultado = self.motor_vigilancia.escanear(simbolos, precios)
+            resultado['segundos'] = time.perf_counter() - inicio
+            return resultado
+        
+        self.estado_vigilancia.config(text=f"Escaneando {len(simbolos)} símbolos...")
+        self.trabajador.ejecutar(escanear, self.mostrar_vigilancia,
+                                 lambda e: self.estado_vigilancia.config(text=f"Error al escanear: {str(e)}"))
+    
+    def mostrar_vigilancia(self, resultado):
+        self.resultado_vigilancia = resultado
+        self.pintar_vigilancia()
+    
+    def pintar_vigilancia(self):
+        # Filtrar y ordenar trabajan sobre los arrays del último escaneo, sin volver a descargar
+        resultado = self.resultado_vigilancia
+        if resultado is None:
+            return
+        from indicadores import filtrar, ordenar
+        try:
+            posiciones = filtrar(resultado, self.filtro_vigilancia.get())
+        except ValueError as e:
+            self.estado_vigilancia.config(text=str(e))
+            return
+        clave, descendente = self.orden_vigilancia
+        posiciones = ordenar(resultado, posiciones, clave, descendente)
+        filas = [(resultado['simbolos'][i], formatear_fila(resultado, i)) for i in posiciones]
+        with self.medidas.tramo('tabla_vigilancia'):
+            self.tabla_vigilancia.sincronizar(filas)
+        
+        total = len(resultado['simbolos'])
+        sin_precio = total - int(resultado['con_precio'].sum())
+        estado = f"{len(filas)} de {total} símbolos · escaneado en {resultado['segundos']:.1f} s"
+        if sin_precio:
+            estado += f" · {sin_precio} sin precio actual (se usa el último cierre)"
+        self.estado_vigilancia.config(text=estado)
+    
+    def ordenar_vigilancia(self, clave):
+        actual, descendente = self.orden_vigilancia
+        self.orden_vigilancia = (clave, not descendente if clave == actual else False)
+        self.pintar_vigilancia()
+    
+    def agregar_vigilancia(self):
+        # Admite varios separados por comas o espacios
+        simbolos = [normalizar_simbolo(s) for s in self.vigilancia_entry.get().replace(',', ' ').split()]
+        if not simbolos:
+            return
+        nuevos = self.vigilancia.agregar(simbolos)
+        self.vigilancia_entry.delete(0, tk.END)
+        if not nuevos:
+            messagebox.showwarning("Advertencia", "Ya está en la lista de vigilancia")
+            return
+        self.planificador.solicitar('vigilancia')
+    
+    def quitar_vigilancia(self):
+        seleccion = self.vigilancia_tree.selection()
+        if not seleccion:
+            messagebox.showwarning("Advertencia", "Seleccione los símbolos a quitar")
+            return
+        self.vigilancia.quitar(seleccion)
+        self.planificador.solicitar('vigilancia')
     
     # Funciones GUI Acciones
     def actualizar_lista_acciones(self):
-        for i in self.acciones_tree.get_children():
-            self.acciones_tree.delete(i)
-        
         acciones = self.cargar_acciones()
-        for accion in acciones:
+        self.trabajador.solicitar_precios([a['simbolo'] for a in acciones],
+                                          lambda precios, antiguos: self.mostrar_lista_acciones(acciones, precios, antiguos))
+    
+    def fila_accion(self, accion, precios, antiguos, sin_precio="sin datos"):
+        # Los precios antiguos (guardados, no descargados ahora) se marcan con * en el valor
+        simbolo = accion['simbolo']
+        cantidad = float(accion['cantidad'])
+        precio_compra = float(accion['precio_compra'])
+        notas = accion.get('notas', '')
+        if simbolo not in precios:
+            return (simbolo, f"{cantidad:.5f}", f"{precio_compra:.4f}", sin_precio, sin_precio, notas)
+        precio_actual = precios[simbolo]
+        valor_actual = cantidad * precio_actual
+        beneficio = valor_actual - (cantidad * precio_compra)
+        marca = " *" if simbolo in antiguos else ""
+        
+        return (
+            simbolo,
+            f"{cantidad:.5f}",
+            f"{precio_compra:.4f}",
+            f"{valor_actual:.2f}{marca}",
+            f"{beneficio:.2f}{marca}",
+            notas
+        )
+    
+    def mostrar_lista_acciones(self, acciones, precios, antiguos, sin_precio="sin datos"):
+        filas = []
+        self.filas_acciones = {}
+        for iid, accion in zip(iids_unicos(a['simbolo'] for a in acciones), acciones):
             try:
-                simbolo = accion['simbolo']
-                cantidad = float(accion['cantidad'])
-                precio_compra = float(accion['precio_compra'])
-                precio_actual = self.precio_en_euros(simbolo)
-                valor_actual = cantidad * precio_actual
-                beneficio = valor_actual - (cantidad * precio_compra)
-                notas = accion.get('notas', '')
-                
-                self.acciones_tree.insert('', 'end', values=(
-                    simbolo,
-                    f"{cantidad:.5f}",
-                    f"{precio_compra:.4f}",
-                    f"{valor_actual:.2f}",
-                    f"{beneficio:.2f}",
-                    notas
-                ))
+                filas.append((iid, self.fila_accion(accion, precios, antiguos, sin_precio)))
+                self.filas_acciones[accion['simbolo']] = (iid, accion)
             except Exception as e:
                 print(f"Error al cargar acción {accion.get('simbolo', '')}: {str(e)}")
+        
+        # Solo se tocan las filas que han cambiado
+        with self.medidas.tramo('tabla_acciones'):
+            self.tabla_acciones.sincronizar(filas)
+        self.antiguos_acciones = dict(antiguos)
+        self.aviso_acciones.config(text=f"* {self.describir_antiguos(antiguos)}" if antiguos else "")
+        self.suscribir_directo()
+    
+    # Cotizaciones en directo
+    def suscribir_directo(self):
+        # Las posiciones y los pares para pasarlas a euros; el suscriptor solo avisa al servidor de lo que cambia
+        if not self.directo:
+            return
+        simbolos = set(self.filas_acciones)
+        if self.ultimo_resumen is not None:
+            simbolos.update(self.ultimo_resumen['simbolos'])
+        self.directo.suscribir(sorted(simbolos) + pares_necesarios(simbolos, self.monedas))
+    
+    def aplicar_ticks(self):
+        # Cada INTERVALO_DIRECTO: lo que ha cambiado desde la última vez, sea cual sea el número de ticks
+        self.mostrar_estado_directo()
+        if self.resumen_pendiente and time.monotonic() - self.resumen_pintado >= INTERVALO_RESUMEN_DIRECTO:
+            self.pintar_resumen_directo()
+        ticks = self.directo.recoger()
+        if not ticks:
+            return
+        with self.medidas.tramo('ticks'):
+            simbolos = set(self.filas_acciones)
+            if self.ultimo_resumen is not None:
+                simbolos.update(self.ultimo_resumen['simbolos'])
+            # Una acción cambia si cambia su precio o el del par con el que se pasa a euros
+            afectados = [s for s in simbolos
+                         if s in ticks or par_euro(moneda_y_fraccion(self.monedas.moneda(s))[0]) in ticks]
+        if afectados:
+            # Salen de la caché, donde el suscriptor acaba de guardar los ticks
+            self.trabajador.solicitar_precios(afectados, self.mostrar_ticks)
+    
+    def mostrar_ticks(self, precios, antiguos):
+        # Solo las filas afectadas; el resumen se corrige con revalorar y se repinta como mucho una vez por segundo
+        frescos = {s: p for s, p in precios.items() if s not in antiguos}
+        if not frescos:
+            return
+        with self.medidas.tramo('pintar_ticks'):
+            for simbolo in frescos:
+                self.antiguos_acciones.pop(simbolo, None)
+                fila = self.filas_acciones.get(simbolo)
+                if fila:
+                    iid, accion = fila
+                    self.tabla_acciones.actualizar(iid, self.fila_accion(accion, frescos, self.antiguos_acciones))
+            self.aviso_acciones.config(
+                text=f"* {self.describir_antiguos(self.antiguos_acciones)}" if self.antiguos_acciones else "")
+            if self.ultimo_resumen is not None:
+                from valoracion import revalorar
+                if revalorar(self.ultimo_resumen, frescos):
+                    for simbolo in frescos:
+                        self.ultimo_resumen['antiguos'].pop(simbolo, None)
+                    self.resumen_pendiente = True
+        if self.resumen_pendiente and time.monotonic() - self.resumen_pintado >= INTERVALO_RESUMEN_DIRECTO:
+            self.pintar_resumen_directo()
+    
+    def pintar_resumen_directo(self):
+        self.resumen_pendiente = False
+        with self.medidas.tramo('pintar_resumen'):
+            self.pintar_resumen(self.ultimo_resumen)
+    
+    def mostrar_estado_directo(self):
+        # Con ticks llegando, el sondeo completo de acciones y resumen se espacia; sin ellos vuelve a 15 s
+        estado = self.directo.estado
+        if estado == self.estado_directo:
+            return
+        en_directo = self.directo.en_directo()
+        if en_directo or self.estado_directo == 'directo':
+            for vista in ('acciones', 'resumen'):
+                self.planificador.cambiar_intervalo(vista, INTERVALO_SONDEO_DIRECTO if en_directo
+                                                    else INTERVALOS_REFRESCO[vista])
+            if not en_directo:
+                self.planificador.solicitar('acciones', 'resumen')  # Se ha cortado: lo último sondeado puede ser viejo
+        self.estado_directo = estado
+        textos = {'directo': "⚡ En directo", 'conectando': "Conectando cotizaciones en directo..."}
+        self.directo_label.config(text=textos.get(estado, f"Sondeo cada {INTERVALOS_REFRESCO['acciones'] // 1000} s"))
     
     def agregar_accion_gui(self):
+        # Una compra o una venta con su fecha; cada compra es un lote
         dialog = tk.Toplevel(self.root)
-        dialog.title("Añadir Acción")
+        dialog.title("Compra / Venta")
         dialog.geometry("400x300")
         
-        ttk.Label(dialog, text="Símbolo:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-        simbolo_entry = ttk.Entry(dialog)
-        simbolo_entry.grid(row=0, column=1, sticky='w')
+        seleccion = self.acciones_tree.selection()
+        hoy = datetime.now()
+        
+        ttk.Label(dialog, text="Fecha (DD/MM/AAAA):").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+        fecha_entry = ttk.Entry(dialog)
+        fecha_entry.insert(0, hoy.strftime('%d/%m/%Y'))
+        fecha_entry.grid(row=0, column=1, sticky='w')
         
-        ttk.Label(dialog, text="Cantidad:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+        ttk.Label(dialog, text="Operación:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+        tipo_var = tk.StringVar(value=COMPRA)
+        ttk.Radiobutton(dialog, text="Compra", variable=tipo_var, value=COMPRA).grid(row=1, column=1, sticky='w')
+        ttk.Radiobutton(dialog, text="Venta", variable=tipo_var, value=VENTA).grid(row=2, column=1, sticky='w')
+        
+        ttk.Label(dialog, text="Símbolo:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
+        simbolo_entry = self.autocompletar(ttk.Combobox(dialog, width=30))
+        if seleccion:
+            simbolo_entry.insert(0, self.acciones_tree.item(seleccion[0])['values'][0])
+        simbolo_entry.grid(row=3, column=1, sticky='w')
+        
+        ttk.Label(dialog, text="Cantidad:").grid(row=4, column=0, padx=5, pady=5, sticky='e')
         cantidad_entry = ttk.Entry(dialog)
-        cantidad_entry.grid(row=1, column=1, sticky='w')
+        cantidad_entry.grid(row=4, column=1, sticky='w')
         
-        ttk.Label(dialog, text="Precio compra (€):").grid(row=2, column=0, padx=5, pady=5, sticky='e')
+        ttk.Label(dialog, text="Precio (€):").grid(row=5, column=0, padx=5, pady=5, sticky='e')
         precio_entry = ttk.Entry(dialog)
-        precio_entry.grid(row=2, column=1, sticky='w')
+        precio_entry.grid(row=5, column=1, sticky='w')
         
-        ttk.Label(dialog, text="Notas:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
+        ttk.Label(dialog, text="Notas:").grid(row=6, column=0, padx=5, pady=5, sticky='e')
         notas_entry = ttk.Entry(dialog)
-        notas_entry.grid(row=3, column=1, sticky='w')
+        notas_entry.grid(row=6, column=1, sticky='w')
         
         def guardar():
             try:
-                simbolo = simbolo_entry.get().strip().upper()
+                fecha = datetime.strptime(fecha_entry.get().strip(), '%d/%m/%Y')
+                simbolo = self.simbolo_escrito(simbolo_entry)
                 cantidad = float(cantidad_entry.get())
-                precio_compra = float(precio_entry.get())
+                precio = float(precio_entry.get())
                 notas = notas_entry.get()
                 
-                if cantidad <= 0 or precio_compra <= 0:
+                if cantidad <= 0 or precio <= 0:
                     raise ValueError("Cantidad y precio deben ser positivos")
-                
-                # Verificar que el símbolo existe
+            except Exception as e:
+                messagebox.showerror("Error", f"Datos inválidos: {str(e)}")
+                return
+            
+            def simbolo_invalido(e):
+                messagebox.showerror("Error", f"Datos inválidos: Símbolo no válido: {str(e)}")
+            
+            def confirmar(_precio=None):
                 try:
-                    self.precio_en_euros(simbolo)
-                except Exception as e:
-                    raise ValueError(f"Símbolo no válido: {str(e)}")
+                    with self.medidas.tramo('guardar_accion'), self.repo.lote():
+                        self.repo.agregar_movimiento({
+                            'simbolo': simbolo,
+                            'd': f"{fecha.day:02d}",
+                            'm': f"{fecha.month:02d}",
+                            'a': str(fecha.year),
+                            'tipo': tipo_var.get(),
+                            'cantidad': cantidad,
+                            'precio': precio
+                        })
+                        if notas:
+                            self.repo.guardar_notas(simbolo, notas)
+                except ValueError as e:
+                    # Por ejemplo, una venta de más acciones de las que había en esa fecha
+                    messagebox.showerror("Error", str(e))
+                    return
                 
-                acciones = self.cargar_acciones()
-                acciones.append({
-                    'simbolo': simbolo,
-                    'cantidad': str(cantidad),
-                    'precio_compra': str(precio_compra),
-                    'notas': notas
-                })
-                
-                self.guardar_acciones(acciones)
-                self.actualizar_lista_acciones()
-                self.actualizar_resumen()
+                self.planificador.solicitar('acciones', 'resumen')
                 dialog.destroy()
-                messagebox.showinfo("Éxito", "Acción añadida correctamente")
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Datos inválidos: {str(e)}")
+                messagebox.showinfo("Éxito", "Operación añadida correctamente")
+            
+            # Verificar que el símbolo existe (si no es uno que ya tenemos o conocemos) sin bloquear la ventana
+            if self.repo.posicion(simbolo) is None and not self.simbolo_conocido(simbolo):
+                self.trabajador.ejecutar(lambda: self.precio_en_euros(simbolo), confirmar, simbolo_invalido)
+            else:
+                confirmar()
         
-        ttk.Button(dialog, text="Guardar", command=guardar).grid(row=4, column=1, pady=10, sticky='e')
+        ttk.Button(dialog, text="Guardar", command=guardar).grid(row=7, column=1, pady=10, sticky='e')
     
     def modificar_accion_gui(self):
+        # Los lotes del símbolo seleccionado: se puede renombrar, cambiar las notas o borrar compras y ventas
         seleccion = self.acciones_tree.selection()
         if not seleccion:
             messagebox.showwarning("Advertencia", "Seleccione una acción para modificar")
             return
         
         item = self.acciones_tree.item(seleccion[0])
-        valores = item['values']
-        simbolo_original = valores[0]
+        simbolo_original = item['values'][0]
         
-        acciones = self.cargar_acciones()
-        accion = next((a for a in acciones if a['simbolo'] == simbolo_original), None)
+        accion = self.repo.accion(simbolo_original)
         
         if not accion:
             messagebox.showerror("Error", "Acción no encontrada")
             return
         
         dialog = tk.Toplevel(self.root)
-        dialog.title(f"Modificar Acción {simbolo_original}")
-        dialog.geometry("400x300")
+        dialog.title(f"Lotes de {simbolo_original}")
+        dialog.geometry("520x420")
         
-        ttk.Label(dialog, text="Símbolo:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
-        simbolo_entry = ttk.Entry(dialog)
+        datos_frame = ttk.Frame(dialog)
+        datos_frame.pack(fill='x', padx=10, pady=5)
+        
+        ttk.Label(datos_frame, text="Símbolo:").grid(row=0, column=0, padx=5, pady=5, sticky='e')
+        simbolo_entry = self.autocompletar(ttk.Combobox(datos_frame, width=37))
         simbolo_entry.insert(0, accion['simbolo'])
         simbolo_entry.grid(row=0, column=1, sticky='w')
         
-        ttk.Label(dialog, text="Cantidad:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
-        cantidad_entry = ttk.Entry(dialog)
-        cantidad_entry.insert(0, accion['cantidad'])
-        cantidad_entry.grid(row=1, column=1, sticky='w')
-        
-        ttk.Label(dialog, text="Precio compra (€):").grid(row=2, column=0, padx=5, pady=5, sticky='e')
-        precio_entry = ttk.Entry(dialog)
-        precio_entry.insert(0, accion['precio_compra'])
-        precio_entry.grid(row=2, column=1, sticky='w')
-        
-        ttk.Label(dialog, text="Notas:").grid(row=3, column=0, padx=5, pady=5, sticky='e')
-        notas_entry = ttk.Entry(dialog)
+        ttk.Label(datos_frame, text="Notas:").grid(row=1, column=0, padx=5, pady=5, sticky='e')
+        notas_entry = ttk.Entry(datos_frame, width=40)
         notas_entry.insert(0, accion.get('notas', ''))
-        notas_entry.grid(row=3, column=1, sticky='w')
+        notas_entry.grid(row=1, column=1, sticky='w')
+        
+        posicion_label = ttk.Label(dialog, text="")
+        posicion_label.pack(fill='x', padx=10)
+        
+        lotes_tree = ttk.Treeview(dialog, columns=('Fecha', 'Operación', 'Cantidad', 'Precio'), show='headings', height=10)
+        for columna, texto in (('Fecha', 'Fecha'), ('Operación', 'Operación'), ('Cantidad', 'Cantidad'),
+                               ('Precio', 'Precio (€)')):
+            lotes_tree.heading(columna, text=texto, anchor='center')
+            lotes_tree.column(columna, width=110, anchor='center')
+        lotes_tree.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        def pintar():
+            posicion = self.repo.posicion(simbolo_original)
+            lotes_tree.delete(*lotes_tree.get_children())
+            if posicion is None:
+                posicion_label.config(text="Sin movimientos")
+                return
+            for movimiento in self.repo.movimientos(simbolo_original):
+                lotes_tree.insert('', tk.END, iid=str(movimiento['id']), values=(
+                    f"{movimiento['d']}/{movimiento['m']}/{movimiento['a']}",
+                    movimiento['tipo'].capitalize(),
+                    f"{movimiento['cantidad']:.5f}",
+                    f"{movimiento['precio']:.4f}"
+                ))
+            posicion_label.config(text=f"{posicion['cantidad']:.5f} acciones a {posicion['precio_compra']:.4f} € | "
+                                       f"Realizado: {posicion['realizado_fifo']:.2f} € (FIFO), "
+                                       f"{posicion['realizado_medio']:.2f} € (coste medio)")
+        
+        def eliminar_movimiento():
+            seleccionado = lotes_tree.selection()
+            if not seleccionado:
+                messagebox.showwarning("Advertencia", "Seleccione una compra o venta para eliminar", parent=dialog)
+                return
+            if not messagebox.askyesno("Confirmar", "¿Eliminar la operación seleccionada?", parent=dialog):
+                return
+            try:
+                with self.medidas.tramo('guardar_accion'):
+                    self.repo.eliminar_movimiento(int(seleccionado[0]))
+            except ValueError as e:
+                messagebox.showerror("Error", f"No se puede eliminar: {str(e)}", parent=dialog)
+                return
+            pintar()
+            self.planificador.solicitar('acciones', 'resumen')
         
         def guardar():
-            try:
-                simbolo = simbolo_entry.get().strip().upper()
-                cantidad = float(cantidad_entry.get())
-                precio_compra = float(precio_entry.get())
-                notas = notas_entry.get()
-                
-                if cantidad <= 0 or precio_compra <= 0:
-                    raise ValueError("Cantidad y precio deben ser positivos")
-                
-                # Verificar que el símbolo existe (excepto si no cambió)
-                if simbolo != simbolo_original:
-                    try:
-                        self.precio_en_euros(simbolo)
-                    except Exception as e:
-                        raise ValueError(f"Símbolo no válido: {str(e)}")
-                
-                accion.update({
-                    'simbolo': simbolo,
-                    'cantidad': str(cantidad),
-                    'precio_compra': str(precio_compra),
-                    'notas': notas
-                })
+            simbolo = self.simbolo_escrito(simbolo_entry)
+            notas = notas_entry.get()
+            if not simbolo:
+                messagebox.showerror("Error", "Datos inválidos: Falta el símbolo", parent=dialog)
+                return
+            
+            def simbolo_invalido(e):
+                messagebox.showerror("Error", f"Datos inválidos: Símbolo no válido: {str(e)}")
+            
+            def confirmar(_precio=None):
+                with self.medidas.tramo('guardar_accion'):
+                    self.repo.modificar_accion(simbolo_original, {'simbolo': simbolo, 'notas': notas})
                 
-                self.guardar_acciones(acciones)
-                self.actualizar_lista_acciones()
-                self.actualizar_resumen()
+                self.planificador.solicitar('acciones', 'resumen')
                 dialog.destroy()
                 messagebox.showinfo("Éxito", "Acción modificada correctamente")
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Datos inválidos: {str(e)}")
+            
+            # Verificar que el símbolo existe (excepto si no cambió o ya lo conocemos) sin bloquear la ventana
+            if simbolo != simbolo_original and not self.simbolo_conocido(simbolo):
+                self.trabajador.ejecutar(lambda: self.precio_en_euros(simbolo), confirmar, simbolo_invalido)
+            else:
+                confirmar()
         
-        ttk.Button(dialog, text="Guardar", command=guardar).grid(row=4, column=1, pady=10, sticky='e')
+        botones = ttk.Frame(dialog)
+        botones.pack(fill='x', padx=10, pady=5)
+        ttk.Button(botones, text="🗑️ Eliminar operación", command=eliminar_movimiento).pack(side='left', padx=5)
+        ttk.Button(botones, text="Guardar", command=guardar).pack(side='right', padx=5)
+        pintar()
     
     def eliminar_accion_gui(self):
         seleccion = self.acciones_tree.selection()
@@ -511,26 +1027,106 @@ class StockApp:
         
         item = self.acciones_tree.item(seleccion[0])
         simbolo = item['values'][0]
+        lotes = len(self.repo.movimientos(simbolo))
         
-        if messagebox.askyesno("Confirmar", f"¿Eliminar la acción {simbolo}?"):
-            acciones = self.cargar_acciones()
-            acciones = [a for a in acciones if a['simbolo'] != simbolo]
-            
-            self.guardar_acciones(acciones)
-            self.actualizar_lista_acciones()
-            self.actualizar_resumen()
+        if messagebox.askyesno("Confirmar", f"¿Eliminar la acción {simbolo} y sus {lotes} compras y ventas?"):
+            with self.medidas.tramo('guardar_accion'):
+                self.repo.eliminar_accion(simbolo)
+            self.planificador.solicitar('acciones', 'resumen')
             messagebox.showinfo("Éxito", "Acción eliminada correctamente")
     
-    # Funciones GUI Registros (sin cambios respecto a tu versión original)
+    # Funciones GUI Registros
     def actualizar_lista_registros(self):
-        for i in self.tree.get_children():
-            self.tree.delete(i)
-        
+        # El índice se rehace solo cuando cambian los datos; filtrar y ordenar lo reutilizan
         registros = self.cargar_registros()
-        for r in registros:
+        with self.medidas.tramo('indice_registros'):
+            self.indice_registros = IndiceRegistros(registros)
+        self.filtro_anio.config(values=['Todos'] + self.indice_registros.anios())
+        self.mostrar_registros()
+        self.mostrar_invertido()
+    
+    def filtrar_registros(self):
+        self.mostrar_registros(desde_inicio=True)
+        self.mostrar_invertido()
+    
+    def mostrar_invertido(self):
+        # Lo aportado en el periodo del filtro; el repositorio lo suma sin recorrer la lista (en SQLite, con una consulta)
+        anio = self.filtro_anio.get()
+        mes = next((m for m, nombre in MESES.items() if nombre == self.filtro_mes.get()), None)
+        with self.medidas.tramo('total_invertido'):
+            if anio == 'Todos' and mes is None:
+                total = self.repo.total_invertido()
+            else:
+                anios = self.indice_registros.anios() if anio == 'Todos' else [anio]
+                total = sum(self.repo.total_invertido((a, mes or '01', '01'), (a, mes or '12', '31')) for a in anios)
+        self.invertido_label.config(text=f"Invertido: {total:.2f} €")
+    
+    def mostrar_registros(self, desde_inicio=False):
+        anio = self.filtro_anio.get()
+        mes = next((m for m, nombre in MESES.items() if nombre == self.filtro_mes.get()), None)
+        clave, descendente = self.orden_registros
+        posiciones = self.indice_registros.vista(None if anio == 'Todos' else anio, mes, clave, descendente)
+        
+        ventana = self.ventana_registros
+        ventana.total = len(posiciones)
+        if desde_inicio:
+            ventana.inicio = 0
+        ventana.ajustar()
+        
+        registros = self.indice_registros.registros
+        filas = []
+        for i in ventana.rango():
+            r = registros[posiciones[i]]
             fecha = f"{r['d']}/{MESES.get(r['m'], r['m'])}/{r['a']}"
             trans = 'Sí' if r['trans'] == 's' else 'No'
-            self.tree.insert('', 'end', values=(r['id'], fecha, f"{float(r['cantidad']):.2f} €", trans))
+            filas.append((r['id'], (r['id'], fecha, f"{float(r['cantidad']):.2f} €", trans)))
+        with self.medidas.tramo('tabla_registros'):
+            self.tabla_registros.sincronizar(filas)
+        self.scroll_registros.set(*ventana.fracciones())
+    
+    def ordenar_registros(self, clave):
+        actual, descendente = self.orden_registros
+        self.orden_registros = (clave, not descendente if clave == actual else False)
+        self.mostrar_registros(desde_inicio=True)
+    
+    def desplazar_registros(self, accion, cantidad, unidad=None):
+        # Órdenes de la barra de desplazamiento: ('moveto', fracción) o ('scroll', n, 'units'|'pages')
+        ventana = self.ventana_registros
+        if accion == 'moveto':
+            ventana.mover_a(float(cantidad))
+        elif unidad == 'pages':
+            ventana.desplazar(int(cantidad) * ventana.visibles)
+        else:
+            ventana.desplazar(int(cantidad))
+        self.mostrar_registros()
+    
+    def rueda_registros(self, sentido):
+        self.ventana_registros.desplazar(sentido * FILAS_RUEDA)
+        self.mostrar_registros()
+        return 'break'
+    
+    def tecla_registros(self, event):
+        # En el borde de lo que se ve, las flechas desplazan la ventana en lugar de quedarse paradas
+        seleccion = self.tree.selection()
+        hijos = self.tree.get_children()
+        if not seleccion or not hijos:
+            return None
+        paso = 1 if event.keysym == 'Down' else -1
+        if seleccion[0] != (hijos[-1] if paso == 1 else hijos[0]):
+            return None
+        self.ventana_registros.desplazar(paso)
+        self.mostrar_registros()
+        hijos = self.tree.get_children()
+        destino = hijos[-1] if paso == 1 else hijos[0]
+        self.tree.selection_set(destino)
+        self.tree.focus(destino)
+        return 'break'
+    
+    def redimensionar_registros(self, event):
+        visibles = max(1, (event.height - ALTO_CABECERA) // ALTO_FILA)
+        if visibles != self.ventana_registros.visibles:
+            self.ventana_registros.visibles = visibles
+            self.mostrar_registros()
     
     def agregar_registro_gui(self):
         dialog = tk.Toplevel(self.root)
@@ -579,21 +1175,17 @@ class StockApp:
                 if cantidad <= 0:
                     raise ValueError("La cantidad debe ser positiva")
                 
-                registros = self.cargar_registros()
-                nuevo_id = self.obtener_proximo_id()
-                
-                registros.append({
-                    'id': str(nuevo_id),
-                    'd': d,
-                    'm': m,
-                    'a': a,
-                    'cantidad': str(cantidad),
-                    'trans': tipo_var.get()
-                })
+                with self.medidas.tramo('guardar_registro'):
+                    self.repo.agregar_registro({
+                        'd': d,
+                        'm': m,
+                        'a': a,
+                        'cantidad': cantidad,
+                        'trans': tipo_var.get()
+                    })
                 
-                self.guardar_registros(registros)
                 self.actualizar_lista_registros()
-                self.actualizar_resumen()
+                self.planificador.solicitar('resumen')
                 dialog.destroy()
                 messagebox.showinfo("Éxito", "Registro añadido correctamente")
                 
@@ -602,6 +1194,91 @@ class StockApp:
         
         ttk.Button(dialog, text="Guardar", command=guardar).grid(row=4, column=1, pady=10, sticky='e')
     
+    def exportar_gui(self):
+        # Copia de los datos en CSV con los nombres de siempre; se escribe en el hilo de precios
+        carpeta = filedialog.askdirectory(title="Exportar datos a la carpeta")
+        if not carpeta:
+            return
+        try:
+            escribir = preparar_exportacion(self.repo, *(os.path.join(carpeta, os.path.basename(ruta))
+                                                         for ruta in (DB_FILE, ACCIONES_FILE, EFECTIVO_FILE)))
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo exportar: {str(e)}")
+            return
+        
+        def avisar(escritos):
+            messagebox.showinfo("Éxito", f"Exportados {escritos[0]} registros y {escritos[1]} movimientos a {carpeta}")
+        
+        self.trabajador.ejecutar(escribir, avisar,
+                                 lambda e: messagebox.showerror("Error", f"No se pudo exportar: {str(e)}"))
+    
+    def importar_gui(self, tipo):
+        # Importa un extracto del broker lote a lote desde el bucle de Tk: entre lote y lote se pinta la barra
+        ruta = filedialog.askopenfilename(title="Importar extracto", filetypes=[('CSV', '*.csv *.txt'), ('Todos', '*.*')])
+        if not ruta:
+            return
+        try:
+            importacion = Importacion(self.repo, ruta, tipo)
+        except Exception as e:
+            messagebox.showerror("Error", f"No se pudo leer el archivo: {str(e)}")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Importando...")
+        dialog.geometry("400x150")
+        estado = ttk.Label(dialog, text="Leyendo...")
+        estado.pack(padx=10, pady=10, fill='x')
+        barra = ttk.Progressbar(dialog, mode='determinate', maximum=100, length=360)
+        barra.pack(padx=10, pady=5)
+        cancelada = tk.BooleanVar(value=False)
+        ttk.Button(dialog, text="Cancelar", command=lambda: cancelada.set(True)).pack(pady=10)
+        
+        def terminar():
+            dialog.destroy()
+            if tipo == 'registros':
+                self.actualizar_lista_registros()
+                self.planificador.solicitar('resumen')
+            else:
+                self.planificador.solicitar('acciones', 'resumen')
+        
+        def guardar(titulo, mensaje, error=False):
+            # Volcar los lotes a la foto reescribe los archivos enteros: en el hilo de precios
+            estado.config(text=f"{importacion.importadas} importados. Guardando...")
+            
+            def avisar(_resultado=None, fallo=None):
+                terminar()
+                if fallo is not None:
+                    print(f"Error al compactar los datos: {str(fallo)}")
+                (messagebox.showerror if error else messagebox.showinfo)(titulo, mensaje)
+            
+            escribir = self.repo.preparar_compactacion()
+            if escribir is None:
+                avisar()
+            else:
+                self.trabajador.ejecutar(escribir, avisar, lambda e: avisar(fallo=e))
+        
+        def avanzar():
+            try:
+                with self.medidas.tramo('importar_lote'):
+                    sigue = importacion.paso()
+            except Exception as e:
+                importacion.cerrar()
+                guardar("Error", f"Importación interrumpida: {str(e)}\n\n{importacion.resumen()}", error=True)
+                return
+            barra.config(value=importacion.progreso() * 100)
+            estado.config(text=f"{importacion.importadas} importados, {importacion.duplicadas} duplicados, "
+                               f"{importacion.erroneas} con errores" + (". Numerando..." if importacion.leido else ""))
+            if sigue and not cancelada.get():
+                self.root.after(1, avanzar)
+                return
+            if sigue:
+                # Lo ya guardado se queda: cada lote se guarda entero o no se guarda
+                importacion.cerrar()
+            guardar("Importación cancelada" if sigue else "Importación terminada", importacion.resumen())
+        
+        dialog.protocol("WM_DELETE_WINDOW", lambda: cancelada.set(True))
+        self.root.after(1, avanzar)
+    
     def modificar_registro_gui(self):
         seleccion = self.tree.selection()
         if not seleccion:
@@ -611,8 +1288,7 @@ class StockApp:
         item = self.tree.item(seleccion[0])
         id_registro = item['values'][0]
         
-        registros = self.cargar_registros()
-        registro = next((r for r in registros if int(r['id']) == id_registro), None)
+        registro = self.repo.registro(id_registro)
         
         if not registro:
             messagebox.showerror("Error", "Registro no encontrado")
@@ -644,7 +1320,7 @@ class StockApp:
         
         ttk.Label(dialog, text="Cantidad (€):").grid(row=1, column=0, padx=5, pady=5, sticky='e')
         cantidad_entry = ttk.Entry(dialog)
-        cantidad_entry.insert(0, registro['cantidad'])
+        cantidad_entry.insert(0, str(registro['cantidad']))
         cantidad_entry.grid(row=1, column=1, sticky='w')
         
         ttk.Label(dialog, text="Transacción realizada:").grid(row=2, column=0, padx=5, pady=5, sticky='e')
@@ -668,17 +1344,17 @@ class StockApp:
                 if cantidad <= 0:
                     raise ValueError("La cantidad debe ser positiva")
                 
-                registro.update({
-                    'd': d,
-                    'm': m,
-                    'a': a,
-                    'cantidad': str(cantidad),
-                    'trans': tipo_var.get()
-                })
+                with self.medidas.tramo('guardar_registro'):
+                    self.repo.modificar_registro(id_registro, {
+                        'd': d,
+                        'm': m,
+                        'a': a,
+                        'cantidad': cantidad,
+                        'trans': tipo_var.get()
+                    })
                 
-                self.guardar_registros(registros)
                 self.actualizar_lista_registros()
-                self.actualizar_resumen()
+                self.planificador.solicitar('resumen')
                 dialog.destroy()
                 messagebox.showinfo("Éxito", "Registro modificado correctamente")
                 
@@ -697,103 +1373,252 @@ class StockApp:
         id_registro = item['values'][0]
         
         if messagebox.askyesno("Confirmar", f"¿Eliminar el registro {id_registro}?"):
-            registros = self.cargar_registros()
-            registros = [r for r in registros if int(r['id']) != id_registro]
-            
-            self.guardar_registros(registros)
+            with self.medidas.tramo('guardar_registro'):
+                self.repo.eliminar_registro(id_registro)
             self.actualizar_lista_registros()
-            self.actualizar_resumen()
+            self.planificador.solicitar('resumen')
             messagebox.showinfo("Éxito", "Registro eliminado correctamente")
     
+    # Símbolos: datos guardados y autocompletado
+    def indice(self):
+        # Se crea con lo que ya se conoce: símbolos consultados antes, cartera y lista de vigilancia
+        if self.indice_simbolos is None:
+            conocidos = dict.fromkeys(self.metadatos.simbolos() + [a['simbolo'] for a in self.cargar_acciones()]
+                                      + self.vigilancia.simbolos() + list(lista_acciones))
+            self.indice_simbolos = IndiceSimbolos()
+            self.indice_simbolos.agregar_varios((s, (self.metadatos.obtener(s) or {}).get('nombre', ''))
+                                                for s in conocidos)
+        return self.indice_simbolos
+    
+    def agregar_al_indice(self, datos):
+        # datos: {simbolo: metadatos}
+        self.indice().agregar_varios((simbolo, d.get('nombre', '')) for simbolo, d in datos.items())
+    
+    def calentar_simbolos(self):
+        # Una vez por sesión y en segundo plano, los datos de la cartera y de la lista de vigilancia
+        # que falten o hayan caducado, para que las consultas no tengan que esperar a Ticker.info
+        if self.simbolos_calentados:
+            return
+        self.simbolos_calentados = True
+        simbolos = [a['simbolo'] for a in self.cargar_acciones()] + self.vigilancia.simbolos()
+        pendientes = [s for s in dict.fromkeys(simbolos) if self.metadatos.caducado(s)][:CALENTAR_POR_SESION]
+        if not pendientes:
+            return
+        
+        def calentar():
+            datos = {}
+            for simbolo in pendientes:
+                try:
+                    datos[simbolo] = self.metadatos.consultar(simbolo, self.cotizaciones.fuente, guardar=False)
+                except Exception as e:
+                    print(f"Error al obtener los datos de {simbolo}: {str(e)}")
+            self.metadatos.guardar()
+            return datos
+        
+        self.trabajador.ejecutar(calentar, self.agregar_al_indice)
+    
+    def simbolo_conocido(self, simbolo):
+        # Ya consultado o con precio guardado: no hace falta descargar para saber que existe
+        return self.metadatos.obtener(simbolo) is not None or self.ultimos.obtener(simbolo) is not None
+    
+    def simbolo_escrito(self, combo):
+        # El ticker, aunque en la casilla quede una sugerencia con el nombre
+        partes = combo.get().split()
+        return partes[0].upper() if partes else ''
+    
+    def autocompletar(self, combo):
+        # Sugerencias del índice local al teclear; lo que no está se pide a Yahoo al dejar de teclear
+        combo.bind('<KeyRelease>', lambda event: self.sugerir(combo, event), add='+')
+        combo.bind('<<ComboboxSelected>>', lambda event: self.elegir_sugerencia(combo), add='+')
+        return combo
+    
+    def elegir_sugerencia(self, combo):
+        simbolo = self.simbolo_escrito(combo)
+        combo.delete(0, tk.END)
+        combo.insert(0, simbolo)
+    
+    def sugerir(self, combo, event=None):
+        if event is not None and event.keysym in ('Return', 'Up', 'Down', 'Escape', 'Tab'):
+            return
+        self.calentar_simbolos()
+        texto = combo.get().strip()
+        with self.medidas.tramo('autocompletar'):
+            simbolos = self.indice().buscar(texto, MAX_SUGERENCIAS)
+            combo['values'] = [describir(s, self.metadatos.obtener(s)) for s in simbolos]
+        if self.busqueda_pendiente is not None:
+            self.root.after_cancel(self.busqueda_pendiente)
+            self.busqueda_pendiente = None
+        if len(simbolos) < MAX_SUGERENCIAS and len(texto) >= 2 and texto.lower() not in self.busquedas_hechas:
+            self.busqueda_pendiente = self.root.after(ESPERA_BUSQUEDA, lambda: self.buscar_simbolos(combo, texto))
+    
+    def buscar_simbolos(self, combo, texto):
+        # Cada texto se pregunta una vez por sesión; lo encontrado queda en el índice y en disco
+        self.busqueda_pendiente = None
+        self.busquedas_hechas.add(texto.lower())
+        
+        def buscar():
+            encontrados = {}
+            for resultado in self.cotizaciones.fuente.buscar(texto):
+                if resultado.get('symbol'):
+                    encontrados[resultado['symbol']] = self.metadatos.actualizar(
+                        resultado['symbol'], metadatos_de_info(resultado), guardar=False)
+            self.metadatos.guardar()
+            return encontrados
+        
+        def mostrar(encontrados):
+            self.agregar_al_indice(encontrados)
+            if encontrados and combo.winfo_exists() and combo.get().strip() == texto:
+                self.sugerir(combo)
+        
+        self.trabajador.ejecutar(buscar, mostrar, lambda e: print(f"Error al buscar símbolos: {str(e)}"))
+    
+    def cambio_diario(self, simbolo):
+        # % desde el último cierre anterior a hoy, con el histórico local (o la última semana si no está en él)
+        hoy = date.today()
+        barras = [(b[0], b[3]) for b in self.historico.ultimas_barras(simbolo, 2)]
+        if not barras:
+            semana = self.cotizaciones.fuente.historico([simbolo], hoy - timedelta(days=7), hoy)
+            barras = [(b[0], b[4]) for b in semana.get(simbolo, [])]
+        anteriores = [cierre for fecha, cierre in barras if fecha < hoy.isoformat() and cierre == cierre and cierre]
+        if not anteriores:
+            return None
+        return (self.cotizaciones.obtener(simbolo) / anteriores[-1] - 1) * 100
+    
     def consultar_accion(self):
-        simbolo = self.simbolo_entry.get().strip().upper()
+        simbolo = self.simbolo_escrito(self.simbolo_entry)
         if not simbolo:
             messagebox.showwarning("Advertencia", "Ingrese un símbolo válido")
             return
         
-        try:
+        # Lo guardado se enseña ya; el precio, y los datos si faltan o han caducado, llegan después
+        self.calentar_simbolos()
+        self.mostrar_consulta(simbolo, None, self.metadatos.obtener(simbolo), None)
+        
+        def descargar():
             precio = self.precio_en_euros(simbolo)
-            
-            self.resultado_text.config(state=tk.NORMAL)
-            self.resultado_text.delete(1.0, tk.END)
-            
-            self.resultado_text.insert(tk.END, f"{simbolo}\n", 'title')
-            self.resultado_text.insert(tk.END, f"\nPrecio actual: {precio:.4f} €\n")
-            
-            if '-' in simbolo:
-                ticker = yf.Ticker(simbolo)
-                info = ticker.info
-                
-                self.resultado_text.insert(tk.END, "\nInformación:\n", 'title')
-                self.resultado_text.insert(tk.END, f"Nombre: {info.get('shortName', 'N/A')}\n")
-                self.resultado_text.insert(tk.END, f"Cambio 24h: {info.get('regularMarketChangePercent', 'N/A')}%\n")
-                
-                cambio = info.get('regularMarketChangePercent', 0)
-                if isinstance(cambio, (int, float)):
-                    tag = 'positive' if cambio >= 0 else 'negative'
-                    self.resultado_text.insert(tk.END, f"{'▲' if cambio >=0 else '▼'} {abs(cambio):.2f}%\n", tag)
-            
-            self.resultado_text.config(state=tk.DISABLED)
-            
-        except Exception as e:
+            try:
+                datos = self.metadatos.consultar(simbolo, self.cotizaciones.fuente)
+            except Exception as e:
+                print(f"Error al obtener los datos de {simbolo}: {str(e)}")
+                datos = self.metadatos.obtener(simbolo)
+            try:
+                cambio = self.cambio_diario(simbolo)
+            except Exception as e:
+                print(f"Error al calcular el cambio del día de {simbolo}: {str(e)}")
+                cambio = None
+            return precio, datos, cambio
+        
+        def mostrar(resultado):
+            precio, datos, cambio = resultado
+            if datos:
+                self.agregar_al_indice({simbolo: datos})
+            self.mostrar_consulta(simbolo, precio, datos, cambio)
+        
+        def fallo(e):
             messagebox.showerror("Error", f"No se pudo obtener información para {simbolo}:\n{str(e)}")
+        
+        self.trabajador.ejecutar(descargar, mostrar, fallo)
     
-    def actualizar_info_acciones(self):
-        self.actualizar_lista_acciones()
-        self.root.after(15000, self.actualizar_info_acciones)
+    def mostrar_consulta(self, simbolo, precio, datos, cambio):
+        self.resultado_text.config(state=tk.NORMAL)
+        self.resultado_text.delete(1.0, tk.END)
+        
+        self.resultado_text.insert(tk.END, f"{simbolo}\n", 'title')
+        self.resultado_text.insert(tk.END, f"\nPrecio actual: {'consultando...' if precio is None else f'{precio:.4f} €'}\n")
+        
+        if cambio is not None:
+            tag = 'positive' if cambio >= 0 else 'negative'
+            self.resultado_text.insert(tk.END, f"Cambio del día: {'▲' if cambio >= 0 else '▼'} {abs(cambio):.2f}%\n", tag)
+        
+        if datos:
+            self.resultado_text.insert(tk.END, "\nInformación:\n", 'title')
+            for titulo, clave in (('Nombre', 'nombre'), ('Tipo', 'tipo'), ('Mercado', 'mercado'), ('Moneda', 'moneda')):
+                if datos.get(clave):
+                    self.resultado_text.insert(tk.END, f"{titulo}: {datos[clave]}\n")
+        
+        self.resultado_text.config(state=tk.DISABLED)
     
-    def actualizar_resumen(self):
+    def actualizar_resumen(self, descargar=True):
+        # Los arrays solo se rehacen si han cambiado los datos; conversión, precios y cálculo van en segundo plano.
+        # Sin descargar se valora solo con los últimos precios guardados (al arrancar).
         registros = self.cargar_registros()
-        total_invertido = 0.0
-        
-        for r in registros:
-            cantidad = float(r['cantidad'])
-            if r['trans'] == 's':  # Sí
-                total_invertido += cantidad
-            else:  # No
-                total_invertido += 1.01 * cantidad
-
-        total_invertido = round(total_invertido, 2)
-        
-        # Calcular valor de las acciones
-        acciones = self.cargar_acciones()
-        valor_total_acciones = 0.0
-        beneficio_total = 0.0
-        detalles_acciones = []
+        acciones = self.cargar_acciones()  # Agregado por símbolo que mantiene el libro de lotes
+        movimientos = self.repo.movimientos()  # Compras y ventas fechadas, para la rentabilidad histórica
+        realizado = self.repo.realizado()
+        efectivo = self.efectivo
+        
+        def valorar_cartera():
+            from valoracion import valorar
+            with self.medidas.tramo('actualizar_resumen'):
+                motor, rentabilidad = self.motores()
+                cartera = motor.preparar(registros, acciones, movimientos)
+                with self.medidas.tramo('precios_resumen'):
+                    if descargar:
+                        precios, antiguos = precios_con_respaldo(self.cotizaciones, cartera.simbolos, self.monedas,
+                                                                 self.ultimos)
+                    else:
+                        precios, antiguos = self.precios_guardados(cartera.simbolos)
+                resultado = valorar(cartera, precios, efectivo)
+                resultado['antiguos'] = antiguos
+                resultado['realizado'] = realizado
+                resultado['descargado'] = descargar
+                try:
+                    with self.medidas.tramo('rentabilidad'):
+                        resultado['rentabilidad'] = rentabilidad.serie(cartera).rango()
+                except Exception as e:
+                    print(f"Error al calcular la rentabilidad: {str(e)}")
+                    resultado['rentabilidad'] = None
+                return resultado
         
-        for accion in acciones:
-            try:
-                simbolo = accion['simbolo']
-                cantidad = float(accion['cantidad'])
-                precio_compra = float(accion['precio_compra'])
-                precio_actual = self.precio_en_euros(simbolo)
-                valor_accion = cantidad * precio_actual
-                valor_compra = cantidad * precio_compra
-                beneficio = valor_accion - valor_compra
-                
-                valor_total_acciones += valor_accion
-                beneficio_total += beneficio
-                
-                detalles_acciones.append(
-                    f"{simbolo}: {cantidad:.5f} acciones\n"
-                    f"  Compra: {valor_compra:.2f} € | Actual: {valor_accion:.2f} €\n"
-                    f"  Beneficio: {beneficio:.2f} € ({beneficio/valor_compra*100:.2f}%)\n"
-                )
-            except Exception as e:
-                print(f"Error al calcular valor de {accion.get('simbolo', '')}: {str(e)}")
+        self.trabajador.ejecutar(valorar_cartera, self.mostrar_resumen)
+    
+    def mostrar_resumen(self, resultado):
+        # Un resumen con precios guardados no tapa uno ya calculado tras descargar
+        if not resultado['descargado'] and self.resumen_con_descarga:
+            return
+        with self.medidas.tramo('pintar_resumen'):
+            self.pintar_resumen(resultado)
+        nuevos_simbolos = self.ultimo_resumen is None or list(self.ultimo_resumen['simbolos']) != list(resultado['simbolos'])
+        self.ultimo_resumen = resultado
+        if nuevos_simbolos:
+            self.suscribir_directo()
+    
+    def pintar_resumen(self, resultado):
+        self.resumen_con_descarga = self.resumen_con_descarga or resultado['descargado']
+        self.resumen_pintado = time.monotonic()
+        antiguos = resultado['antiguos']
+        
+        total_invertido = resultado['total_invertido']
+        valor_total_acciones = resultado['valor_acciones']
+        beneficio_total = resultado['beneficio']
+        patrimonio = resultado['patrimonio']
+        balance_total = resultado['balance']
+        porcentaje_total = resultado['porcentaje']
+        efectivo = resultado['efectivo']
         
-        patrimonio = valor_total_acciones + self.efectivo
-        balance_total = valor_total_acciones - total_invertido + self.efectivo
-        porcentaje_total = (balance_total / total_invertido) * 100 if total_invertido != 0 else 0
+        detalles_acciones = []
+        for i, simbolo in enumerate(resultado['simbolos']):
+            if not resultado['con_precio'][i]:
+                # En el texto y no en la consola: se repinta cada pocos segundos
+                detalles_acciones.append(f"{simbolo}: {resultado['cantidades'][i]:.5f} acciones\n  Sin cotización disponible\n")
+                continue
+            marca = " *" if simbolo in antiguos else ""
+            detalles_acciones.append(
+                f"{simbolo}: {resultado['cantidades'][i]:.5f} acciones\n"
+                f"  Compra: {resultado['valor_compra'][i]:.2f} € | Actual: {resultado['valor_actual'][i]:.2f} €{marca}\n"
+                f"  Beneficio: {resultado['beneficio_accion'][i]:.2f} € ({resultado['porcentaje_accion'][i]:.2f}%)\n"
+            )
         
         self.resumen_text.config(state=tk.NORMAL)
         self.resumen_text.delete(1.0, tk.END)
         
         self.resumen_text.insert(tk.END, "Resumen de Inversión\n", 'header')
         self.resumen_text.insert(tk.END, f"Patrimonio total: {patrimonio:.2f} €\n", 'highlight')
+        if antiguos:
+            self.resumen_text.insert(tk.END, f"* {self.describir_antiguos(antiguos)}\n", 'aviso')
         
         self.resumen_text.insert(tk.END, "\nEfectivo disponible: ", 'text')
-        self.resumen_text.insert(tk.END, f"{self.efectivo:.2f} €\n", 'positive' if self.efectivo >= 0 else 'negative')
+        self.resumen_text.insert(tk.END, f"{efectivo:.2f} €\n", 'positive' if efectivo >= 0 else 'negative')
         
         self.resumen_text.insert(tk.END, f"\nTotal invertido: {total_invertido:.2f} €\n", 'text')
         self.resumen_text.insert(tk.END, f"Valor total acciones: {valor_total_acciones:.2f} €\n", 'text')
@@ -806,14 +1631,32 @@ class StockApp:
         tag_beneficio = 'positive' if beneficio_total >= 0 else 'negative'
         self.resumen_text.insert(tk.END, f"{beneficio_total:.2f} €\n", tag_beneficio)
         
+        realizado = resultado['realizado']
+        if realizado['fifo'] or realizado['medio']:
+            self.resumen_text.insert(tk.END, "Beneficio realizado en ventas: ", 'text')
+            self.resumen_text.insert(tk.END, f"{realizado['fifo']:.2f} € (FIFO) | {realizado['medio']:.2f} € (coste medio)\n",
+                                     'positive' if realizado[METODO_COSTE] >= 0 else 'negative')
+        
+        rentabilidad = resultado.get('rentabilidad')
+        if rentabilidad:
+            self.resumen_text.insert(tk.END, f"\nRentabilidad desde {rentabilidad['desde'].strftime('%d/%m/%Y')}:\n", 'header')
+            self.resumen_text.insert(tk.END, "TWR: ", 'text')
+            if rentabilidad['twr'] is None:
+                # Sin cierres guardados no se puede valorar la cartera en el pasado
+                self.resumen_text.insert(tk.END, "sin histórico\n", 'text')
+            else:
+                self.resumen_text.insert(tk.END, f"{rentabilidad['twr'] * 100:.2f}%\n",
+                                         'positive' if rentabilidad['twr'] >= 0 else 'negative')
+            if rentabilidad['xirr'] is not None:
+                self.resumen_text.insert(tk.END, "TIR anual: ", 'text')
+                self.resumen_text.insert(tk.END, f"{rentabilidad['xirr'] * 100:.2f}%\n",
+                                         'positive' if rentabilidad['xirr'] >= 0 else 'negative')
+        
         self.resumen_text.insert(tk.END, "\nDetalles por acción:\n", 'header')
         for detalle in detalles_acciones:
             self.resumen_text.insert(tk.END, detalle + "\n")
         
         self.resumen_text.config(state=tk.DISABLED)
-        
-        # Actualizar cada 15 segundos
-        self.root.after(15000, self.actualizar_resumen)
 
 if __name__ == "__main__":
     try:
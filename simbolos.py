@@ -0,0 +1,194 @@
+'''
+Datos descriptivos de los simbolos y busqueda para autocompletar.
+
+Ticker.info de yfinance tarda segundos, asi que de cada simbolo se guarda en disco lo que casi no
+cambia (nombre, moneda, mercado y tipo) y solo se vuelve a pedir pasado TTL_METADATOS. Con eso y con
+los simbolos que ya se conocen (cartera, lista de vigilancia, busquedas anteriores) IndiceSimbolos
+sugiere sin red: prefijos del ticker o de las palabras del nombre por busqueda binaria sobre una lista
+ordenada, y trigramas para lo que aparece en medio.
+'''
+
+import bisect
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from almacen import escribir_atomico
+
+TTL_METADATOS = 30 * 24 * 3600  # s; el nombre o el mercado de un simbolo casi nunca cambian
+MAX_SUGERENCIAS = 10
+CALENTAR_POR_SESION = 50  # Ticker.info pedidos en segundo plano como mucho por sesion
+
+
+def metadatos_de_info(info):
+    # Lo que se guarda de un Ticker.info o de un resultado de la busqueda de Yahoo (que usa otras claves)
+    return {
+        'nombre': info.get('longName') or info.get('shortName') or info.get('longname') or info.get('shortname') or '',
+        'moneda': info.get('currency') or '',
+        'mercado': info.get('fullExchangeName') or info.get('exchDisp') or info.get('exchange') or '',
+        'tipo': info.get('quoteType') or info.get('typeDisp') or '',
+    }
+
+
+def describir(simbolo, datos):
+    # 'SAN.MC — Banco Santander, S.A. (Madrid)' para las listas de sugerencias
+    if not datos or not datos.get('nombre'):
+        return simbolo
+    mercado = f" ({datos['mercado']})" if datos.get('mercado') else ""
+    return f"{simbolo} — {datos['nombre']}{mercado}"
+
+
+class MetadatosSimbolos:
+    # simbolo -> {'nombre', 'moneda', 'mercado', 'tipo', 'instante'}. Segura entre hilos.
+    def __init__(self, ruta=None, ttl=TTL_METADATOS, reloj=time.time):
+        self.ruta = ruta
+        self.ttl = ttl
+        self.reloj = reloj
+        self._datos = {}
+        self._lock = threading.Lock()
+        self.consultas = 0  # Llamadas a Ticker.info
+        if ruta and os.path.exists(ruta):
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    self._datos = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error al leer los datos de los símbolos: {str(e)}")
+
+    def obtener(self, simbolo):
+        # Lo guardado, aunque este caducado, o None
+        with self._lock:
+            return self._datos.get(simbolo)
+
+    def caducado(self, simbolo):
+        datos = self.obtener(simbolo)
+        return datos is None or self.reloj() - datos['instante'] >= self.ttl
+
+    def simbolos(self):
+        with self._lock:
+            return list(self._datos)
+
+    def actualizar(self, simbolo, datos, guardar=True):
+        # Lo que no venga (la busqueda de Yahoo no da la moneda) se conserva de lo guardado
+        with self._lock:
+            anterior = self._datos.get(simbolo, {})
+            nuevos = {clave: datos.get(clave) or anterior.get(clave, '') for clave in ('nombre', 'moneda', 'mercado', 'tipo')}
+            nuevos['instante'] = self.reloj() if datos.get('moneda') else anterior.get('instante', 0)
+            self._datos[simbolo] = nuevos
+            if guardar:
+                self._guardar()
+        return nuevos
+
+    def consultar(self, simbolo, fuente, guardar=True):
+        # Lo guardado si esta al dia; si no, Ticker.info. Si la fuente falla se devuelve lo caducado.
+        if not self.caducado(simbolo):
+            return self.obtener(simbolo)
+        try:
+            self.consultas += 1
+            datos = metadatos_de_info(fuente.informacion(simbolo) or {})
+        except Exception:
+            if self.obtener(simbolo) is not None:
+                return self.obtener(simbolo)
+            raise
+        if not datos['nombre'] and not datos['moneda']:
+            # Yahoo responde casi vacio a los simbolos que no existen
+            raise ValueError(f"Sin datos para {simbolo}")
+        return self.actualizar(simbolo, datos, guardar)
+
+    def guardar(self):
+        with self._lock:
+            self._guardar()
+
+    def _guardar(self):
+        if not self.ruta:
+            return
+        try:
+            datos = json.dumps(self._datos, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+            escribir_atomico(self.ruta, lambda f: f.write(datos))
+        except OSError as e:
+            print(f"Error al guardar los datos de los símbolos: {str(e)}")
+
+
+def normalizar(texto):
+    # Minusculas y sin acentos, para que 'telefonica' encuentre 'Telefónica'
+    return ''.join(c for c in unicodedata.normalize('NFKD', texto.lower()) if not unicodedata.combining(c))
+
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceSimbolos:
+    # Busqueda por ticker y nombre. Orden de las sugerencias: ticker exacto, ticker que empieza por el
+    # texto, nombre o palabra del nombre que empieza por el texto y, por ultimo, el texto en medio.
+    def __init__(self):
+        self._textos = {}  # simbolo -> 'ticker nombre' normalizado
+        self._claves = []  # (clave, simbolo) ordenadas: el ticker, el nombre y cada palabra del nombre
+        self._trigramas = {}  # trigrama -> simbolos cuyo texto lo contiene
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._textos)
+
+    def __contains__(self, simbolo):
+        return simbolo in self._textos
+
+    def _claves_de(self, simbolo, nombre):
+        nombre = normalizar(nombre)
+        return ({normalizar(simbolo), nombre} | set(re.findall(r'\w+', nombre))) - {''}
+
+    def agregar(self, simbolo, nombre=''):
+        self.agregar_varios([(simbolo, nombre)])
+
+    def agregar_varios(self, pares):
+        # pares: (simbolo, nombre). Un simbolo que ya estaba solo cambia si llega con nombre.
+        with self._lock:
+            nuevas = []
+            for simbolo, nombre in pares:
+                texto = normalizar(f"{simbolo} {nombre or ''}".strip())
+                anterior = self._textos.get(simbolo)
+                if anterior is not None and (anterior == texto or not nombre):
+                    continue
+                if anterior is not None:
+                    self._quitar(simbolo)
+                    nuevas = [c for c in nuevas if c[1] != simbolo]
+                self._textos[simbolo] = texto
+                nuevas.extend((clave, simbolo) for clave in self._claves_de(simbolo, nombre or ''))
+                for trigrama in trigramas(texto):
+                    self._trigramas.setdefault(trigrama, set()).add(simbolo)
+            if len(nuevas) > 16:
+                self._claves = sorted(self._claves + nuevas)
+            else:
+                for clave in nuevas:
+                    bisect.insort(self._claves, clave)
+
+    def _quitar(self, simbolo):
+        texto = self._textos.pop(simbolo)
+        self._claves = [c for c in self._claves if c[1] != simbolo]
+        for trigrama in trigramas(texto):
+            self._trigramas[trigrama].discard(simbolo)
+
+    def buscar(self, texto, limite=MAX_SUGERENCIAS):
+        consulta = normalizar(texto.strip())
+        if not consulta:
+            return []
+        with self._lock:
+            puntos = {}
+            i = bisect.bisect_left(self._claves, (consulta,))
+            while i < len(self._claves) and self._claves[i][0].startswith(consulta):
+                clave, simbolo = self._claves[i]
+                if clave == self._textos[simbolo].split(' ', 1)[0]:
+                    nivel = 0 if clave == consulta else 1  # El ticker
+                else:
+                    nivel = 2  # El nombre o una de sus palabras
+                puntos[simbolo] = min(puntos.get(simbolo, nivel), nivel)
+                i += 1
+            if len(puntos) < limite and len(consulta) >= 3:
+                listas = sorted((self._trigramas.get(t, set()) for t in trigramas(consulta)), key=len)
+                candidatos = set.intersection(*listas) if listas else set()
+                for simbolo in candidatos:
+                    if simbolo not in puntos and consulta in self._textos[simbolo]:
+                        puntos[simbolo] = 3
+        return sorted(puntos, key=lambda s: (puntos[s], len(s), s))[:limite]
@@ -0,0 +1,132 @@
+'''
+Actualizacion incremental de tablas ttk.Treeview.
+
+En lugar de borrar y volver a insertar todas las filas en cada refresco, se compara lo que hay
+en pantalla con los datos nuevos y solo se insertan, borran o cambian las filas afectadas.
+Asi se conservan la seleccion y la posicion del scroll, y el coste en llamadas a Tk es
+proporcional a lo que ha cambiado.
+'''
+
+
+class TablaIncremental:
+    def __init__(self, tree):
+        self.tree = tree
+        self._valores = {}  # iid -> valores mostrados
+        self._orden = []  # iids en el orden en que se ven
+        self.llamadas_tk = 0
+
+    def sincronizar(self, filas):
+        # filas: lista ordenada de (iid, valores); el iid debe ser estable entre refrescos
+        nuevas = {}
+        for iid, valores in filas:
+            nuevas[str(iid)] = tuple(valores)
+        orden = list(nuevas)
+
+        borrar = [iid for iid in self._orden if iid not in nuevas]
+        if borrar:
+            self.tree.delete(*borrar)
+            self.llamadas_tk += 1
+
+        for posicion, iid in enumerate(orden):
+            valores = nuevas[iid]
+            anteriores = self._valores.get(iid)
+            if anteriores is None:
+                self.tree.insert('', posicion, iid=iid, values=valores)
+                self.llamadas_tk += 1
+            elif anteriores != valores:
+                self.tree.item(iid, values=valores)
+                self.llamadas_tk += 1
+
+        # Las filas que ya estaban conservan su orden relativo salvo que los datos se reordenen
+        conservadas = [iid for iid in self._orden if iid in nuevas]
+        if conservadas != [iid for iid in orden if iid in self._valores]:
+            for posicion, iid in enumerate(orden):
+                self.tree.move(iid, '', posicion)
+                self.llamadas_tk += 1
+
+        self._valores = nuevas
+        self._orden = orden
+
+    def actualizar(self, iid, valores):
+        # Una sola fila ya pintada (ticks en directo); no hace nada si no esta o no ha cambiado
+        iid = str(iid)
+        valores = tuple(valores)
+        if iid in self._valores and self._valores[iid] != valores:
+            self.tree.item(iid, values=valores)
+            self._valores[iid] = valores
+            self.llamadas_tk += 1
+
+    def vaciar(self):
+        self.sincronizar([])
+
+
+def iids_unicos(claves):
+    # Claves repetidas reciben un sufijo para que cada fila tenga un iid distinto
+    vistos = {}
+    for clave in claves:
+        vistos[clave] = vistos.get(clave, 0) + 1
+        yield clave if vistos[clave] == 1 else f"{clave}#{vistos[clave]}"
+
+
+# Claves de ordenacion de la tabla de registros; el id desempata para que el orden sea estable
+CLAVES_ORDEN = {
+    'id': lambda r: r['id'],
+    'fecha': lambda r: (r['a'], r['m'], r['d'], r['id']),
+    'cantidad': lambda r: (r['cantidad'], r['id']),
+    'trans': lambda r: (r['trans'], r['id']),
+}
+
+
+class IndiceRegistros:
+    # Posiciones de los registros agrupadas por año y mes. Cada combinacion de filtro y orden
+    # se calcula la primera vez que se pide y se reutiliza hasta que cambien los datos.
+    def __init__(self, registros):
+        self.registros = registros
+        self._grupos = {(None, None): list(range(len(registros)))}
+        for i, r in enumerate(registros):
+            for clave in ((r['a'], None), (None, r['m']), (r['a'], r['m'])):
+                self._grupos.setdefault(clave, []).append(i)
+        self._vistas = {}
+
+    def anios(self):
+        return sorted({a for a, _ in self._grupos if a is not None})
+
+    def vista(self, anio=None, mes=None, clave='id', descendente=False):
+        llave = (anio, mes, clave, descendente)
+        if llave not in self._vistas:
+            inversa = self._vistas.get((anio, mes, clave, not descendente))
+            if inversa is not None:
+                self._vistas[llave] = inversa[::-1]
+            else:
+                orden = CLAVES_ORDEN[clave]
+                self._vistas[llave] = sorted(self._grupos.get((anio, mes), []),
+                                             key=lambda i: orden(self.registros[i]), reverse=descendente)
+        return self._vistas[llave]
+
+
+class VentanaVirtual:
+    # Que tramo de una lista larga se muestra; solo ese tramo existe como filas de Tk
+    def __init__(self, visibles=25):
+        self.total = 0
+        self.inicio = 0
+        self.visibles = visibles
+
+    def ajustar(self):
+        self.inicio = max(0, min(self.inicio, self.total - self.visibles))
+
+    def mover_a(self, fraccion):
+        self.inicio = int(round(fraccion * self.total))
+        self.ajustar()
+
+    def desplazar(self, filas):
+        self.inicio += filas
+        self.ajustar()
+
+    def rango(self):
+        return range(self.inicio, min(self.total, self.inicio + self.visibles))
+
+    def fracciones(self):
+        # Posicion para la barra de desplazamiento
+        if self.total == 0:
+            return 0.0, 1.0
+        return self.inicio / self.total, min(1.0, (self.inicio + self.visibles) / self.total)
@@ -0,0 +1,200 @@
+import os
+
+import pytest
+
+import almacen
+from almacen import FIELDNAMES, RECARGO_SIN_TRANSACCION, RepositorioCartera, RepositorioSQLite, exportar_csv
+
+REGISTROS = [('05', '01', '2023', 100.0, 's'), ('20', '12', '2023', 50.0, 'n'), ('01', '01', '2024', 200.0, 's'),
+             ('15', '03', '2024', 25.0, 's')]
+
+
+def repositorio_csv(carpeta):
+    repo = RepositorioCartera(os.path.join(carpeta, 'basedatosCY.csv'), os.path.join(carpeta, 'accionesCY.csv'),
+                              os.path.join(carpeta, 'efectivoCY.txt'))
+    repo.inicializar()
+    return repo
+
+
+def repositorio_sqlite(carpeta):
+    repo = RepositorioSQLite(os.path.join(carpeta, 'carteraCY.db'))
+    repo.inicializar()
+    return repo
+
+
+@pytest.fixture(params=[repositorio_csv, repositorio_sqlite], ids=['csv', 'sqlite'])
+def repo(request, tmp_path):
+    carpeta = tmp_path / 'datos'
+    carpeta.mkdir()
+    repo = request.param(str(carpeta))
+    for d, m, a, cantidad, trans in REGISTROS:
+        repo.agregar_registro({'d': d, 'm': m, 'a': a, 'cantidad': cantidad, 'trans': trans})
+    repo.agregar_movimiento({'simbolo': 'SAN.MC', 'd': '02', 'm': '01', 'a': '2024', 'tipo': 'compra',
+                             'cantidad': 10.0, 'precio': 4.0})
+    repo.guardar_efectivo(12.5)
+    return repo
+
+
+def test_total_invertido_por_periodo(repo):
+    assert repo.total_invertido() == pytest.approx(100 + 50 * RECARGO_SIN_TRANSACCION + 200 + 25)
+    assert repo.total_invertido(('2023', '01', '01'), ('2023', '12', '31')) == pytest.approx(
+        100 + 50 * RECARGO_SIN_TRANSACCION)
+    assert repo.total_invertido(('2024', '01', '01')) == pytest.approx(225)
+    assert repo.total_invertido(hasta=('2023', '12', '19')) == pytest.approx(100)
+
+    # Lo que se añade despues cuenta en la siguiente consulta
+    repo.agregar_registro({'d': '10', 'm': '03', 'a': '2024', 'cantidad': 5.0, 'trans': 's'})
+    assert repo.total_invertido(('2024', '03', '01'), ('2024', '03', '31')) == pytest.approx(30)
+
+
+def test_exportar_copia_los_datos(repo, tmp_path):
+    copia = tmp_path / 'copia'
+    copia.mkdir()
+    escritos = exportar_csv(repo, str(copia / 'basedatosCY.csv'), str(copia / 'accionesCY.csv'),
+                            str(copia / 'efectivoCY.txt'))
+    assert escritos == (4, 1)
+
+    exportado = repositorio_csv(str(copia))
+    assert [(r['d'], r['m'], r['a'], r['cantidad'], r['trans']) for r in exportado.registros()] == REGISTROS
+    assert [(a['simbolo'], a['cantidad']) for a in exportado.acciones()] == [('SAN.MC', 10.0)]
+    assert exportado.cargar_efectivo() == 12.5
+
+
+def test_exportar_no_pisa_los_archivos_en_uso(tmp_path):
+    repo = repositorio_csv(str(tmp_path))
+    with pytest.raises(ValueError):
+        exportar_csv(repo, repo.db_file, str(tmp_path / 'otro.csv'), str(tmp_path / 'otro.txt'))
+
+
+def registros_de(repo):
+    return [(r['id'], r['d'], r['m'], r['a'], r['cantidad'], r['trans']) for r in repo.registros()]
+
+
+def anotar_varios(repo):
+    repo.agregar_registro({'d': '05', 'm': '01', 'a': '2024', 'cantidad': 100.0, 'trans': 's'})
+    repo.agregar_registro({'d': '06', 'm': '01', 'a': '2024', 'cantidad': 50.0, 'trans': 'n'})
+    repo.eliminar_registro(1)
+    repo.agregar_movimiento({'simbolo': 'SAN.MC', 'd': '02', 'm': '01', 'a': '2024', 'tipo': 'compra',
+                             'cantidad': 10.0, 'precio': 4.0})
+    repo.guardar_efectivo(7.5)
+
+
+def test_el_diario_se_reaplica_sobre_la_foto_al_abrir(tmp_path):
+    repo = repositorio_csv(str(tmp_path))
+    anotar_varios(repo)
+
+    # Nada se ha volcado a la foto: todo esta en el diario
+    with open(repo.db_file, encoding='utf-8') as f:
+        assert f.read().strip() == ','.join(FIELDNAMES)
+    assert repo.diario.tamano > 0
+
+    abierto = repositorio_csv(str(tmp_path))
+    assert registros_de(abierto) == [(2, '06', '01', '2024', 50.0, 'n')]
+    assert [(a['simbolo'], a['cantidad']) for a in abierto.acciones()] == [('SAN.MC', 10.0)]
+    assert abierto.cargar_efectivo() == 7.5
+    assert abierto.proximo_id() == 3  # El id borrado no se reutiliza
+
+
+def test_se_compacta_al_pasar_el_umbral(tmp_path, monkeypatch):
+    monkeypatch.setattr(almacen, 'UMBRAL_DIARIO', 300)
+    repo = repositorio_csv(str(tmp_path))
+    for dia in range(1, 6):
+        repo.agregar_registro({'d': f"{dia:02d}", 'm': '01', 'a': '2024', 'cantidad': 10.0, 'trans': 's'})
+
+    # Al pasar de 300 bytes se vuelca la foto y el diario vuelve a empezar
+    assert repo.diario.tamano < 300
+    assert not os.path.exists(repo.diario.anterior)
+    with open(repo.db_file, encoding='utf-8') as f:
+        volcados = len(f.readlines()) - 1
+    assert 0 < volcados <= 5
+    assert len(registros_de(repositorio_csv(str(tmp_path)))) == 5
+
+
+def test_compactar_no_pierde_lo_anotado_mientras_se_escribe(tmp_path):
+    repo = repositorio_csv(str(tmp_path))
+    anotar_varios(repo)
+    escribir = repo.preparar_compactacion()
+    assert os.path.exists(repo.diario.anterior)
+    repo.agregar_registro({'d': '07', 'm': '01', 'a': '2024', 'cantidad': 1.0, 'trans': 's'})
+    escribir()
+
+    assert not os.path.exists(repo.diario.anterior)
+    assert [r[0] for r in registros_de(repositorio_csv(str(tmp_path)))] == [2, 3]
+
+
+def test_corte_entre_el_temporal_y_el_rename(tmp_path, monkeypatch):
+    repo = repositorio_csv(str(tmp_path))
+    anotar_varios(repo)
+    with open(repo.db_file, encoding='utf-8') as f:
+        foto = f.read()
+    escribir = repo.preparar_compactacion()
+
+    def corte(origen, destino):
+        raise OSError("Corte de luz")
+
+    monkeypatch.setattr(almacen.os, 'replace', corte)
+    with pytest.raises(OSError):
+        escribir()
+    monkeypatch.undo()
+
+    # La foto sigue siendo la vieja, sin temporales a medias, y lo apartado queda en .anterior
+    with open(repo.db_file, encoding='utf-8') as f:
+        assert f.read() == foto
+    assert not [nombre for nombre in os.listdir(tmp_path) if nombre.startswith('.tmp_')]
+    assert os.path.exists(repo.diario.anterior)
+
+    abierto = repositorio_csv(str(tmp_path))
+    assert registros_de(abierto) == [(2, '06', '01', '2024', 50.0, 'n')]
+    assert abierto.cargar_efectivo() == 7.5
+
+    # La siguiente compactacion recoge lo apartado
+    abierto.compactar()
+    assert not os.path.exists(abierto.diario.anterior)
+    assert registros_de(repositorio_csv(str(tmp_path))) == [(2, '06', '01', '2024', 50.0, 'n')]
+
+
+def test_corte_tras_escribir_la_foto_reaplica_sin_duplicar(tmp_path, monkeypatch):
+    repo = repositorio_csv(str(tmp_path))
+    anotar_varios(repo)
+    monkeypatch.setattr(repo.diario, 'descartar_anterior', lambda: None)  # Se corta justo antes de borrarlo
+    repo.compactar()
+    assert os.path.exists(repo.diario.anterior)
+
+    abierto = repositorio_csv(str(tmp_path))
+    assert registros_de(abierto) == [(2, '06', '01', '2024', 50.0, 'n')]
+    assert [(a['simbolo'], a['cantidad']) for a in abierto.acciones()] == [('SAN.MC', 10.0)]
+
+
+def test_ultima_linea_del_diario_a_medias(tmp_path):
+    repo = repositorio_csv(str(tmp_path))
+    anotar_varios(repo)
+    with open(repo.diario.ruta, 'a', encoding='utf-8') as f:
+        f.write('{"tipo": "efectivo", "val')  # El programa se cerro escribiendo
+
+    abierto = repositorio_csv(str(tmp_path))
+    assert registros_de(abierto) == [(2, '06', '01', '2024', 50.0, 'n')]
+    assert abierto.cargar_efectivo() == 7.5
+
+
+def test_tras_una_linea_a_medias_se_sigue_anotando(tmp_path):
+    repo = repositorio_csv(str(tmp_path))
+    anotar_varios(repo)
+    with open(repo.diario.ruta, 'a', encoding='utf-8') as f:
+        f.write('{"tipo": "efectivo", "val')
+
+    abierto = repositorio_csv(str(tmp_path))
+    abierto.guardar_efectivo(20.0)
+    assert repositorio_csv(str(tmp_path)).cargar_efectivo() == 20.0
+
+
+def test_lo_apartado_a_medias_no_se_pega_a_lo_siguiente(tmp_path):
+    repo = repositorio_csv(str(tmp_path))
+    anotar_varios(repo)
+    repo.preparar_compactacion()  # Se corta sin escribir la foto: todo queda en .anterior
+    with open(repo.diario.anterior, 'a', encoding='utf-8') as f:
+        f.write('{"tipo": "efectivo", "val')
+
+    abierto = repositorio_csv(str(tmp_path))
+    abierto.guardar_efectivo(20.0)
+    abierto.diario.apartar()
+    assert repositorio_csv(str(tmp_path)).cargar_efectivo() == 20.0
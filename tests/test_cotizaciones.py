@@ -0,0 +1,118 @@
+import pytest
+
+from cotizaciones import CacheCotizaciones, MonedasInstrumentos, UltimosPrecios, precios_con_respaldo, precios_en_euros
+from fuentes import FuenteFalsa
+
+
+class Reloj:
+    def __init__(self, ahora=1000.0):
+        self.ahora = ahora
+
+    def __call__(self):
+        return self.ahora
+
+
+class FuenteCaida(FuenteFalsa):
+    # Como si no hubiera conexion
+    def descargar(self, simbolos):
+        self.descargas += 1
+        raise OSError("Sin conexión")
+
+
+PRECIOS = {'SAN.MC': 4.0, 'AAPL': 220.0, 'VOD.L': 80.0, 'EURUSD=X': 1.1, 'EURGBP=X': 0.8}
+MONEDAS = {'SAN.MC': 'EUR', 'AAPL': 'USD', 'VOD.L': 'GBp'}
+
+
+def test_precios_en_euros_convierte_con_una_descarga_por_grupo():
+    fuente = FuenteFalsa(PRECIOS, MONEDAS)
+    cache = CacheCotizaciones(fuente)
+
+    precios = precios_en_euros(cache, ['SAN.MC', 'AAPL', 'VOD.L', 'AAPL'], MonedasInstrumentos())
+
+    assert precios['SAN.MC'] == pytest.approx(4.0)
+    assert precios['AAPL'] == pytest.approx(220.0 / 1.1)
+    assert precios['VOD.L'] == pytest.approx(80.0 / 100 / 0.8)  # Peniques a libras y libras a euros
+    assert fuente.descargas == 2  # Los simbolos y despues los pares de divisas
+    assert fuente.simbolos_pedidos == 3 + 2
+
+
+def test_precios_en_euros_cruza_por_el_dolar_y_omite_lo_que_no_hay():
+    fuente = FuenteFalsa({'7203.T': 3000.0, 'EURUSD=X': 1.1, 'USDJPY=X': 150.0}, {'7203.T': 'JPY', 'XXX': 'USD'})
+    precios = precios_en_euros(CacheCotizaciones(fuente), ['7203.T', 'XXX'], MonedasInstrumentos())
+
+    assert precios == {'7203.T': pytest.approx(3000.0 / (1.1 * 150.0))}
+
+
+def test_precios_con_respaldo_usa_el_ultimo_guardado_sin_conexion():
+    reloj = Reloj(500.0)
+    ultimos = UltimosPrecios(reloj=reloj)
+    monedas = MonedasInstrumentos()
+
+    precios, antiguos = precios_con_respaldo(CacheCotizaciones(FuenteFalsa(PRECIOS, MONEDAS)), ['SAN.MC', 'AAPL'],
+                                             monedas, ultimos)
+    assert antiguos == {}
+    assert ultimos.obtener('SAN.MC') == (4.0, 500.0)
+
+    caida = FuenteCaida({})
+    precios_sin_red, antiguos = precios_con_respaldo(CacheCotizaciones(caida), ['SAN.MC', 'AAPL', 'NUEVO'], monedas,
+                                                     ultimos)
+    assert caida.descargas == 1
+    assert precios_sin_red == precios
+    assert antiguos == {'SAN.MC': 500.0, 'AAPL': 500.0}
+
+
+def test_cache_reutiliza_hasta_que_caduca():
+    reloj = Reloj()
+    fuente = FuenteFalsa({'SAN.MC': 4.0})
+    cache = CacheCotizaciones(fuente, ttl=10, reloj=reloj)
+
+    assert cache.obtener('SAN.MC') == 4.0
+    fuente.precios['SAN.MC'] = 4.5
+    reloj.ahora += 9.9
+    assert cache.obtener('SAN.MC') == 4.0
+    reloj.ahora += 0.1
+    assert cache.obtener('SAN.MC') == 4.5
+
+    estadisticas = cache.estadisticas()
+    assert (estadisticas['aciertos'], estadisticas['fallos'], estadisticas['descargas']) == (1, 2, 2)
+    assert estadisticas['tasa_aciertos'] == pytest.approx(1 / 3)
+    assert fuente.descargas == 2
+
+
+def test_cache_solo_pide_lo_que_falta_y_las_divisas_duran_mas():
+    reloj = Reloj()
+    fuente = FuenteFalsa({'SAN.MC': 4.0, 'AAPL': 220.0, 'EURUSD=X': 1.1})
+    cache = CacheCotizaciones(fuente, ttl=10, ttl_divisas=60, reloj=reloj)
+
+    cache.obtener_varios(['SAN.MC', 'EURUSD=X'])
+    reloj.ahora += 30
+    assert cache.obtener_varios(['SAN.MC', 'AAPL', 'EURUSD=X']) == {'SAN.MC': 4.0, 'AAPL': 220.0, 'EURUSD=X': 1.1}
+    assert fuente.simbolos_pedidos == 2 + 2  # El par sigue valido; SAN.MC caduco y AAPL no estaba
+    assert cache.aciertos == 1
+
+
+def test_cache_expulsa_la_menos_usada():
+    fuente = FuenteFalsa({'A': 1.0, 'B': 2.0, 'C': 3.0})
+    cache = CacheCotizaciones(fuente, max_entradas=2, reloj=Reloj())
+
+    cache.obtener_varios(['A', 'B'])
+    cache.obtener('A')
+    cache.obtener('C')
+    assert cache.estadisticas()['entradas'] == 2
+    cache.obtener_varios(['A', 'C'])
+    assert fuente.descargas == 2  # A y C seguian; B fue la expulsada
+    cache.obtener('B')
+    assert fuente.descargas == 3
+
+
+def test_monedas_se_guardan_y_se_vuelven_a_leer(tmp_path):
+    ruta = str(tmp_path / 'monedas.json')
+    fuente = FuenteFalsa({}, {'AAPL': 'USD'})
+    monedas = MonedasInstrumentos(ruta)
+    monedas.resolver(['AAPL', 'RARO'], fuente)
+    monedas.resolver(['AAPL', 'RARO'], fuente)
+
+    assert [p.name for p in tmp_path.iterdir()] == ['monedas.json']  # Sin temporales a medias
+    guardadas = MonedasInstrumentos(ruta)
+    assert guardadas.moneda('AAPL') == 'USD'
+    assert guardadas.moneda('SAN.MC') == 'EUR'  # Por el sufijo
@@ -0,0 +1,96 @@
+from datetime import date
+
+import pytest
+
+from fuentes import ErrorFuente, FuenteFalsa, FuenteGrabada, FuenteGrabadora, FuentePrecios, FuenteYahoo
+
+GRABACION = {
+    'cotizaciones': {'SAN.MC': [4.0, 4.1, 4.2], 'AAPL': [220.0]},
+    'monedas': {'SAN.MC': 'EUR', 'AAPL': 'USD'},
+    'historicos': {'SAN.MC': [['2024-01-02', 4.0, 4.1, 3.9, 4.05, 1000.0], ['2024-01-03', 4.05, 4.2, 4.0, 4.1, 900.0]]},
+    'informacion': {'SAN.MC': {'shortName': 'Banco Santander', 'currency': 'EUR'}},
+}
+
+
+def reproducir(fuente, llamadas=20):
+    # Lo que devuelve cada descarga, o el fallo
+    resultado = []
+    for _ in range(llamadas):
+        try:
+            resultado.append(fuente.descargar(['SAN.MC', 'AAPL']))
+        except ErrorFuente:
+            resultado.append('fallo')
+    return resultado
+
+
+def test_reproduce_en_orden_y_vuelve_a_empezar():
+    fuente = FuenteGrabada(datos=GRABACION)
+    assert [fuente.precio('SAN.MC') for _ in range(4)] == [4.0, 4.1, 4.2, 4.0]
+    assert fuente.descargar(['AAPL', 'AAPL', 'NADA']) == {'AAPL': 220.0}
+    assert fuente.monedas(['SAN.MC', 'NADA']) == {'SAN.MC': 'EUR'}
+    assert fuente.historico(['SAN.MC'], date(2024, 1, 3), date(2024, 1, 31)) == {
+        'SAN.MC': [('2024-01-03', 4.05, 4.2, 4.0, 4.1, 900.0)]}
+
+
+def test_misma_semilla_mismos_fallos_y_latencias():
+    esperas = [[], []]
+    fuentes = [FuenteGrabada(datos=GRABACION, latencia=0.2, variacion=0.1, fallos=0.3, fallar_en=(2,), semilla=7,
+                             dormir=esperas[i].append) for i in range(2)]
+
+    primera, segunda = reproducir(fuentes[0]), reproducir(fuentes[1])
+    assert primera == segunda
+    assert esperas[0] == esperas[1]
+    assert all(0.1 <= e <= 0.3 for e in esperas[0])
+    assert primera[1] == 'fallo'
+    assert fuentes[0].fallidas == primera.count('fallo') > 1
+    assert fuentes[0].llamadas == 20
+
+    otra = FuenteGrabada(datos=GRABACION, fallos=0.3, semilla=8, dormir=lambda s: None)
+    assert reproducir(otra) != primera
+
+
+def test_lo_grabado_se_reproduce_igual(tmp_path):
+    original = FuenteFalsa({'SAN.MC': 4.0}, {'SAN.MC': 'EUR'},
+                           {'SAN.MC': [('2024-01-02', 4.0, 4.1, 3.9, 4.05, 1000.0)]})
+    grabadora = FuenteGrabadora(original)
+    grabadora.descargar(['SAN.MC'])
+    original.precios['SAN.MC'] = 4.2
+    grabadora.descargar(['SAN.MC'])
+    grabadora.monedas(['SAN.MC'])
+    grabadora.historico(['SAN.MC'], date(2024, 1, 1), date(2024, 1, 31))
+    ruta = str(tmp_path / 'grabacion.json')
+    grabadora.guardar(ruta)
+
+    fuente = FuenteGrabada(ruta)
+    assert [fuente.precio('SAN.MC'), fuente.precio('SAN.MC')] == [4.0, 4.2]
+    assert fuente.monedas(['SAN.MC']) == {'SAN.MC': 'EUR'}
+    assert fuente.historico(['SAN.MC'], date(2024, 1, 1), date(2024, 1, 31)) == {
+        'SAN.MC': [('2024-01-02', 4.0, 4.1, 3.9, 4.05, 1000.0)]}
+
+
+def test_fallo_grabado_se_comporta_como_error_de_red():
+    fuente = FuenteGrabada(datos=GRABACION, fallar_en=(1,))
+    with pytest.raises(OSError):
+        fuente.descargar(['SAN.MC'])
+    assert fuente.descargar(['SAN.MC']) == {'SAN.MC': 4.0}
+
+
+def test_toda_fuente_da_precios_e_historico():
+    for clase in (FuenteYahoo, FuenteFalsa, FuenteGrabada, FuenteGrabadora):
+        assert not clase.__abstractmethods__, clase
+
+    class SoloPrecios(FuentePrecios):
+        def descargar(self, simbolos):
+            return {}
+
+    with pytest.raises(TypeError):
+        SoloPrecios()
+
+
+def test_la_grabadora_acumula_el_historico_sin_repetir_dias():
+    original = FuenteFalsa({}, historicos={'SAN.MC': [('2024-01-02', 4.0, 4.1, 3.9, 4.05, 1000.0),
+                                                      ('2024-01-03', 4.05, 4.2, 4.0, 4.1, 900.0)]})
+    grabadora = FuenteGrabadora(original)
+    grabadora.historico(['SAN.MC'], date(2024, 1, 3), date(2024, 1, 3))
+    grabadora.historico(['SAN.MC'], date(2024, 1, 1), date(2024, 1, 3))
+    assert [b[0] for b in grabadora.datos['historicos']['SAN.MC']] == ['2024-01-02', '2024-01-03']
@@ -0,0 +1,66 @@
+from datetime import date
+
+import pytest
+
+from fuentes import FuenteFalsa
+from historico import HistoricoPrecios
+
+
+def barras(simbolo_base, fechas):
+    return [(f, simbolo_base, simbolo_base + 1, simbolo_base - 1, simbolo_base + i, 1000.0) for i, f in enumerate(fechas)]
+
+
+@pytest.fixture
+def historico(tmp_path):
+    historico = HistoricoPrecios(str(tmp_path / 'historico.db'))
+    yield historico
+    historico.cerrar()
+
+
+def test_completar_descarga_solo_lo_que_falta(historico):
+    fuente = FuenteFalsa({}, historicos={
+        'SAN.MC': barras(4.0, ['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05']),
+        'AAPL': barras(180.0, ['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05']),
+    })
+    inicio = date(2024, 1, 1)
+
+    # Primera vez: todo desde el inicio en una sola peticion
+    assert historico.completar(['SAN.MC', 'AAPL'], fuente, hoy=date(2024, 1, 3), inicio=inicio) == 4
+    assert fuente.descargas_historico == [(['SAN.MC', 'AAPL'], inicio, date(2024, 1, 3))]
+    assert historico.ultima_fecha('SAN.MC') == date(2024, 1, 3)
+
+    # Despues solo desde la ultima barra guardada, que se vuelve a pedir por si era de un dia a medias
+    fuente.descargas_historico.clear()
+    assert historico.completar(['SAN.MC', 'AAPL'], fuente, hoy=date(2024, 1, 5), inicio=inicio) == 6
+    assert fuente.descargas_historico == [(['SAN.MC', 'AAPL'], date(2024, 1, 3), date(2024, 1, 5))]
+    assert [f for f, _ in historico.cierres('SAN.MC')] == ['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05']
+    assert historico.descargas == 2
+
+
+def test_completar_agrupa_por_fecha_de_inicio(historico):
+    fuente = FuenteFalsa({}, historicos={
+        'SAN.MC': barras(4.0, ['2024-01-02', '2024-01-03', '2024-01-04']),
+        'BBVA.MC': barras(9.0, ['2024-01-02', '2024-01-03', '2024-01-04']),
+        'NUEVO': barras(1.0, ['2024-01-02', '2024-01-03', '2024-01-04']),
+    })
+    inicio = date(2024, 1, 1)
+    historico.completar(['SAN.MC', 'BBVA.MC'], fuente, hoy=date(2024, 1, 3), inicio=inicio)
+    fuente.descargas_historico.clear()
+
+    historico.completar(['SAN.MC', 'BBVA.MC', 'NUEVO'], fuente, hoy=date(2024, 1, 4), inicio=inicio)
+    assert fuente.descargas_historico == [
+        (['NUEVO'], inicio, date(2024, 1, 4)),
+        (['SAN.MC', 'BBVA.MC'], date(2024, 1, 3), date(2024, 1, 4)),
+    ]
+    assert sorted(historico.simbolos()) == ['BBVA.MC', 'NUEVO', 'SAN.MC']
+
+
+def test_guardar_sustituye_la_barra_del_dia_y_apunta_la_version(historico):
+    historico.guardar('SAN.MC', [('2024-01-02', 4.0, 4.2, 3.9, 4.1, 100.0)])
+    historico.guardar('SAN.MC', [('2024-01-02', 4.0, 4.3, 3.9, 4.25, 150.0)])
+    historico.guardar('AAPL', [('2024-01-02', 180.0, 182.0, 179.0, 181.0, 100.0)])
+
+    assert historico.cierres('SAN.MC') == [('2024-01-02', 4.25)]
+    assert historico.ultimas_barras('SAN.MC', 5) == [('2024-01-02', 4.3, 3.9, 4.25)]
+    assert historico.cambios == 3
+    assert historico.versiones == {'SAN.MC': 2, 'AAPL': 3}
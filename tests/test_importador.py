@@ -0,0 +1,90 @@
+import pytest
+
+from almacen import RepositorioCartera
+from importador import Importacion, importar, normalizar_fecha, normalizar_mes, normalizar_partes
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = RepositorioCartera(str(tmp_path / 'basedatosCY.csv'), str(tmp_path / 'accionesCY.csv'),
+                              str(tmp_path / 'efectivoCY.txt'))
+    repo.inicializar()
+    return repo
+
+
+def extracto(tmp_path, *lineas):
+    ruta = tmp_path / 'extracto.csv'
+    ruta.write_text("\n".join(lineas) + "\n", encoding='utf-8')
+    return str(ruta)
+
+
+def importar_por_lotes(repo, ruta, tipo='registros', tamano_lote=2):
+    # Lotes pequeños para que las filas de un lote dependan de las de otros
+    importacion = Importacion(repo, ruta, tipo, tamano_lote)
+    try:
+        while importacion.paso():
+            pass
+    finally:
+        importacion.cerrar()
+    return importacion
+
+
+def test_respeta_los_ids_y_numera_el_resto_al_final(repo, tmp_path):
+    ruta = extracto(tmp_path, "id;fecha;importe", "5;01/02/2024;10", ";02/02/2024;20", "2;03/02/2024;30",
+                    ";04/02/2024;40", "9;05/02/2024;50")
+    importacion = importar_por_lotes(repo, ruta)
+
+    assert importacion.importadas == 5
+    por_cantidad = {r['cantidad']: r['id'] for r in repo.registros()}
+    assert (por_cantidad[10], por_cantidad[30], por_cantidad[50]) == (5, 2, 9)
+    # El 9 aparece despues de las filas sin id: se numeran tras el, no tras el 5
+    assert (por_cantidad[20], por_cantidad[40]) == (10, 11)
+
+
+def test_descarta_ids_repetidos(repo, tmp_path):
+    repo.agregar_registros([{'id': 2, 'd': '01', 'm': '01', 'a': '2024', 'cantidad': 1.0, 'trans': 's'}])
+    ruta = extracto(tmp_path, "id;fecha;importe", "2;01/02/2024;10", "3;02/02/2024;20", "4;03/02/2024;30",
+                    "3;04/02/2024;40")
+    importacion = importar_por_lotes(repo, ruta)
+
+    assert (importacion.importadas, importacion.duplicadas) == (2, 2)
+    assert sorted((r['id'], r['cantidad']) for r in repo.registros()) == [(2, 1.0), (3, 20.0), (4, 30.0)]
+
+
+def test_descarta_compras_repetidas(repo, tmp_path):
+    repo.agregar_movimiento({'simbolo': 'SAN.MC', 'd': '02', 'm': '01', 'a': '2024', 'tipo': 'compra',
+                             'cantidad': 10.0, 'precio': 4.0})
+    ruta = extracto(tmp_path, "ticker;fecha;titulos;precio",
+                    "san.mc;02/01/2024;10;4",  # Ya esta en el libro
+                    "SAN.MC;02/01/2024;10;4,5",  # Otro precio: otro lote
+                    "BBVA.MC;03/01/2024;5;9",
+                    "BBVA.MC;03/01/2024;5;9",  # Repetida en el mismo lote
+                    "SAN.MC;02/01/2024;10;4,5")  # Repetida en otro lote
+    importacion = importar_por_lotes(repo, ruta, 'acciones', tamano_lote=4)
+
+    assert (importacion.importadas, importacion.duplicadas) == (2, 3)
+    assert sorted((m['simbolo'], m['cantidad'], m['precio']) for m in repo.movimientos()) == [
+        ('BBVA.MC', 5.0, 9.0), ('SAN.MC', 10.0, 4.0), ('SAN.MC', 10.0, 4.5)]
+
+
+def test_rechaza_fechas_invalidas(repo, tmp_path):
+    ruta = extracto(tmp_path, "d;m;a;cantidad", "15;03;2024;10", "15;13;2024;20", "31;04;2024;30",
+                    "29;02;2023;40", "1;marzo;2024;50", "1;brumario;2024;60")
+    importacion = importar(repo, ruta)
+
+    assert (importacion.importadas, importacion.erroneas) == (2, 4)
+    assert [linea for linea, _ in importacion.errores] == [3, 4, 5, 7]
+    assert sorted((r['d'], r['m'], r['a']) for r in repo.registros()) == [('01', '03', '2024'), ('15', '03', '2024')]
+
+
+def test_normalizar_mes_contra_meses():
+    assert normalizar_mes('3') == '03'
+    assert normalizar_mes('Mar.') == '03'
+    assert normalizar_mes('march') == '03'
+    for mes in ('0', '13', 'brumario', ''):
+        with pytest.raises(ValueError):
+            normalizar_mes(mes)
+    assert normalizar_partes('5', '12', '24') == ('05', '12', '2024')
+    assert normalizar_fecha('2024-02-29T10:00:00') == ('29', '02', '2024')
+    with pytest.raises(ValueError):
+        normalizar_fecha('31/04/2024')
@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from lotes import COMPRA, VENTA, Libro, clave_movimiento, reconstruir
+
+
+def mov(id_movimiento, tipo, cantidad, precio, dia, simbolo='SAN.MC', mes='01'):
+    return {'id': id_movimiento, 'simbolo': simbolo, 'd': f"{dia:02d}", 'm': mes, 'a': '2024', 'tipo': tipo,
+            'cantidad': float(cantidad), 'precio': float(precio)}
+
+
+def test_fifo_y_coste_medio_con_un_lote_a_medias():
+    libro = Libro([mov(1, COMPRA, 10, 10, 1), mov(2, COMPRA, 10, 20, 2), mov(3, VENTA, 15, 30, 3)])
+    posicion = libro.posiciones['SAN.MC']
+
+    # FIFO: 10 del primer lote (+20 cada una) y 5 del segundo (+10 cada una)
+    assert posicion.realizado_fifo == pytest.approx(250)
+    assert posicion.coste_fifo == pytest.approx(5 * 20)
+    # Coste medio: 15 por accion
+    assert posicion.realizado_medio == pytest.approx(15 * (30 - 15))
+    assert posicion.coste_medio == pytest.approx(5 * 15)
+    assert list(posicion.lotes) == [[5.0, 20.0]]
+    assert libro.realizado() == {'fifo': pytest.approx(250), 'medio': pytest.approx(225)}
+
+
+def test_varias_ventas_consumen_el_mismo_lote():
+    libro = Libro([mov(1, COMPRA, 10, 10, 1), mov(2, VENTA, 4, 12, 2), mov(3, VENTA, 3, 15, 3)])
+    agregado = libro.agregado('SAN.MC')
+
+    assert agregado['cantidad'] == pytest.approx(3)
+    assert agregado['lotes'] == 1
+    assert agregado['precio_compra'] == pytest.approx(10)
+    assert agregado['realizado_fifo'] == pytest.approx(4 * 2 + 3 * 5)
+
+
+def test_vender_todo_deja_la_posicion_a_cero():
+    libro = Libro([mov(1, COMPRA, 0.1, 10, 1), mov(2, COMPRA, 0.2, 10, 2), mov(3, VENTA, 0.3, 11, 3)])
+    posicion = libro.posiciones['SAN.MC']
+    assert (posicion.cantidad, posicion.coste_fifo, posicion.coste_medio, len(posicion.lotes)) == (0.0, 0.0, 0.0, 0)
+    assert libro.acciones() == []
+
+
+def test_compra_con_fecha_anterior_rehace_el_simbolo():
+    libro = Libro([mov(1, COMPRA, 10, 10, 10), mov(2, VENTA, 10, 15, 20)])
+    assert libro.agregado('SAN.MC')['realizado_fifo'] == pytest.approx(50)
+
+    libro.agregar(mov(3, COMPRA, 5, 8, 5))
+    posicion = libro.posiciones['SAN.MC']
+    # La venta del dia 20 consume ahora las 5 del dia 5 y 5 de las del dia 10
+    assert posicion.realizado_fifo == pytest.approx(5 * 7 + 5 * 5)
+    assert posicion.coste_fifo == pytest.approx(5 * 10)
+    medio = (5 * 8 + 10 * 10) / 15
+    assert posicion.realizado_medio == pytest.approx(10 * (15 - medio))
+    assert posicion.coste_medio == pytest.approx(5 * medio)
+    assert [m['id'] for m in libro.movimientos('SAN.MC')] == [3, 1, 2]
+
+
+def test_venta_con_fecha_anterior_que_no_cabe_no_cambia_nada():
+    libro = Libro([mov(1, COMPRA, 10, 10, 10)])
+    with pytest.raises(ValueError):
+        libro.agregar(mov(2, VENTA, 5, 12, 5))
+    assert libro.movimiento(2) is None
+    assert [m['id'] for m in libro.movimientos('SAN.MC')] == [1]
+    assert libro.agregado('SAN.MC')['cantidad'] == pytest.approx(10)
+
+
+def test_venta_de_mas_rechazada_deja_la_posicion_intacta():
+    libro = Libro([mov(1, COMPRA, 10, 10, 1), mov(2, COMPRA, 5, 20, 2)])
+    antes = libro.agregado('SAN.MC')
+    lotes = [list(l) for l in libro.posiciones['SAN.MC'].lotes]
+
+    with pytest.raises(ValueError):
+        libro.agregar(mov(3, VENTA, 16, 30, 3))
+    assert libro.agregado('SAN.MC') == antes
+    assert [list(l) for l in libro.posiciones['SAN.MC'].lotes] == lotes
+    assert libro.movimiento(3) is None
+
+
+def test_borrar_una_compra_que_deja_sin_acciones_a_una_venta_se_rechaza():
+    libro = Libro([mov(1, COMPRA, 10, 10, 1), mov(2, VENTA, 8, 12, 2)])
+    with pytest.raises(ValueError):
+        libro.eliminar(1)
+    assert libro.movimiento(1) is not None
+    assert libro.agregado('SAN.MC')['cantidad'] == pytest.approx(2)
+
+
+def test_el_agregado_coincide_con_rehacer_desde_cero():
+    aleatorio = random.Random(3)
+    libro = Libro()
+    for id_movimiento in range(1, 400):
+        simbolo = aleatorio.choice(['SAN.MC', 'BBVA.MC', 'AAPL'])
+        accion = aleatorio.random()
+        try:
+            if accion < 0.1 and libro.movimientos(simbolo):
+                libro.eliminar(aleatorio.choice(libro.movimientos(simbolo))['id'])
+            elif accion < 0.2 and libro.movimientos(simbolo):
+                cambiado = dict(aleatorio.choice(libro.movimientos(simbolo)), d=f"{aleatorio.randint(1, 28):02d}")
+                libro.modificar(cambiado)
+            else:
+                tipo = COMPRA if aleatorio.random() < 0.6 else VENTA
+                libro.agregar(mov(id_movimiento, tipo, aleatorio.randint(1, 20), aleatorio.uniform(5, 50),
+                                  aleatorio.randint(1, 28), simbolo, f"{aleatorio.randint(1, 12):02d}"))
+        except ValueError:
+            pass  # Ventas que no caben: el libro no cambia
+
+    for simbolo, posicion in libro.posiciones.items():
+        desde_cero = reconstruir(simbolo, sorted(libro.movimientos(simbolo), key=clave_movimiento))
+        for campo in ('cantidad', 'coste_fifo', 'coste_medio', 'realizado_fifo', 'realizado_medio'):
+            assert getattr(posicion, campo) == pytest.approx(getattr(desde_cero, campo), abs=1e-6), (simbolo, campo)
+    assert sum(len(libro.movimientos(s)) for s in libro.posiciones) == len(libro.movimientos())
+
+
+def test_metodo_de_coste_del_agregado():
+    movimientos = [mov(1, COMPRA, 10, 10, 1), mov(2, COMPRA, 10, 20, 2), mov(3, VENTA, 15, 30, 3)]
+    assert Libro(movimientos, 'fifo').acciones()[0]['precio_compra'] == pytest.approx(20)
+    assert Libro(movimientos, 'medio').acciones()[0]['precio_compra'] == pytest.approx(15)
+    with pytest.raises(ValueError):
+        Libro(movimientos, 'lifo')
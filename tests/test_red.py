@@ -0,0 +1,200 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from red import CircuitoAbierto, Circuito, ClienteHTTP, CuboFichas, ErrorHTTP, segundos_retry_after
+
+
+class Reloj:
+    # Reloj manual: dormir() adelanta el tiempo en vez de esperar
+    def __init__(self):
+        self.ahora = 0.0
+        self.dormido = []
+
+    def __call__(self):
+        return self.ahora
+
+    def dormir(self, segundos):
+        self.dormido.append(segundos)
+        self.ahora += segundos
+
+
+class ServidorFalso:
+    # Servidor HTTP local que responde lo que tenga en cola: (estado, cabeceras); vacia, 200
+    def __init__(self):
+        self.respuestas = []
+        self.recibidas = 0
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                servidor.recibidas += 1
+                estado, cabeceras = servidor.respuestas.pop(0) if servidor.respuestas else (200, {})
+                cuerpo = b'{"ok": true}'
+                self.send_response(estado)
+                for clave, valor in cabeceras.items():
+                    self.send_header(clave, valor)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.http = ThreadingHTTPServer(('127.0.0.1', 0), Manejador)
+        self.url = f"http://127.0.0.1:{self.http.server_address[1]}/cotizacion"
+
+    def responder(self, *respuestas):
+        self.respuestas.extend(respuestas)
+
+
+@pytest.fixture
+def servidor():
+    falso = ServidorFalso()
+    hilo = threading.Thread(target=falso.http.serve_forever, daemon=True)
+    hilo.start()
+    yield falso
+    falso.http.shutdown()
+    falso.http.server_close()
+
+
+def cliente_de_prueba(reloj, **opciones):
+    # Sin ritmo ni jitter salvo que el test los pida, y sin esperas reales
+    opciones.setdefault('cubo', CuboFichas(tasa=1000, capacidad=1000, reloj=reloj, dormir=reloj.dormir))
+    opciones.setdefault('circuito', Circuito(reloj=reloj))
+    opciones.setdefault('azar', lambda: 0.0)
+    return ClienteHTTP(dormir=reloj.dormir, **opciones)
+
+
+def test_429_espera_lo_que_pide_retry_after(servidor):
+    reloj = Reloj()
+    cliente = cliente_de_prueba(reloj, espera_maxima=8)
+    servidor.responder((429, {'Retry-After': '3'}))
+
+    assert cliente.get(servidor.url).status_code == 200
+    assert reloj.dormido == [3.0]
+    estadisticas = cliente.estadisticas()
+    assert estadisticas['peticiones'] == 2
+    assert estadisticas['limitadas'] == 1
+    assert estadisticas['reintentadas'] == 1
+    assert estadisticas['circuito'] == 'cerrado'
+
+
+def test_retry_after_no_pasa_del_tope(servidor):
+    reloj = Reloj()
+    cliente = cliente_de_prueba(reloj, espera_maxima=8)
+    servidor.responder((429, {'Retry-After': '120'}))
+
+    cliente.get(servidor.url)
+    assert reloj.dormido == [8]
+
+
+def test_429_sin_retry_after_espera_exponencial(servidor):
+    reloj = Reloj()
+    cliente = cliente_de_prueba(reloj, reintentos=3, espera_base=0.5, azar=lambda: 1.0)
+    servidor.responder((429, {}), (429, {}), (503, {}))
+
+    assert cliente.get(servidor.url).status_code == 200
+    assert reloj.dormido == [0.5, 1.0, 2.0]
+    assert cliente.limitadas == 2
+    assert servidor.recibidas == 4
+
+
+def test_4xx_no_se_reintenta(servidor):
+    reloj = Reloj()
+    cliente = cliente_de_prueba(reloj)
+    servidor.responder((404, {}))
+
+    with pytest.raises(ErrorHTTP) as error:
+        cliente.get(servidor.url)
+    assert error.value.estado == 404
+    assert servidor.recibidas == 1
+    assert reloj.dormido == []
+
+
+def test_retry_after_como_fecha_http():
+    assert segundos_retry_after('7') == 7.0
+    assert segundos_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.0  # Ya paso
+    assert segundos_retry_after('') is None
+    assert segundos_retry_after('pronto') is None
+
+
+def test_cubo_permite_la_rafaga_y_luego_va_al_ritmo():
+    reloj = Reloj()
+    cubo = CuboFichas(tasa=2, capacidad=3, reloj=reloj, dormir=reloj.dormir)
+
+    assert [cubo.tomar() for _ in range(3)] == [0.0, 0.0, 0.0]
+    for _ in range(7):
+        assert cubo.tomar() == pytest.approx(0.5)
+    assert reloj.ahora == pytest.approx(3.5)  # (10 - 3) peticiones / 2 por segundo
+    assert cubo.esperas == 7
+
+
+def test_cubo_limita_las_peticiones_al_servidor(servidor):
+    reloj = Reloj()
+    cubo = CuboFichas(tasa=4, capacidad=2, reloj=reloj, dormir=reloj.dormir)
+    cliente = cliente_de_prueba(reloj, cubo=cubo)
+
+    for _ in range(10):
+        cliente.get(servidor.url)
+    assert servidor.recibidas == 10
+    assert reloj.ahora == pytest.approx(2.0)  # 8 peticiones fuera de la rafaga a 4 por segundo
+    assert cliente.estadisticas()['esperas_ritmo'] == 8
+
+
+def test_circuito_se_abre_rechaza_y_prueba_en_semiabierto(servidor):
+    reloj = Reloj()
+    circuito = Circuito(fallos_para_abrir=2, pausa=30, reloj=reloj)
+    cliente = cliente_de_prueba(reloj, circuito=circuito, reintentos=0)
+    servidor.responder((500, {}), (500, {}))
+
+    for _ in range(2):
+        with pytest.raises(ErrorHTTP):
+            cliente.get(servidor.url)
+    assert circuito.estado() == 'abierto'
+    assert circuito.aperturas == 1
+
+    # Abierto: no llega nada al servidor
+    with pytest.raises(CircuitoAbierto):
+        cliente.get(servidor.url)
+    assert servidor.recibidas == 2
+    assert cliente.rechazadas == 1
+
+    # Pasada la pausa, una sola peticion de prueba; si sale bien se cierra
+    reloj.ahora += 30
+    assert circuito.estado() == 'semiabierto'
+    assert cliente.get(servidor.url).status_code == 200
+    assert circuito.estado() == 'cerrado'
+    assert servidor.recibidas == 3
+
+
+def test_circuito_vuelve_a_abrirse_si_falla_la_prueba(servidor):
+    reloj = Reloj()
+    circuito = Circuito(fallos_para_abrir=1, pausa=10, reloj=reloj)
+    cliente = cliente_de_prueba(reloj, circuito=circuito, reintentos=0)
+    servidor.responder((503, {}), (503, {}))
+
+    with pytest.raises(ErrorHTTP):
+        cliente.get(servidor.url)
+    reloj.ahora += 10
+    with pytest.raises(ErrorHTTP):
+        cliente.get(servidor.url)
+    assert circuito.estado() == 'abierto'
+    assert circuito.aperturas == 2
+    assert cliente.fallidas == 2
+
+
+def test_semiabierto_deja_pasar_una_sola_prueba():
+    reloj = Reloj()
+    circuito = Circuito(fallos_para_abrir=1, pausa=5, reloj=reloj)
+    circuito.fallo()
+    reloj.ahora += 5
+
+    assert circuito.permitir()
+    assert not circuito.permitir()
+    circuito.liberar()  # La prueba no dijo nada del servicio (p. ej. un 404)
+    assert circuito.permitir()
@@ -0,0 +1,126 @@
+from refresco import FACTOR_REPOSO, PlanificadorRefresco
+
+
+class RaizFalsa:
+    # after/after_cancel de Tk con un reloj propio: avanzar() dispara los temporizadores que vencen
+    def __init__(self):
+        self.ahora = 0.0
+        self.timers = {}  # id -> (instante, funcion)
+        self._siguiente = 0
+
+    def reloj(self):
+        return self.ahora
+
+    def after(self, retraso_ms, funcion):
+        self._siguiente += 1
+        identificador = f"after#{self._siguiente}"
+        self.timers[identificador] = (self.ahora + retraso_ms / 1000, funcion)
+        return identificador
+
+    def after_cancel(self, identificador):
+        del self.timers[identificador]
+
+    def avanzar(self, segundos):
+        final = self.ahora + segundos
+        while self.timers:
+            identificador, (instante, funcion) = min(self.timers.items(), key=lambda t: t[1][0])
+            if instante > final:
+                break
+            del self.timers[identificador]
+            self.ahora = instante
+            funcion()
+        self.ahora = final
+
+
+def planificador_con_vistas(raiz, llamadas):
+    planificador = PlanificadorRefresco(raiz, reloj=raiz.reloj)
+    planificador.registrar('acciones', lambda: llamadas.append('acciones'), 1000)
+    planificador.registrar('resumen', lambda: llamadas.append('resumen'), 5000)
+    return planificador
+
+
+def test_muchas_solicitudes_dejan_un_solo_temporizador():
+    raiz = RaizFalsa()
+    llamadas = []
+    planificador = planificador_con_vistas(raiz, llamadas)
+
+    for _ in range(100):
+        planificador.solicitar()
+        planificador.solicitar('acciones')
+        raiz.ahora += 0.001
+    assert len(raiz.timers) == 1 and planificador.timers_activos() == 1
+    assert planificador.programados == 1
+
+    raiz.avanzar(0)
+    assert sorted(llamadas) == ['acciones', 'resumen']
+    assert planificador.ejecutados == 2
+    assert len(raiz.timers) == 1  # El siguiente refresco, ya programado
+
+
+def test_los_contadores_no_crecen_de_un_intervalo_a_otro():
+    raiz = RaizFalsa()
+    llamadas = []
+    planificador = planificador_con_vistas(raiz, llamadas)
+    planificador.solicitar()
+    raiz.avanzar(0)
+
+    por_tramo = []
+    for _ in range(3):
+        programados, ejecutados = planificador.programados, planificador.ejecutados
+        raiz.avanzar(10)
+        por_tramo.append((planificador.programados - programados, planificador.ejecutados - ejecutados))
+        assert len(raiz.timers) == 1
+    # En 10 s: 10 refrescos de acciones y 2 del resumen, con un temporizador por cada instante distinto
+    assert por_tramo == [(10, 12)] * 3
+    assert llamadas.count('resumen') == 1 + 3 * 2
+
+
+def test_en_reposo_se_alargan_los_intervalos():
+    raiz = RaizFalsa()
+    llamadas = []
+    planificador = planificador_con_vistas(raiz, llamadas)
+    planificador.solicitar()
+    raiz.avanzar(0)
+    llamadas.clear()
+
+    planificador.reposo(True)
+    assert len(raiz.timers) == 1
+    raiz.avanzar(20)
+    assert llamadas.count('acciones') == 20 // FACTOR_REPOSO
+    assert llamadas.count('resumen') == 20 // (5 * FACTOR_REPOSO)
+
+    # Al volver, el temporizador largo se sustituye por uno al intervalo normal
+    planificador.reposo(False)
+    assert len(raiz.timers) == 1
+    llamadas.clear()
+    raiz.avanzar(1)
+    assert llamadas == ['acciones']
+
+
+def test_solicitar_en_reposo_refresca_enseguida():
+    raiz = RaizFalsa()
+    llamadas = []
+    planificador = planificador_con_vistas(raiz, llamadas)
+    planificador.solicitar()
+    raiz.avanzar(0)
+    planificador.reposo(True)
+    llamadas.clear()
+
+    planificador.solicitar('resumen')
+    assert len(raiz.timers) == 1
+    raiz.avanzar(0)
+    assert llamadas == ['resumen']
+
+
+def test_un_error_en_una_vista_no_para_las_demas(capsys):
+    raiz = RaizFalsa()
+    llamadas = []
+    planificador = planificador_con_vistas(raiz, llamadas)
+    planificador.registrar('rota', lambda: 1 / 0, 1000)
+    planificador.solicitar()
+    raiz.avanzar(0)
+
+    assert sorted(llamadas) == ['acciones', 'resumen']
+    assert "Error al refrescar rota" in capsys.readouterr().out
+    planificador.detener()
+    assert not raiz.timers and planificador.timers_activos() == 0
@@ -0,0 +1,64 @@
+from datetime import date
+
+import pytest
+
+from cotizaciones import MonedasInstrumentos
+from historico import HistoricoPrecios
+from rentabilidad import serie_cartera
+from valoracion import Cartera, cartera_desde_registros
+
+
+@pytest.fixture
+def historico(tmp_path):
+    historico = HistoricoPrecios(str(tmp_path / 'historico.db'))
+    yield historico
+    historico.cerrar()
+
+
+def cartera_de_prueba():
+    # 1000 € el 1 de marzo y 10 acciones de SAN.MC
+    return Cartera([1000.0], [False], ['SAN.MC'], [10.0], [100.0], ['2024-03-01'])
+
+
+def test_sin_cierres_no_hay_twr_ni_tir(historico):
+    rango = serie_cartera(cartera_de_prueba(), historico, MonedasInstrumentos(), date(2024, 3, 10)).rango()
+    assert rango['twr'] is None
+    assert rango['xirr'] is None
+    assert rango['valor_final'] == 1000.0
+
+
+def test_con_cierres_la_twr_sigue_al_precio(historico):
+    historico.guardar('SAN.MC', [('2024-03-01', 100, 100, 100, 100.0, 0), ('2024-03-10', 110, 110, 110, 110.0, 0)])
+    rango = serie_cartera(cartera_de_prueba(), historico, MonedasInstrumentos(), date(2024, 3, 10)).rango()
+    assert rango['twr'] == pytest.approx(0.10)
+    assert rango['valor_final'] == pytest.approx(1100.0)
+    assert rango['xirr'] > 0
+
+
+def test_cuenta_lo_que_se_tenia_cada_dia(historico):
+    # 1000 € aportados el dia 1; SAN.MC se tiene hasta el dia 5 y BBVA.MC desde el dia 5 (al cierre)
+    historico.guardar('SAN.MC', [('2024-03-01', 0, 0, 0, 10.0, 0), ('2024-03-05', 0, 0, 0, 12.0, 0),
+                                 ('2024-03-10', 0, 0, 0, 6.0, 0)])
+    historico.guardar('BBVA.MC', [('2024-03-01', 0, 0, 0, 10.0, 0), ('2024-03-05', 0, 0, 0, 5.0, 0),
+                                  ('2024-03-10', 0, 0, 0, 6.0, 0)])
+    movimientos = [
+        {'simbolo': 'SAN.MC', 'd': '01', 'm': '03', 'a': '2024', 'tipo': 'compra', 'cantidad': 100.0, 'precio': 10.0},
+        {'simbolo': 'SAN.MC', 'd': '05', 'm': '03', 'a': '2024', 'tipo': 'venta', 'cantidad': 100.0, 'precio': 12.0},
+        {'simbolo': 'BBVA.MC', 'd': '05', 'm': '03', 'a': '2024', 'tipo': 'compra', 'cantidad': 240.0, 'precio': 5.0},
+    ]
+    cartera = cartera_desde_registros([{'d': '01', 'm': '03', 'a': '2024', 'cantidad': 1000.0, 'trans': 's'}],
+                                      [{'simbolo': 'BBVA.MC', 'cantidad': 240.0, 'precio_compra': 5.0}], movimientos)
+    serie = serie_cartera(cartera, historico, MonedasInstrumentos(), date(2024, 3, 10))
+
+    # +20% con SAN.MC hasta el dia 5 y despues +20% con BBVA.MC; la caida de SAN.MC ya vendida no cuenta
+    assert serie.twr(0, serie.indice('2024-03-05')) == pytest.approx(0.20)
+    assert serie.rango()['twr'] == pytest.approx(1.2 * 1.2 - 1)
+    assert serie.rango()['valor_final'] == pytest.approx(1440.0)
+
+
+def test_sin_movimientos_supone_las_cantidades_de_hoy(historico):
+    historico.guardar('SAN.MC', [('2024-03-01', 0, 0, 0, 10.0, 0), ('2024-03-10', 0, 0, 0, 6.0, 0)])
+    cartera = cartera_desde_registros([{'d': '01', 'm': '03', 'a': '2024', 'cantidad': 1000.0, 'trans': 's'}],
+                                      [{'simbolo': 'SAN.MC', 'cantidad': 100.0, 'precio_compra': 10.0}])
+    assert serie_cartera(cartera, historico, MonedasInstrumentos(), date(2024, 3, 10)).rango()['twr'] == \
+        pytest.approx(-0.4)
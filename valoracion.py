@@ -0,0 +1,160 @@
+'''
+Motor de valoracion de la cartera.
+
+Convierte registros y acciones en arrays de NumPy una sola vez (cada vez que cambian los datos)
+y calcula totales, beneficio por accion y porcentajes con operaciones vectorizadas. No sabe nada
+de Tk: la interfaz solo pinta el resultado.
+'''
+
+import threading
+
+import numpy as np
+
+from almacen import RECARGO_SIN_TRANSACCION
+from lotes import VENTA
+
+
+class Cartera:
+    # Foto inmutable de los datos en forma de arrays; se puede valorar desde cualquier hilo
+    def __init__(self, cantidades_registros, sin_transaccion, simbolos, cantidades, precios_compra, fechas=None,
+                 tenencias=None):
+        self.cantidades_registros = np.asarray(cantidades_registros, dtype=np.float64)
+        self.sin_transaccion = np.asarray(sin_transaccion, dtype=bool)
+        # Fecha de cada aportacion como datetime64[D], en el mismo orden que las cantidades
+        self.fechas = np.asarray(fechas if fechas is not None else [], dtype='datetime64[D]')
+        self.simbolos = list(simbolos)
+        self.cantidades = np.asarray(cantidades, dtype=np.float64)
+        self.precios_compra = np.asarray(precios_compra, dtype=np.float64)
+        # Compras y ventas fechadas del libro de lotes (ver tenencias_desde_movimientos) para saber que se
+        # tenia cada dia; None si no se dieron
+        self.tenencias = tenencias
+        # No depende de los precios: se calcula una vez por foto
+        recargo = np.where(self.sin_transaccion, RECARGO_SIN_TRANSACCION, 1.0)
+        self.aportaciones = self.cantidades_registros * recargo
+        self.total_invertido = round(float(self.aportaciones.sum()), 2)
+
+
+def fechas_registros(registros):
+    # Año, mes y dia se guardan como texto; se combinan sin crear un objeto date por registro
+    n = len(registros)
+    anios = np.fromiter((int(r['a']) for r in registros), dtype=np.int64, count=n)
+    meses = np.fromiter((int(r['m']) for r in registros), dtype=np.int64, count=n)
+    dias = np.fromiter((int(r['d']) for r in registros), dtype=np.int64, count=n)
+    primeros = ((anios - 1970) * 12 + meses - 1).astype('datetime64[M]').astype('datetime64[D]')
+    return primeros + (dias - 1)
+
+
+def tenencias_desde_movimientos(movimientos):
+    # (simbolos, fecha de cada movimiento, posicion de su simbolo, acciones que suma: negativas en las ventas)
+    simbolos = list(dict.fromkeys(m['simbolo'] for m in movimientos))
+    posicion = {simbolo: i for i, simbolo in enumerate(simbolos)}
+    n = len(movimientos)
+    return (
+        simbolos,
+        fechas_registros(movimientos),
+        np.fromiter((posicion[m['simbolo']] for m in movimientos), dtype=np.intp, count=n),
+        np.fromiter((-m['cantidad'] if m['tipo'] == VENTA else m['cantidad'] for m in movimientos), dtype=np.float64,
+                    count=n),
+    )
+
+
+def cartera_desde_registros(registros, acciones, movimientos=None):
+    n = len(registros)
+    return Cartera(
+        np.fromiter((r['cantidad'] for r in registros), dtype=np.float64, count=n),
+        np.fromiter((r['trans'] != 's' for r in registros), dtype=bool, count=n),
+        [a['simbolo'] for a in acciones],
+        [a['cantidad'] for a in acciones],
+        [a['precio_compra'] for a in acciones],
+        fechas_registros(registros),
+        tenencias_desde_movimientos(movimientos) if movimientos is not None else None,
+    )
+
+
+class MotorValoracion:
+    # Reutiliza la foto mientras el repositorio devuelva las mismas listas (el repositorio crea
+    # listas nuevas en cada cambio, nunca modifica las que ya ha entregado). Los movimientos no cuentan:
+    # cualquier cambio en el libro de lotes da tambien una lista de acciones nueva.
+    def __init__(self):
+        self._origen = (None, None)
+        self._cartera = None
+        self._lock = threading.Lock()
+        self.conversiones = 0
+
+    def preparar(self, registros, acciones, movimientos=None):
+        with self._lock:
+            if self._origen[0] is not registros or self._origen[1] is not acciones:
+                self._cartera = cartera_desde_registros(registros, acciones, movimientos)
+                self._origen = (registros, acciones)
+                self.conversiones += 1
+            return self._cartera
+
+
+def valorar(cartera, precios, efectivo):
+    # precios: {simbolo: precio en €}. Las acciones sin precio quedan fuera de los totales.
+    actuales = np.fromiter((precios.get(s, np.nan) for s in cartera.simbolos), dtype=np.float64,
+                           count=len(cartera.simbolos))
+    con_precio = ~np.isnan(actuales)
+
+    valor_compra = cartera.cantidades * cartera.precios_compra
+    valor_actual = cartera.cantidades * actuales
+    beneficio = valor_actual - valor_compra
+    with np.errstate(divide='ignore', invalid='ignore'):
+        porcentaje = np.where(valor_compra != 0, beneficio / valor_compra * 100, 0.0)
+
+    valor_acciones = float(valor_actual[con_precio].sum())
+    total_invertido = cartera.total_invertido
+    balance = valor_acciones - total_invertido + efectivo
+    return {
+        'total_invertido': total_invertido,
+        'valor_acciones': valor_acciones,
+        'beneficio': float(beneficio[con_precio].sum()),
+        'patrimonio': valor_acciones + efectivo,
+        'balance': balance,
+        'porcentaje': balance / total_invertido * 100 if total_invertido != 0 else 0,
+        'efectivo': efectivo,
+        # Detalle por accion, en el mismo orden que cartera.simbolos
+        'simbolos': cartera.simbolos,
+        'cantidades': cartera.cantidades,
+        'con_precio': con_precio,
+        'valor_compra': valor_compra,
+        'valor_actual': valor_actual,
+        'beneficio_accion': beneficio,
+        'porcentaje_accion': porcentaje,
+    }
+
+
+def revalorar(resultado, precios):
+    # Cambia en un resultado de valorar() el precio de las acciones que han recibido ticks en directo
+    # sin recalcular el resto: solo se tocan sus posiciones en los arrays y los totales se corrigen con
+    # la diferencia. Devuelve cuantas posiciones han cambiado.
+    if 'indices' not in resultado:
+        indices = {}
+        for i, simbolo in enumerate(resultado['simbolos']):
+            indices.setdefault(simbolo, []).append(i)
+        resultado['indices'] = indices
+    posiciones, nuevos = [], []
+    for simbolo, precio in precios.items():
+        for i in resultado['indices'].get(simbolo, ()):
+            posiciones.append(i)
+            nuevos.append(precio)
+    if not posiciones:
+        return 0
+    posiciones = np.array(posiciones, dtype=np.intp)
+    valor = resultado['cantidades'][posiciones] * np.array(nuevos, dtype=np.float64)
+    compra = resultado['valor_compra'][posiciones]
+    beneficio = valor - compra
+    tenia = resultado['con_precio'][posiciones]
+    resultado['valor_acciones'] += float((valor - np.where(tenia, resultado['valor_actual'][posiciones], 0.0)).sum())
+    resultado['beneficio'] += float((beneficio - np.where(tenia, resultado['beneficio_accion'][posiciones], 0.0)).sum())
+    resultado['con_precio'][posiciones] = True
+    resultado['valor_actual'][posiciones] = valor
+    resultado['beneficio_accion'][posiciones] = beneficio
+    with np.errstate(divide='ignore', invalid='ignore'):
+        resultado['porcentaje_accion'][posiciones] = np.where(compra != 0, beneficio / compra * 100, 0.0)
+
+    total_invertido = resultado['total_invertido']
+    resultado['patrimonio'] = resultado['valor_acciones'] + resultado['efectivo']
+    resultado['balance'] = resultado['valor_acciones'] - total_invertido + resultado['efectivo']
+    resultado['porcentaje'] = resultado['balance'] / total_invertido * 100 if total_invertido != 0 else 0
+    return len(posiciones)
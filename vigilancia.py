@@ -0,0 +1,115 @@
+'''
+Lista de vigilancia: simbolos que se siguen sin tenerlos en cartera.
+
+Empieza con lista_acciones de configuracion.py y se guarda en disco cuando se añade o quita
+alguno. Los precios de toda la lista se piden por lotes en paralelo, asi que un escaneo de mil
+simbolos tarda lo que el lote mas lento y no la suma de todos. Los indicadores se calculan en
+indicadores.py (numpy), que se importa desde el hilo de precios.
+'''
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from almacen import escribir_atomico
+
+HILOS_VIGILANCIA = 8
+LOTE_VIGILANCIA = 100  # Simbolos por peticion de precios
+SESIONES_ANIO = 252  # Sesiones de bolsa en 52 semanas
+SMA = 50
+EMA = 20
+RSI = 14
+# (clave, titulo, decimales) de cada columna; la clave es la que se usa para ordenar y filtrar
+COLUMNAS = [
+    ('simbolo', 'Símbolo', None),
+    ('precio', 'Precio', 2),
+    ('cambio', 'Cambio %', 2),
+    ('sma', f'SMA {SMA}', 2),
+    ('ema', f'EMA {EMA}', 2),
+    ('rsi', f'RSI {RSI}', 1),
+    ('minimo', 'Mín. 52 sem.', 2),
+    ('maximo', 'Máx. 52 sem.', 2),
+    ('desde_maximo', 'Desde máx. %', 2),
+]
+
+
+def normalizar_simbolo(simbolo):
+    return simbolo.strip().upper()
+
+
+class ListaVigilancia:
+    def __init__(self, ruta=None, por_defecto=()):
+        self.ruta = ruta
+        self._simbolos = list(dict.fromkeys(por_defecto))
+        self._lock = threading.Lock()
+        if ruta and os.path.exists(ruta):
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    self._simbolos = list(dict.fromkeys(json.load(f)))
+            except (OSError, ValueError) as e:
+                print(f"Error al leer la lista de vigilancia: {str(e)}")
+
+    def simbolos(self):
+        with self._lock:
+            return list(self._simbolos)
+
+    def agregar(self, simbolos):
+        # Devuelve los que no estaban
+        with self._lock:
+            nuevos = [s for s in dict.fromkeys(map(normalizar_simbolo, simbolos)) if s and s not in self._simbolos]
+            if nuevos:
+                self._simbolos.extend(nuevos)
+                self.guardar()
+        return nuevos
+
+    def quitar(self, simbolos):
+        quitar = set(simbolos)
+        with self._lock:
+            self._simbolos = [s for s in self._simbolos if s not in quitar]
+            self.guardar()
+
+    def guardar(self):
+        if not self.ruta:
+            return
+        try:
+            datos = json.dumps(self._simbolos, indent=1)
+            escribir_atomico(self.ruta, lambda f: f.write(datos))
+        except OSError as e:
+            print(f"Error al guardar la lista de vigilancia: {str(e)}")
+
+
+def formatear_fila(indicadores, i):
+    # Valores de la fila i para la tabla; lo que no se puede calcular (sin historico suficiente) sale como —
+    valores = []
+    for clave, _, decimales in COLUMNAS:
+        if decimales is None:
+            valores.append(indicadores['simbolos'][i])
+            continue
+        valor = indicadores[clave][i]
+        if valor != valor:
+            valores.append("—")
+        else:
+            valores.append(f"{valor:.{decimales}f}")
+    return tuple(valores)
+
+
+def precios_por_lotes(cotizaciones, simbolos, hilos=HILOS_VIGILANCIA, lote=LOTE_VIGILANCIA):
+    # {simbolo: precio en su moneda}. Un lote que falla no impide el resto: sus simbolos quedan sin precio.
+    simbolos = list(dict.fromkeys(simbolos))
+    lotes = [simbolos[i:i + lote] for i in range(0, len(simbolos), lote)]
+
+    def pedir(grupo):
+        try:
+            return cotizaciones.obtener_varios(grupo)
+        except Exception as e:
+            print(f"Error al obtener precios de vigilancia ({grupo[0]}...): {str(e)}")
+            return {}
+
+    precios = {}
+    if not lotes:
+        return precios
+    with ThreadPoolExecutor(max_workers=min(hilos, len(lotes)), thread_name_prefix='vigilancia') as pool:
+        for parcial in pool.map(pedir, lotes):
+            precios.update(parcial)
+    return precios